@@ -0,0 +1,157 @@
+"""Admission control in front of the engine, so that one user flooding it with commands can't keep
+everyone else waiting.
+
+Every command has to get a token from its user's bucket for its class of verb: moving (which can
+generate rooms), fighting (which can be a long combat with several monsters) or anything else,
+each refilling at its own rate. A command without a token waits its turn in the user's queue.
+The queue is bounded, and what happens to a command that arrives when it's full depends on the
+policy:
+
+    drop        the command is rejected
+    coalesce    a repeat of a command that's already waiting is merged with it, the one reply
+                answers both, anything else is rejected. Moving and fighting twice isn't the same
+                as once, so those are never merged
+
+On top of that no more than max_concurrent commands are handed to the engine at once, whoever they
+are from, so a burst from many users queues here rather than piling up behind the engine's lock.
+
+Admission.counts keeps how many commands were admitted straight away, queued first, coalesced and
+rejected. What's kept for a user is dropped once they have nothing waiting and their buckets have
+filled up again, so it only grows with the users who are playing."""
+
+import asyncio
+import time
+
+VERB_CLASSES = {"on_go": "move", "on_travel": "move", "on_attack": "fight", "on_loot": "fight"}
+DEFAULT_LIMITS = {"move": (5, 5.0), "fight": (3, 5.0), "other": (10, 5.0)}  # class: commands per seconds
+POLICIES = ("drop", "coalesce")
+
+ADMITTED, QUEUED, COALESCED, REJECTED = "admitted", "queued", "coalesced", "rejected"
+
+
+class TokenBucket:
+
+    """Allows capacity events at once, refilling at capacity per period seconds"""
+
+    def __init__(self, capacity, period, clock=time.monotonic):
+
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.updated = clock()
+
+    def refill(self):
+
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+
+        """Seconds until a token is available, 0 if there's one now"""
+
+        self.refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def full_time(self):
+
+        """Seconds until the bucket is full again, 0 if it is now"""
+
+        self.refill()
+        return (self.capacity - self.tokens) / self.rate
+
+    def take(self):
+
+        """Take a token if there is one, returns whether it succeeded"""
+
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class Admission:
+
+    """Decides when each command may run. Used from the event loop, see GameAdapter.on_message."""
+
+    def __init__(self, command_dict, limits=None, max_queued=5, policy="drop", max_concurrent=4):
+
+        if policy not in POLICIES:
+            raise ValueError("Unknown admission policy: {}".format(policy))
+        self.command_dict = command_dict  # the engine's, to find the verb of a command
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.max_queued = max_queued
+        self.policy = policy
+        self.slots = asyncio.Semaphore(max_concurrent)
+        self.buckets = {}  # discord id: {verb class: TokenBucket}
+        self.waiting = {}  # discord id: [commands in their queue]
+        self.turns = {}  # discord id: asyncio.Lock, so each user's commands run in the order they came
+        self.counts = {ADMITTED: 0, QUEUED: 0, COALESCED: 0, REJECTED: 0}
+
+    def verb_class(self, command):
+
+        verb = self.command_dict.get(command.split(" ", maxsplit=1)[0])
+        return VERB_CLASSES.get(verb, "other")
+
+    def bucket(self, discord_id, command):
+
+        verb_class = self.verb_class(command)
+        buckets = self.buckets.setdefault(discord_id, {})
+        bucket = buckets.get(verb_class)
+        if bucket is None:
+            bucket = buckets[verb_class] = TokenBucket(*self.limits[verb_class])
+        return bucket
+
+    def forget(self, discord_id):
+
+        """Drop what's kept for discord_id if they have nothing waiting or running and their buckets
+        are full, otherwise check again when they will be. A full bucket is the same as a new one."""
+
+        turn = self.turns.get(discord_id)
+        if turn is None or self.waiting[discord_id] or turn.locked():
+            return  # already dropped, or a command of theirs will call this when it's done
+        full_in = max(bucket.full_time() for bucket in self.buckets[discord_id].values())
+        if full_in > 0:
+            asyncio.get_running_loop().call_later(full_in, self.forget, discord_id)
+            return
+        del self.buckets[discord_id]
+        del self.waiting[discord_id]
+        del self.turns[discord_id]
+
+    async def run(self, discord_id, command, func):
+
+        """Run func(), which sends command to the engine, once it's allowed to. Returns (what
+        happened, func's result), the result is None if the command was coalesced or rejected."""
+
+        waiting = self.waiting.setdefault(discord_id, [])
+        if len(waiting) >= self.max_queued:
+            if self.policy == "coalesce" and command in waiting and self.verb_class(command) == "other":
+                self.counts[COALESCED] += 1
+                return COALESCED, None
+            self.counts[REJECTED] += 1
+            return REJECTED, None
+
+        bucket = self.bucket(discord_id, command)
+        turn = self.turns.get(discord_id)
+        if turn is None:
+            turn = self.turns[discord_id] = asyncio.Lock()
+        status = ADMITTED if not waiting and not turn.locked() and bucket.wait_time() == 0 else QUEUED
+        self.counts[status] += 1
+        waiting.append(command)
+        running = False
+        try:
+            async with turn:
+                while not bucket.take():
+                    await asyncio.sleep(bucket.wait_time())
+                waiting.remove(command)  # it's running now, too late to merge anything with it
+                running = True
+                async with self.slots:
+                    return status, await func()
+        finally:
+            if not running:
+                waiting.remove(command)  # cancelled while waiting
+            self.forget(discord_id)
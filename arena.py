@@ -0,0 +1,232 @@
+"""Monster tournament: generate a roster of monsters and have every pair fight each other lots of
+times, to find out which monster types and ability loadouts are strongest.
+
+Fights use the real CombatEngine with the log switched off. Every pair of monsters gets its own
+random stream seeded from the tournament seed and the pair, so results are the same whatever
+order the fights run in and however many processes share them out.
+
+The bouts are spread over a process pool. Each worker builds the roster itself from the seed
+when it starts, so the only things sent between processes are ranges of pair numbers going out
+and a few win counts per pair coming back.
+
+    python arena.py --monsters 50 --bouts 200
+    python arena.py --monsters 200 --bouts 1000 --workers 8"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import sys
+import time
+
+import headless  # imports the engine modules in the right order, they can't be imported on their own
+import rng
+
+with headless.quiet():
+    import combat_engine
+    import generators
+
+roster = None  # the monsters, built once in each worker process
+
+
+class ArenaCombat(combat_engine.CombatEngine):
+
+    """A combat with no log, in which the loser doesn't die (it's needed for the next bout)"""
+
+    def log(self, template, *args, newline=True):
+
+        pass
+
+    def end_combat_logic(self, winner, loser):
+
+        self.mon1.unbuff()
+        self.mon2.unbuff()
+
+
+def make_roster(count, seed):
+
+    with rng.using(rng.new_stream(seed)):
+        return [generators.random_monster() for x in range(count)]
+
+
+def init_worker(count, seed):
+
+    global roster
+    roster = make_roster(count, seed)
+
+
+def pair_at(index, count):
+
+    """The index'th (i, j) pair with i < j, in the order (0, 1), (0, 2) ... (1, 2) ..."""
+
+    # count - 1 pairs start with 0, count - 2 with 1 and so on
+    i = 0
+    while index >= count - 1 - i:
+        index -= count - 1 - i
+        i += 1
+    return i, i + 1 + index
+
+
+def pair_seed(seed, i, j):
+
+    return (seed * 1000003 + i) * 1000003 + j  # the same in every process and Python, unlike hash()
+
+
+def bout(mon1, mon2, health1, health2):
+
+    """Fight once, returns 1 if mon1 won, -1 if mon2 won and 0 if they both survived"""
+
+    mon1.health = health1
+    mon2.health = health2
+    ArenaCombat(mon1, mon2).run_combat()
+    if mon2.health <= 0:
+        return 1
+    if mon1.health <= 0:
+        return -1
+    return 0
+
+
+def run_chunk(task):
+
+    """Runs all the bouts for a range of pairs and returns (i, j, wins for i, wins for j, draws) for each"""
+
+    start, stop, bouts, seed = task
+    count = len(roster)
+    i, j = pair_at(start, count)
+    out = []
+    for x in range(start, stop):
+        mon1, mon2 = roster[i], roster[j]
+        health1, health2 = mon1.health, mon2.health
+        results = [0, 0, 0]
+        with rng.using(rng.new_stream(pair_seed(seed, i, j))):
+            for y in range(bouts):
+                results[bout(mon1, mon2, health1, health2)] += 1  # index -1 is mon2's wins
+        mon1.health, mon2.health = health1, health2
+        out.append((i, j, results[1], results[-1], results[0]))
+
+        j += 1
+        if j == count:
+            i += 1
+            j = i + 1
+    return out
+
+
+def chunks(pairs, size, bouts, seed):
+
+    for start in range(0, pairs, size):
+        yield start, min(start + size, pairs), bouts, seed
+
+
+def ratings(count, results, iterations=200):
+
+    """Elo-scale ratings fitted to all the results at once (a Bradley-Terry model, draws counted as
+    half a win each), so unlike running Elo updates one bout at a time they don't depend on the
+    order the bouts were played in. The average rating is 1500."""
+
+    wins = [0.5] * count  # half a win each to start with so that a monster that never wins still gets a rating
+    games = {}
+    for i, j, wi, wj, draws in results:
+        wins[i] += wi + draws / 2
+        wins[j] += wj + draws / 2
+        games[i, j] = wi + wj + draws
+
+    strength = [1.0] * count
+    for x in range(iterations):
+        totals = [1.0 / (s + 1.0) for s in strength]  # the extra half win was against a 1500 monster
+        for (i, j), n in games.items():
+            if n:
+                share = n / (strength[i] + strength[j])
+                totals[i] += share
+                totals[j] += share
+        strength = [w / t for w, t in zip(wins, totals)]
+
+    logs = [math.log10(s) for s in strength]
+    mean = sum(logs) / count
+    return [1500 + 400 * (x - mean) for x in logs]
+
+
+def tournament(monsters=20, bouts=100, seed=0, workers=None, chunk=None):
+
+    """Play every pair of monsters against each other bouts times. Returns the roster and a list of
+    table rows sorted strongest first, see table()"""
+
+    pairs = monsters * (monsters - 1) // 2
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunk is None:
+        chunk = max(1, pairs // (workers * 16))  # enough chunks to keep every worker busy to the end
+
+    tasks = chunks(pairs, chunk, bouts, seed)
+    if workers == 1:
+        init_worker(monsters, seed)
+        results = [r for task in tasks for r in run_chunk(task)]
+    else:
+        with multiprocessing.Pool(workers, init_worker, (monsters, seed)) as pool:
+            results = [r for out in pool.imap_unordered(run_chunk, tasks) for r in out]
+    results.sort()
+
+    return make_roster(monsters, seed), table(monsters, results)
+
+
+def table(count, results):
+
+    """Rows of (monster index, rating, wins, losses, draws, win rate)"""
+
+    rating = ratings(count, results)
+    wins = [0] * count
+    losses = [0] * count
+    draws = [0] * count
+    for i, j, wi, wj, d in results:
+        wins[i] += wi
+        losses[i] += wj
+        wins[j] += wj
+        losses[j] += wi
+        draws[i] += d
+        draws[j] += d
+
+    rows = []
+    for x in range(count):
+        played = wins[x] + losses[x] + draws[x]
+        rows.append((x, rating[x], wins[x], losses[x], draws[x], wins[x] / played if played else 0.0))
+    rows.sort(key=lambda row: -row[1])
+    return rows
+
+
+def loadout(monster):
+
+    """e.g. "2 speed, 3 strength", which stats the monster's abilities use"""
+
+    stats = {}
+    for ability in monster.abilities:
+        stats[ability.stat] = stats.get(ability.stat, 0) + 1
+    return ", ".join("{} {}".format(n, stat) for stat, n in sorted(stats.items()))
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Rank monsters by fighting them against each other")
+    parser.add_argument("--monsters", type=int, default=20)
+    parser.add_argument("--bouts", type=int, default=100, help="bouts per pair of monsters")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="processes to use, defaults to one per core")
+    parser.add_argument("--chunk", type=int, default=None, help="pairs of monsters per task sent to a worker")
+    parser.add_argument("--top", type=int, default=None, help="only list the strongest monsters")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    monsters, rows = tournament(args.monsters, args.bouts, args.seed, args.workers, args.chunk)
+    elapsed = time.perf_counter() - start
+    total = args.monsters * (args.monsters - 1) // 2 * args.bouts
+
+    print("{:>4}  {:<24}{:>7}{:>8}{:>8}{:>8}{:>7}  {}".format("rank", "monster", "rating", "won", "lost",
+                                                             "drawn", "win%", "abilities"))
+    for rank, (x, rating, won, lost, drawn, rate) in enumerate(rows[:args.top], 1):
+        mon = monsters[x]
+        print("{:>4}  {:<24}{:>7.0f}{:>8}{:>8}{:>8}{:>7.1%}  {}".format(
+            rank, "{} #{}".format(mon.name, x)[:23], rating, won, lost, drawn, rate, loadout(mon)))
+    print("{:,} bouts in {:.2f}s ({:,.0f} bouts/s)".format(total, elapsed, total / elapsed if elapsed else 0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""Benchmarks for the hot paths of the game. Every benchmark is seeded so that repeated runs do
+exactly the same work, and the results can be saved as a JSON baseline and compared against later.
+
+Usage:
+    python benchmark.py                          run everything and print the timings
+    python benchmark.py --save baseline.json     ...and store them as a baseline
+    python benchmark.py --compare baseline.json  ...and report changes against a stored baseline
+    python benchmark.py -k combat                only run benchmarks with "combat" in the name
+
+Comparing exits with status 1 if anything got slower by more than --threshold, so it can be used
+as a check before deploying."""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import headless
+import rng
+
+with headless.quiet():
+    import generators
+    import descriptive_strings
+    import combat_engine
+    import game_items
+    import inventory
+
+SEED = 1234
+BENCHMARKS = {}  # name: function, filled in by the @benchmark decorator
+
+
+def benchmark(ops):
+
+    """Register a benchmark. The decorated function is called with a seeded game already set up
+    and must perform ops operations, the reported times are per operation."""
+
+    def decorator(func):
+        BENCHMARKS[func.__name__] = (func, ops)
+        return func
+    return decorator
+
+
+def seeded_game(seed=SEED):
+
+    rng.current = rng.new_stream(seed)  # for the benchmarks that generate things outside of a command
+    engine = headless.new_engine()
+    char, _ = headless.new_character(engine, 1, "bench", seed=seed)
+    return engine, char
+
+
+def run_commands(engine, char, commands):
+
+    for command in commands:
+        engine.process_command(command, char.discord_id)
+        if char.dead:  # don't benchmark a corpse, bring them back
+            char.dead = False
+            char.health = 100
+            char.location.add_occupant(char)  # dying stopped them hearing about the room
+            char.location.world.players[char] = None
+            char.update_visible_things()
+            char.update_monsters_in_play(char.location.monsters)
+
+
+@benchmark(ops=200)
+def command_look(engine, char):
+
+    run_commands(engine, char, ["look"] * 200)
+
+
+@benchmark(ops=200)
+def command_take(engine, char):
+
+    for x in range(200):
+        char.location.add_item(game_items.Bandages())
+        engine.process_command("take bandages", char.discord_id)
+
+
+@benchmark(ops=200)
+def command_go(engine, char):
+
+    for x in range(200):
+        direction = rng.current.choice(list(char.location.neighbours.keys()))
+        run_commands(engine, char, ["go {}".format(direction)])
+
+
+@benchmark(ops=100)
+def command_attack(engine, char):
+
+    for x in range(100):
+        char.location.add_monster(generators.random_monster())
+        run_commands(engine, char, ["attack"])
+
+
+@benchmark(ops=200)
+def random_room(engine, char):
+
+    room = char.location
+    for x in range(200):
+        generators.random_room(room, "north")
+
+
+@benchmark(ops=500)
+def run_combat(engine, char):
+
+    arena = generators.random_room(None, "north")  # the loser needs a room to leave its corpse in
+    for x in range(500):
+        mon1 = generators.random_monster()
+        mon2 = generators.random_monster()
+        arena.add_monster(mon1)
+        arena.add_monster(mon2)
+        combat_engine.CombatEngine(mon1, mon2, log_ref=engine).run_combat()
+        char.clear_log()
+
+
+@benchmark(ops=2000)
+def do_sub_recursive(engine, char):
+
+    for x in range(2000):
+        descriptive_strings.do_sub_recursive("a [ITEM_DESCRIPTORS] door, decorated with [ITEM_MATERIALS].")
+
+
+@benchmark(ops=1000)
+def generate_description(engine, char):
+
+    for x in range(1000):
+        descriptive_strings.generate_description("monster_descriptions", "it", "its")
+
+
+@benchmark(ops=20)
+def print_inventory(engine, char):
+
+    char.inventory = inventory.Inventory()
+    for x in range(5000):
+        char.inventory.add(rng.current.choice((game_items.Bandages, game_items.HealthPotion, game_items.Hat))())
+    for x in range(20):
+        char.print_inventory()
+
+
+@benchmark(ops=1)
+def import_time(engine, char):
+
+    # a fresh interpreter, otherwise the modules are already imported
+    subprocess.run([sys.executable, "-c", "import player"], check=True, cwd=os.path.dirname(__file__) or ".",
+                   stdout=subprocess.DEVNULL)
+
+
+def time_benchmark(func, ops, repeat):
+
+    """Returns per-operation timings in microseconds for each repeat, each repeat starts from
+    the same seeded game so does the same work"""
+
+    timings = []
+    for x in range(repeat):
+        with headless.quiet():
+            engine, char = seeded_game()
+            start = time.perf_counter()
+            func(engine, char)
+            elapsed = time.perf_counter() - start
+        timings.append(elapsed * 1e6 / ops)
+    return timings
+
+
+def run_all(repeat=5, keyword=None):
+
+    results = {}
+    for name, (func, ops) in BENCHMARKS.items():
+        if keyword and keyword not in name:
+            continue
+        timings = time_benchmark(func, ops, repeat)
+        results[name] = {"ops": ops,
+                         "best_us": min(timings),
+                         "median_us": statistics.median(timings)}
+        print("{:<24}{:>12.1f} us/op (best {:.1f})".format(name, results[name]["median_us"],
+                                                          results[name]["best_us"]))
+    return results
+
+
+def save_baseline(path, results):
+
+    out = {"python": platform.python_version(),
+           "platform": platform.platform(),
+           "seed": SEED,
+           "rng_backend": rng.backend,
+           "results": results}
+    with open(path, "w") as f:
+        json.dump(out, f, indent=2, sort_keys=True)
+    print("Saved baseline to {}".format(path))
+
+
+def compare(path, results, threshold):
+
+    """Prints a report of each benchmark against the baseline and returns the names of the
+    ones that got slower by more than threshold (a ratio, e.g. 1.2 for 20% slower)"""
+
+    with open(path, "r") as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    print("\n{:<24}{:>12}{:>12}{:>9}".format("benchmark", "baseline", "current", "ratio"))
+    for name, result in results.items():
+        if name not in baseline:
+            print("{:<24}{:>12}{:>12.1f}".format(name, "-", result["median_us"]))
+            continue
+        old = baseline[name]["median_us"]
+        ratio = result["median_us"] / old
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / threshold:
+            flag = "  faster"
+        print("{:<24}{:>12.1f}{:>12.1f}{:>8.2f}x{}".format(name, old, result["median_us"], ratio, flag))
+
+    return regressions
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Run the game benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark, the median is reported")
+    parser.add_argument("-k", dest="keyword", help="only run benchmarks whose name contains this")
+    parser.add_argument("--save", metavar="PATH", help="save the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare the results to a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="slowdown ratio that counts as a regression (default 1.2)")
+    parser.add_argument("--rng", choices=sorted(rng.BACKENDS), default=rng.backend,
+                        help="random number backend to benchmark with")
+    args = parser.parse_args(argv)
+
+    rng.set_backend(args.rng)
+
+    results = run_all(args.repeat, args.keyword)
+
+    if args.save:
+        save_baseline(args.save, results)
+
+    if args.compare:
+        regressions = compare(args.compare, results, args.threshold)
+        if regressions:
+            print("\n{} regression(s): {}".format(len(regressions), ", ".join(regressions)))
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,14 @@
-import random
+import rng
 import generators
+import journal
+import inventory
+import metrics
+import stats
+import things
+from collections import Counter
 
 from descriptive_strings import a_vowel_finder
+from mixins import StatsMixin
 
 
 class EngineReference:
@@ -10,55 +17,43 @@ class EngineReference:
     # inherit from this class to provide an object with a reference to the game engine
 
 
-class Character(EngineReference):
+class Character(StatsMixin, EngineReference):
 
     """A playable character with all their stats and abilities"""
 
-    def __init__(self):
+    carry_weight = 100  # see Item.weight
+
+    def __init__(self, seed=None):
 
         self.discord_id = None  # discord numerical id
         self.name = None  # printable discord screen name for combat logs etc
         self.dead = False
-        self.health = "uninjured"  # levels, not numeric
-        self.items = []
-        self.equipped = []
-        self.equipped_slots = {"head": None,
-                               "body": None,
-                               "right hand": None,
-                               "left hand": None}
+        self.inventory = inventory.Inventory(max_weight=self.carry_weight)  # items held and equipped
         self.location = None
-        self.weapon = None
         self.log_text = ""  # a buffer of text that is printed every action. Other objects
         # can add messages to this log, then it all gets printed at once.
-        self.visible_things = []  # objects the player can interact with
-        self.monsters_in_play = []  # monsters that might attack the player
+        self.listener = None  # optionally, a function that is also sent each message as it's logged
+        self.pending_messages = []  # news of other players nearby, waiting for this character's next turn
+        self.visible_things = {}  # objects the player can interact with
+        self.monsters_in_play = {}  # monsters that might attack the player
+        # both are dicts used as insertion-ordered sets (values are always None), kept up
+        # to date by the room the character is in via the room_x_added/removed callbacks
         self.keys_in_play = {}
         self.visible_exits = []
-        self.strength = 10
-        self.armour = 0
-        self.speed = 10
-        self.health = 100
-        self.moxie = 10
-        self.buffs = {x: 0 for x in ("strength", "armour", "speed", "health", "moxie")}
+        self.stats = stats.StatBlock(strength=10, armour=0, speed=10, health=100, moxie=10)
         self.abilities = []  # tuples of name, hit chance, stat used, power
-
-    def unbuff(self):
-
-        for k, v in self.buffs.items():
-            old = self.__getattribute__(k)
-            new = old - v
-            self.__setattr__(k, new)
+        self.rng = rng.new_stream(seed)  # everything generated for this character's game draws from this
 
     def random_abilities(self):
 
         # todo: this is only a testing function
 
-        ab1 = [generators.random_ability("attack") for x in range(3)]
-        ab2 = [generators.random_ability("defense") for x in range(1)]
+        with rng.using(self.rng):
+            ab1 = [generators.random_ability("attack") for x in range(3)]
+            ab2 = [generators.random_ability("defense") for x in range(1)]
 
         self.abilities = ab1 + ab2
         weap = generators.Sword()
-        weap.pr = self
         self.force_equip_weapon(weap)
 
     def force_equip_weapon(self, obj):
@@ -66,18 +61,42 @@ class Character(EngineReference):
         """Equip the player's starting weapon, this is only run at startup"""
 
         obj.location = "PLAYER"
-        slot = obj.slot
-        self.equipped_slots[slot] = obj
-        self.equipped.append(obj)
+        self.inventory.equip(obj, obj.slot)
         self.weapon = obj
 
+    @property
+    def weapon(self):
+
+        return self.inventory.weapon
+
+    @weapon.setter
+    def weapon(self, obj):
+
+        self.inventory.weapon = obj
+
     def log(self, message, *args, newline=True):
 
         message = message.format(*args)
         message = a_vowel_finder.sub(r'\1an \2', message)  # a to an
-        self.log_text += message
         if newline:  # sometimes want to build up a log message from several different functions
-            self.log_text += "\n"
+            message += "\n"
+        self.log_text += message
+        if self.listener is not None:
+            self.listener(message)
+
+    def notify(self, message):
+
+        """Something happened to another character in the same room. This isn't the character taking
+        their turn, so the message can't go in the log, the engine delivers it instead."""
+
+        message = a_vowel_finder.sub(r'\1an \2', message)
+        self.pr.deliver(self, message)
+
+    def log_pending_messages(self):
+
+        for message in self.pending_messages:
+            self.log(message)
+        self.pending_messages = []
 
     def clear_log(self):
 
@@ -104,9 +123,11 @@ class Character(EngineReference):
 
     def heal_damage(self, amount):
 
+        old = self.health
         self.health += amount
         if self.health > 100:
             self.health = 100
+        journal.changed(self, "health", old)
 
         self.log("You now have {} HP.", self.health)
 
@@ -130,8 +151,12 @@ class Character(EngineReference):
 
         out = ''''''
         for att in ["speed", "strength", "moxie", "health", "armour"]:
-            value = self.__getattribute__(att)
-            out += "{}: {}\n".format(att, value)
+            stat = stats.ID[att]
+            out += "{}: {}".format(att, self.stats[stat])
+            bonus = self.stats.total(stat)
+            if bonus:
+                out += " ({:+} from equipment and effects)".format(bonus)
+            out += "\n"
 
         return out
 
@@ -139,16 +164,14 @@ class Character(EngineReference):
 
         out = '''Inventory: '''
 
-        name_list = [x.__doc__ for x in self.items]
-
-        for name in set(name_list):
-            if name_list.count(name) == 1:
+        for name, count in self.inventory.counts().items():  # in the order the items were picked up
+            if count == 1:
                 out += "{}, ".format(name)
             else:
-                out += "{} ({}), ".format(name, name_list.count(name))
+                out += "{} ({}), ".format(name, count)
 
         out += "\nEquipped: "
-        for equipped in self.equipped:
+        for equipped in self.inventory.equipped:
             out += "{}, ".format(equipped.__doc__)
         return out
 
@@ -164,107 +187,180 @@ class Character(EngineReference):
 
     def make_item_visible(self, item):
 
-        self.visible_things.append(item)
+        self.visible_things[item] = None
 
     def make_item_invisible(self, item):
 
         """for when a monster has died, etc"""
 
-        self.visible_things.remove(item)
+        self.visible_things.pop(item, None)
 
     def destroy_item(self, item):
 
-        for ls in self.visible_things, self.items, self.equipped:
-            if item in ls:
-                ls.remove(item)
+        self.visible_things.pop(item, None)
+        if item in self.inventory:
+            self.remove_from_inventory(item, "destroy_item")
+
+    def remove_from_inventory(self, item, kind):
+
+        """Take item out of the inventory, journalled so it can be put back"""
+
+        slot = next((s for s, held in self.inventory.slots.items() if held is item), None)
+        wielded = self.inventory.remove(item) and item is self.weapon
+        if wielded:
+            self.weapon = None  # it can't be fought with any more
+
+        def undo():
+            self.inventory.add(item)
+            if slot is not None:
+                self.inventory.equip(item, slot)
+            if wielded:
+                self.weapon = item
+        journal.record(kind, self, item, undo=undo)
+
+    def room_item_added(self, item):
+
+        """Called by the room the character is standing in"""
+
+        self.make_item_visible(item)
+
+    def room_item_removed(self, item):
+
+        self.make_item_invisible(item)
+
+    def room_monster_added(self, monster):
+
+        self.make_item_visible(monster)
+        self.monsters_in_play[monster] = None
+
+    def room_monster_removed(self, monster):
+
+        self.make_item_invisible(monster)
+        self.monsters_in_play.pop(monster, None)
 
     def update_visible_things(self):
 
-        """Updated to get lists from self.location rather than have to be told"""
+        """Rebuild from self.location, only needed on arrival in a room. After that the room
+        keeps the character up to date as things are added and removed."""
 
-        directions = self.location.neighbours.keys()
-        items = self.location.contents
-        monsters = self.location.monsters
+        self.visible_exits = list(self.location.neighbours.keys())
+        # rather than hold a reference to the room, the player only holds the name of a possible
+        # exit, because rooms aren't instantiated until the player visits them for the first time.
+        # the room object updates the player's current location by passing a new room
+        # object to the Player.relocate function.
 
-        self.visible_things = []
-        self.visible_exits = []
+        self.visible_things = dict.fromkeys(self.location.contents)
+        self.visible_things.update(self.location.monsters)
 
-        for direction in directions:
-            self.visible_exits.append(direction)
-            # rather than hold a reference to the room, the player only holds the name of a possible
-            # exit, because rooms aren't instantiated until the player visits them for the first time.
-            # the room object updates the player's current location by passing a new room
-            # object to the Player.relocate function.
+    def relocate(self, source, dest, came_from, look=True):
 
-        for ls in (items, monsters):
-            for k in ls:
-                self.visible_things.append(k)  # refer to object instances using their docstring name
+        """Move the player from source room to dest room if exists, else create one. look=False
+        skips describing the new room, for passing through on the way somewhere else."""
 
-    def relocate(self, source, dest, came_from):
+        old_dest = source.neighbours[came_from]
+        # keys for this world's doors first, then anything the engine has queued up for whoever
+        # explores next
+        queue = source.world.item_queue or self.pr.item_queue
+        try:
+            special_item = queue.popleft()
+            # usually it's None but sometimes it's an item that's been delayed
+        except IndexError:
+            special_item = None
 
-        """Move the player from source room to dest room if exists, else create one"""
+        if dest is None:
+            dest = source.world.room_at(source.coords, came_from)  # in case it's been built since
+            if dest is not None:
+                source.world.link(source, came_from, dest)
 
         if dest is None:
-            try:
-                special_item = self.pr.item_queue.popleft()
-                # usually it's None but sometimes it's an item that's been delayed
-            except IndexError:
-                special_item = None
-
-            # make a new room then make sure they know each other as neighbours
-            dest = generators.random_room(source, came_from, special_item=special_item)
-            source.neighbours[came_from] = dest  # only source needs to be informed
-            # new room is informed of its neighbour on creation
-
-        for mon in self.monsters_in_play:
+            # make a new room, it links itself to its neighbours
+            with metrics.span("generate_room"):
+                dest = generators.random_room(source, came_from, special_item=special_item)
+        elif special_item is not None:
+            # it turns up wherever the player goes next, so a key still arrives when there's
+            # nothing left to explore but what's behind its door
+            dest.add_item(special_item)
+            journal.record("deliver", dest, special_item, undo=lambda: queue.appendleft(special_item))
+
+        if old_dest is None:
+            journal.record("link", source, came_from, dest)  # stays explored even after an undo
+
+        for mon in list(self.monsters_in_play):  # copy, following monsters leave the source room
             mon.randomly_follow(dest)
 
+        source.remove_occupant(self)
+        source.broadcast("{} leaves to the {}.", self.name, came_from)
+        dest.broadcast("{} arrives.", self.name)
+        dest.add_occupant(self)
         self.location = dest
+        journal.record("move", self, source, dest, undo=lambda: self.move_back(dest, source))
         self.update_visible_things()
 
         # registers the room's contents with the player object for the purpose of looking
         # up which commands are legal/make sense
         self.update_monsters_in_play(dest.monsters)
 
-        dest.on_look()
+        if look:
+            dest.on_look()
+
+    def move_back(self, dest, source):
+
+        """Undo a move, quietly"""
+
+        dest.remove_occupant(self)
+        source.add_occupant(self)
+        self.location = source
+        self.update_visible_things()
+        self.update_monsters_in_play(source.monsters)
 
     def update_monsters_in_play(self, als):
 
-        self.monsters_in_play = []
-        for mon in als:
-            self.monsters_in_play.append(mon)
+        self.monsters_in_play = dict.fromkeys(als)
 
-    def add_to_inventory(self, obj):
+    def add_to_inventory(self, obj, announce=True):
 
-        self.items.append(obj)
+        """Returns whether there was room for obj"""
+
+        reason = self.inventory.room_for(obj)
+        if reason is not None:
+            self.log(reason)
+            return False
+        self.inventory.add(obj)
+        journal.record("pick_up", self, obj, undo=lambda: self.inventory.remove(obj))
         self.make_item_invisible(obj)  # remove from "visible things" list. If the player wants to
         # use a command on it like use or equip, the item is already present in the equipped or
         # inventory lists that are scanned by the command dispatcher.
-        self.log("You picked up a {}", obj.__doc__)
+        if announce:
+            self.log("You picked up a {}", obj.__doc__)
+        return True
 
     def equip(self, obj):
 
         name = obj.__doc__
         try:
             slot = obj.slot
-            held = self.equipped_slots[slot]
-            if held is None:
-                self.equipped_slots[slot] = obj
-            else:
-                self.log("{} is already equipped in your {} slot.", held.__doc__, slot)
-                return  # don't equip
         except AttributeError:
             self.log("{} is an equippable item with no slot, fix this!", name)
             self.add_to_inventory(obj)  # the object's on_equip logic deletes it from the location
             # it was picked up from, so we need to add it to the player's inventory otherwise the
             # item will disappear. This code should never run anyway if the item has a slot attribute.
             return
-
-        self.equipped.append(obj)
-        if obj in self.items:
-            self.items.remove(obj)  # to avoid item duplication when equipping. but have to check for
-            # presence in case the player is equipping something
-            # straight off the floor
+        held = self.inventory.slots[slot]
+        if held is not None:
+            self.log("{} is already equipped in your {} slot.", held.__doc__, slot)
+            if obj not in self.inventory:
+                self.add_to_inventory(obj)  # straight off the floor, keep hold of it instead
+            return  # don't equip
+
+        was_held = obj in self.inventory.held  # or the player is equipping something straight off the floor
+        self.inventory.equip(obj, slot)
+
+        def undo():
+            if was_held:
+                self.inventory.unequip(obj)
+            else:
+                self.inventory.remove(obj)
+        journal.record("equip", self, obj, undo=undo)
         self.log("You equipped the {}.", name)
         obj.on_equip_logic()
 
@@ -272,43 +368,74 @@ class Character(EngineReference):
     def deequip(self, obj):
 
         name = obj.__doc__
-        self.equipped.remove(obj)
-        self.items.append(obj)  # de-dequipped but still held
+        slot = next(s for s, held in self.inventory.slots.items() if held is obj)
+        self.inventory.unequip(obj)  # de-dequipped but still held
         obj.on_deequip_logic()
-        try:
-            slot = obj.slot
-            self.equipped_slots[slot] = None
-        except AttributeError:
-            pass
+        journal.record("deequip", self, obj, undo=lambda: self.inventory.equip(obj, slot))
         self.log("You unequipped the {}", name)
 
     def drop_item(self, obj):
 
         name = obj.__doc__
 
-        if not (obj in self.items or obj in self.equipped):
+        if obj not in self.inventory:
             self.log("You aren't holding a {}.", name)
             return
 
-        if obj in self.equipped:
+        if self.inventory.is_equipped(obj):
             obj.on_deequip()
 
-        self.items.remove(obj)
-        self.location.add_item(obj)
+        self.remove_from_inventory(obj, "drop")
+        self.location.add_item(obj)  # the room makes it visible again
         self.log("Dropped {}.", name)
-        self.update_visible_things()
+        self.location.broadcast("{} dropped a {}.", self.name, name, exclude=self)
+
+    def drop_all(self, words):
+
+        """The drop all command, e.g. drop all bandages. Equipped items are kept."""
+
+        items = [item for name in self.inventory.matching_names(words) for item in self.inventory.named(name)]
+        if not items:
+            self.log("You aren't carrying any {}.", words)
+            return
+        for item in items:
+            self.remove_from_inventory(item, "drop")
+            self.location.add_item(item)
+        for name, count in Counter(item.__doc__ for item in items).items():
+            self.log("Dropped {} {}.", count, name)
+            self.location.broadcast("{} dropped {} {}.", self.name, count, name, exclude=self)
+
+    def take_all(self, words):
+
+        """The take all command, picks up everything here called words until there's no more room"""
+
+        names = [words, words[:-1] if words.endswith("s") else None]
+        items = [k for k in self.visible_things if k.__doc__ in names] or \
+                [k for k in self.visible_things if any(n and n in k.__doc__ for n in names)]
+        items = [k for k in items if k.can("on_take")]
+        if not items:
+            self.log("There aren't any {} here.", words)
+            return
+        taken = []
+        for item in items:
+            if isinstance(item, things.Item):  # rather than e.g. a corpse, which can't be taken
+                if not item.on_take(announce=False):
+                    break  # no room for any more
+                taken.append(item)
+            else:
+                item.on_take()
+        for name, count in Counter(item.__doc__ for item in taken).items():
+            self.log("You picked up {} {}.", count, name)
 
     def destroy_key(self, colour):
 
         key = self.keys_in_play.pop(colour)
+        journal.record("use_key", self, colour, undo=lambda: self.keys_in_play.__setitem__(colour, key))
         self.destroy_item(key)
 
     def check_if_equipped(self, item):
 
-        if item in self.equipped:
-            return True
-        else:
-            return False
+        return self.inventory.is_equipped(item)
 
     def has_key(self, colour):
 
@@ -324,14 +451,17 @@ class Character(EngineReference):
         else:
             return False
 
-    def request_key(self, colour):
+    def start_game(self, room=None):
 
-        self.pr.request_key(colour)
+        """Start in room, to join someone else's world, or in a brand new world if room is None"""
 
-    def start_game(self):
-
-        room = generators.random_room(None, "north")  # generate a new random room
+        if room is None:
+            room = generators.random_room(None, "north")  # generate a new random room
+        else:
+            room.broadcast("{} appears out of nowhere!", self.name)
         self.location = room
+        room.add_occupant(self)
+        room.world.players[self] = None
         weap = generators.Sword()
         room.add_item(weap)
         self.update_visible_things()
@@ -344,6 +474,15 @@ class Character(EngineReference):
 
         self.log("You have died...")
         self.dead = True
+        self.location.remove_occupant(self)  # stop hearing about the room
+        self.location.world.players.pop(self, None)  # more than one monster can kill them
+        self.location.broadcast("{} has died!", self.name)
+
+        def undo():
+            self.dead = False
+            self.location.add_occupant(self)
+            self.location.world.players[self] = None
+        journal.record("death", self, self.location, undo=undo)
 
     def first_output(self):
 
@@ -356,17 +495,47 @@ class Character(EngineReference):
 
     def adjust_stat(self, stat, amount):
 
-        to_mod = self.__getattribute__(stat)
+        """Permanently change the base value of a stat. For changes that wear off, see add_modifier"""
+
+        to_mod = self.stats.base[stats.ID[stat]]
         modded = to_mod + amount
         if modded < 0:
             modded = 0
         if modded > 99:
             modded = 99
-        self.__setattr__(stat, modded)
+        self.stats.base[stats.ID[stat]] = modded
+        self.stats.dirty = True
+
+        def undo():
+            self.stats.base[stats.ID[stat]] = to_mod
+            self.stats.dirty = True
+        journal.record("set", self, stat, modded, undo=undo)
+        self.log_stat_change(stat, amount)
+
+    def add_modifier(self, kind, source, stat, amount):
+
+        """Change a stat until remove_modifiers(source) is called, kind is one of the kinds in stats.py"""
+
+        modifier = self.stats.add(kind, source, stats.ID[stat], amount)
+        journal.record("modifier", self, stat, amount, undo=lambda: self.stats.remove(modifier))
+        self.log_stat_change(stat, amount)
+
+    def remove_modifiers(self, source):
+
+        removed = self.stats.remove_all(source=source)
+
+        def undo():
+            for modifier in removed:
+                self.stats.add(*modifier)
+        journal.record("unmodify", self, source, undo=undo)
+        for kind, source, stat, amount in removed:
+            self.log_stat_change(stats.NAMES[stat], -amount)
+
+    def log_stat_change(self, stat, amount):
 
         if amount > 0:
             word = "increased"
         else:
             word = "decreased"
 
-        self.log("{} {} by {}!", stat, word, amount)
+        self.log("{} {} by {}!", stat, word, abs(amount))
@@ -1,4 +1,6 @@
-import random
+import journal
+import rng
+import stats
 import things
 import character
 
@@ -16,16 +18,14 @@ class CombatEngine:
         self.mon2 = monster2
         self.rounds = rounds
         self.current_round = 0
+        self.rng = rng.current  # the random stream of the session the combat is happening in
         self.log_ref = log_ref  # need this to log combat messages in dungeon mode, or if none
         # just prints it to the channel because the combat engine isn't associated with any one
         # particular game
 
     def chance(self, prob):
 
-        if random.randint(0, 100) < prob:
-            return True
-        else:
-            return False
+        return self.rng.chance(prob)
 
     def log(self, template, *args, newline=True):
 
@@ -34,27 +34,27 @@ class CombatEngine:
     def inflict_damage(self, target, amount):
 
         ori_amount = amount
-        amount = float(amount) * (100 - target.armour)/100
+        amount = float(amount) * (100 - target.stats[stats.ARMOUR])/100
         amount = int(amount)
         if amount < 0:
             amount = 0
         target.health -= amount
+        journal.changed(target, "health", target.health + amount)
         return amount, ori_amount - amount  # so that the damage reduction can be printed
 
     def defensive_ability(self, target, stat, amount):
 
-        val = target.__getattribute__(stat)
-        val += amount
-        target.__setattr__(stat, val)
-        target.buffs[stat] += amount  # a dictionary used to reset the buffs at the end of combat
+        # taken off again by unbuff at the end of the combat
+        modifier = target.stats.add(stats.BUFF, self, stats.ID[stat], amount)
+        journal.record("buff", target, stat, amount, undo=lambda: target.stats.remove(modifier))
 
     def setup_combat_queue(self):
 
         m1abs = self.mon1.abilities[:]
         m2abs = self.mon2.abilities[:]
 
-        random.shuffle(m1abs)
-        random.shuffle(m2abs)
+        self.rng.shuffle(m1abs)
+        self.rng.shuffle(m2abs)
 
         unpacked = [x for x in zip(m1abs, m2abs)]
         # generator is expanded into list so we know the total length
@@ -82,6 +82,8 @@ class CombatEngine:
                          self.mon1.health,
                          self.mon2.name,
                          self.mon2.health)
+                self.mon1.unbuff()  # nobody won, but the buffs still only last for the combat
+                self.mon2.unbuff()
                 return
 
         # now we have fallen out of the while loop and need to work out what happened
@@ -111,8 +113,8 @@ class CombatEngine:
         """first returns the monster that has the highest score in the given stat,
         or none if they are equal"""
 
-        m1stat = mon1.__getattribute__(stat)
-        m2stat = mon2.__getattribute__(stat)
+        m1stat = mon1.stats[stats.ID[stat]]
+        m2stat = mon2.stats[stats.ID[stat]]
 
         if m1stat == m2stat:
             return None, None
@@ -172,7 +174,7 @@ class CombatEngine:
     def execute_ability(self, ability, target, source=None):
 
         if source:
-            hit_probability = ability.hit_chance + source.__getattribute__(ability.stat)
+            hit_probability = ability.hit_chance + source.stats[stats.ID[ability.stat]]
         else:
             hit_probability = ability.hit_chance
 
@@ -0,0 +1,223 @@
+"""Exact odds of a fight, worked out from the combat rules rather than by running the fight lots
+of times. Used by the consider command, and quick enough for matchmaking.
+
+This follows CombatEngine exactly. Each round one ability is drawn from each side without
+replacement (the engine shuffles both lists and pairs them up), for at most rounds rounds. The
+outcome of a round only depends on the abilities drawn, the hit roll and the combatants' current
+health and stats, so the odds can be worked out for every (abilities used so far, health, stats)
+state, remembering the ones already worked out. Nobody can die on the same turn as their
+opponent, so the only outcomes are a win for either side or a timeout when the rounds run out.
+
+    python combat_odds.py                  compare the predictions with simulated fights"""
+
+import argparse
+import functools
+import math
+import sys
+import time
+from collections import namedtuple
+
+import stats
+
+Odds = namedtuple("Odds", ("win", "lose", "timeout"))  # chances, from the first combatant's point of view
+
+STATS = ("strength", "speed", "moxie")
+BEATS = {"strength": "moxie", "speed": "strength", "moxie": "speed"}  # see CombatEngine.rps
+TOP = stats.LIMITS[stats.STRENGTH][1]  # buffs can't take a stat past this
+TIE, ATTACK1, ATTACK2, BUFF1, BUFF2 = "tie", "attack1", "attack2", "buff1", "buff2"  # kinds of round
+
+
+def damage(amount, armour):
+
+    """The damage that gets through armour, the same as CombatEngine.inflict_damage"""
+
+    return max(0, int(float(amount) * (100 - armour) / 100))
+
+
+def hit_chance(percent):
+
+    """Probability that rng chance(percent) succeeds, it rolls an integer from 0 to 100 inclusive"""
+
+    return min(max(math.ceil(percent), 0), 101) / 101
+
+
+def predict(combatant1, combatant2, rounds=5):
+
+    """The chances of combatant1 beating combatant2, losing to them or neither dying, for a combat
+    started with their current health and stats"""
+
+    abilities1 = tuple(combatant1.abilities)
+    abilities2 = tuple(combatant2.abilities)
+    turns = min(len(abilities1), len(abilities2), rounds)
+    armour1, armour2 = combatant1.stats[stats.ARMOUR], combatant2.stats[stats.ARMOUR]
+    weapon1 = damage(combatant1.weapon.damage, armour2) if combatant1.weapon is not None else None
+    weapon2 = damage(combatant2.weapon.damage, armour1) if combatant2.weapon is not None else None
+    stat_index = {stat: i for i, stat in enumerate(STATS)}
+
+    # what happens when ability i meets ability j doesn't depend on the state, except through the
+    # stats, so work out as much of it as possible once
+    rounds_table = {}
+    for i, ab1 in enumerate(abilities1):
+        for j, ab2 in enumerate(abilities2):
+            s = stat_index[ab1.stat]
+            if ab1.stat == ab2.stat:
+                rounds_table[i, j] = (TIE, s, 0, 0)  # the one with more of the stat hits with their weapon
+            else:
+                first = BEATS[ab1.stat] == ab2.stat
+                ability = ab1 if first else ab2
+                s = stat_index[ability.stat]
+                if ability.typ == "attack":
+                    hurt = damage(ability.power, armour2 if first else armour1)
+                    rounds_table[i, j] = (ATTACK1 if first else ATTACK2, s, ability.hit_chance, hurt)
+                else:
+                    rounds_table[i, j] = (BUFF1 if first else BUFF2, s, hit_chance(ability.hit_chance), ability.power)
+
+    def left(used, count):
+        return [i for i in range(count) if not used & (1 << i)]
+
+    # the most damage each ability can do to the other side in a round. A side with more health than
+    # the other side's remaining abilities could take off it in the rounds left is sure to survive,
+    # whatever its exact health
+    hurts1 = [max([weapon2 or 0] + [rounds_table[i, j][3] for i in range(len(abilities1))
+                                    if rounds_table[i, j][0] is ATTACK2])
+              for j in range(len(abilities2))]
+    hurts2 = [max([weapon1 or 0] + [rounds_table[i, j][3] for j in range(len(abilities2))
+                                    if rounds_table[i, j][0] is ATTACK1])
+              for i in range(len(abilities1))]
+
+    @functools.lru_cache(maxsize=None)
+    def safe_health(side, used, turn):
+        hurts = hurts1 if side == 1 else hurts2
+        return sum(sorted((hurts[i] for i in left(used, len(hurts))), reverse=True)[:turns - turn]) + 1
+
+    @functools.lru_cache(maxsize=None)
+    def odds(used1, used2, turn, hp1, hp2, stats1, stats2):
+
+        # used1 and used2 are bitmasks of the abilities already drawn
+        if hp1 <= 0:
+            return 0.0, 1.0, 0.0
+        if hp2 <= 0:
+            return 1.0, 0.0, 0.0
+        if turn == turns:
+            return 0.0, 0.0, 1.0
+        safe1 = safe_health(1, used2, turn)
+        safe2 = safe_health(2, used1, turn)
+        if hp1 >= safe1 and hp2 >= safe2:
+            return 0.0, 0.0, 1.0
+        if hp1 > safe1 or hp2 > safe2:
+            # the same odds as any other health that's enough to survive, share the work with them
+            return odds(used1, used2, turn, min(hp1, safe1), min(hp2, safe2), stats1, stats2)
+
+        left1 = left(used1, len(abilities1))
+        left2 = left(used2, len(abilities2))
+        win = lose = timeout = 0.0
+        turn += 1
+
+        for i in left1:
+            next1 = used1 | (1 << i)
+            for j in left2:
+                kind, s, a, b = rounds_table[i, j]
+                next2 = used2 | (1 << j)
+                # hit is the outcome if the winning ability works, p the chance it does
+                if kind is TIE:
+                    p = 1.0
+                    if stats1[s] > stats2[s] and weapon1 is not None:
+                        hit = odds(next1, next2, turn, hp1, hp2 - weapon1, stats1, stats2)
+                    elif stats2[s] > stats1[s] and weapon2 is not None:
+                        hit = odds(next1, next2, turn, hp1 - weapon2, hp2, stats1, stats2)
+                    else:
+                        hit = odds(next1, next2, turn, hp1, hp2, stats1, stats2)
+                elif kind is ATTACK1:
+                    p = hit_chance(a + stats1[s])
+                    hit = odds(next1, next2, turn, hp1, hp2 - b, stats1, stats2)
+                elif kind is ATTACK2:
+                    p = hit_chance(a + stats2[s])
+                    hit = odds(next1, next2, turn, hp1 - b, hp2, stats1, stats2)
+                elif kind is BUFF1:
+                    p = a
+                    hit = odds(next1, next2, turn, hp1, hp2, stats1[:s] + (min(stats1[s] + b, TOP),) + stats1[s + 1:], stats2)
+                else:
+                    p = a
+                    hit = odds(next1, next2, turn, hp1, hp2, stats1, stats2[:s] + (min(stats2[s] + b, TOP),) + stats2[s + 1:])
+
+                win += p * hit[0]
+                lose += p * hit[1]
+                timeout += p * hit[2]
+                if p < 1.0:
+                    miss = odds(next1, next2, turn, hp1, hp2, stats1, stats2)
+                    win += (1.0 - p) * miss[0]
+                    lose += (1.0 - p) * miss[1]
+                    timeout += (1.0 - p) * miss[2]
+
+        weight = 1.0 / (len(left1) * len(left2))  # each pairing is equally likely
+        return win * weight, lose * weight, timeout * weight
+
+    stats1 = tuple(combatant1.stats[stats.ID[x]] for x in STATS)
+    stats2 = tuple(combatant2.stats[stats.ID[x]] for x in STATS)
+    return Odds(*odds(0, 0, 0, combatant1.health, combatant2.health, stats1, stats2))
+
+
+def simulate(combatant1, combatant2, samples, rounds=5):
+
+    """The same odds estimated by running the real CombatEngine samples times, for checking predict()"""
+
+    import arena  # not at the top, arena starts the engine
+
+    saved = [(c, c.health) for c in (combatant1, combatant2)]
+    counts = [0, 0, 0]
+    for x in range(samples):
+        arena.ArenaCombat(combatant1, combatant2, rounds=rounds).run_combat()
+        if combatant2.health <= 0:
+            counts[0] += 1
+        elif combatant1.health <= 0:
+            counts[1] += 1
+        else:
+            counts[2] += 1
+        for c, health in saved:  # put back the health for the next fight, the buffs come off by themselves
+            c.health = health
+    return Odds(*(n / samples for n in counts))
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Check the combat predictions against simulated fights")
+    parser.add_argument("--fights", type=int, default=10, help="how many match-ups to check")
+    parser.add_argument("--samples", type=int, default=20000, help="simulated fights per match-up")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    import arena
+    import headless
+    import rng
+
+    engine = headless.new_engine()
+    roster = arena.make_roster(args.fights * 2, args.seed)
+    worst = 0.0
+    slowest = 0.0
+    print("{:<44}{:>24}{:>24}".format("", "predicted win/lose/timeout", "simulated"))
+    for x in range(args.fights):
+        if x % 2:
+            first = roster[2 * x]  # half monster against monster, half character against monster
+        else:
+            with headless.quiet():
+                first, _ = headless.new_character(engine, x, seed=args.seed + x)
+        second = roster[2 * x + 1]
+
+        start = time.perf_counter()
+        predicted = predict(first, second)
+        slowest = max(slowest, time.perf_counter() - start)
+        with rng.using(rng.new_stream(args.seed + x)):
+            simulated = simulate(first, second, args.samples)
+        worst = max(worst, max(abs(a - b) for a, b in zip(predicted, simulated)))
+
+        print("{:<44}{:>24}{:>24}".format("{} vs {}".format(first.name, second.name)[:43],
+                                          "/".join("{:.3f}".format(p) for p in predicted),
+                                          "/".join("{:.3f}".format(p) for p in simulated)))
+
+    print("largest difference: {:.4f} (sampling error is about {:.4f})".format(worst, 2 / args.samples ** 0.5 / 2))
+    print("slowest prediction: {:.2f} ms".format(slowest * 1000))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,17 @@
-import random
+import rng
+import textstore
 import re
 import os
+import threading
 from collections import defaultdict
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+QUEST_TEXT_PATH = os.path.join(BASE_DIR, "quest_text.txt")
+DESCRIPTIONS_DIR = os.path.join(BASE_DIR, "descriptions")
+
 quest_text = {}
+parsed_files = {}  # path: (modification time, parsed contents), so a reload only reparses changed files
+loaded_mtimes = {}  # modification times of the files the current quest_text was built from
 
 choice_finder = re.compile('''<[^<^>]*>|\[.*\]|%''')
 list_finder = re.compile("\[[^\[^\]]*\]")
@@ -28,7 +36,7 @@ def my_loader(path):
 
     """returns a dict based on a text doc where *HEADING* lines delineate dictionary keys"""
 
-    category_dict = defaultdict(lambda: [])
+    category_dict = defaultdict(list)
     current_heading = None
     with open(path, "r") as f:
         for line in f.readlines():
@@ -40,49 +48,133 @@ def my_loader(path):
     return category_dict
 
 
-def load_quest_text():
+def quest_text_loader(path):
 
-    global quest_text
+    """returns a dict based on a text doc of key:option|option|option lines"""
 
     out = {}
-    with open("quest_text.txt", "r") as f:
+    with open(path, "r") as f:
         for line in f.readlines():
             line = line.rstrip("\n")
             key, to_split = line.split(":")
             vals = to_split.split("|")
             out[key] = vals
+    return out
+
 
-    for fname in os.listdir("descriptions"):
+def corpus_files():
+
+    """(path, key in quest_text or None to merge at the top level, loader) for every file in the corpus"""
+
+    out = [(QUEST_TEXT_PATH, None, quest_text_loader)]
+    for fname in sorted(os.listdir(DESCRIPTIONS_DIR)):
         category, _ = os.path.splitext(fname)
-        fullpath = os.path.join("descriptions", fname)
-        out[category] = my_loader(fullpath)
+        out.append((os.path.join(DESCRIPTIONS_DIR, fname), category, my_loader))
+    return out
+
+
+def corpus_mtimes():
 
-    quest_text = out
+    return {path: os.stat(path).st_mtime_ns for path, _, _ in corpus_files()}
+
+
+def build_corpus():
+
+    """Returns a brand new quest_text dict, reparsing only the files that changed since they were last
+    parsed. Nothing global is touched, the caller swaps the result in."""
+
+    out = {}
+    for path, category, loader in corpus_files():
+        mtime = os.stat(path).st_mtime_ns
+        cached = parsed_files.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = parsed_files[path] = (mtime, loader(path))
+        parsed = cached[1]
+        if category is None:
+            out.update(parsed)
+        else:
+            # copied, because the merging below extends these lists and the cache must stay as parsed
+            out[category] = defaultdict(list, {k: list(v) for k, v in parsed.items()})
 
     # extra code to merge and cross-reference dictionaries with each other, to avoid having the same
     # string or description in multiple files
 
     # builds a lookup so that gendered monsters can find their pronouns
 
-    quest_text["all_monster_names"] = (quest_text["monster_names"]["MALE"] +
-                                       quest_text["monster_names"]["FEMALE"] +
-                                       quest_text["monster_names"]["NEUTRAL"])
-    quest_text["monster_genders"] = {}
-    for k, v in quest_text["monster_names"].items():
+    out["all_monster_names"] = (out["monster_names"]["MALE"] +
+                                out["monster_names"]["FEMALE"] +
+                                out["monster_names"]["NEUTRAL"])
+    out["monster_genders"] = {}
+    for k, v in out["monster_names"].items():
         for mon in v:
-            quest_text["monster_genders"][mon] = k
+            out["monster_genders"][mon] = k
 
     # merge common descriptions into the humanoid- or monster-specific dictionaries
 
-    generic_common = quest_text["common_creature_descriptions"]["COMMON"]
-    generic_rare = quest_text["common_creature_descriptions"]["RARE"]
+    generic_common = out["common_creature_descriptions"]["COMMON"]
+    generic_rare = out["common_creature_descriptions"]["RARE"]
     for category in "monster_descriptions", "humanoid_descriptions":
-        quest_text[category]["COMMON"].extend(generic_common)
-        quest_text[category]["RARE"].extend(generic_rare)
+        out[category]["COMMON"].extend(generic_common)
+        out[category]["RARE"].extend(generic_rare)
+
+    return out
+
+
+def load_quest_text():
+
+    global quest_text
+    global loaded_mtimes
+
+    mtimes = corpus_mtimes()
+    quest_text = build_corpus()  # a single assignment, so generation never sees a half-built corpus
+    loaded_mtimes = mtimes
 
     print("Quest text loaded.")
 
 
+def reload_if_changed():
+
+    """Reload the corpus if any file in it was edited, added or removed since it was loaded.
+    Returns True if it was reloaded."""
+
+    global loaded_mtimes
+
+    mtimes = loaded_mtimes
+    try:
+        mtimes = corpus_mtimes()
+        if mtimes == loaded_mtimes:
+            return False
+        load_quest_text()
+    except (OSError, ValueError, KeyError) as e:
+        # probably caught a file half way through being saved, or it has a mistake in it. Keep
+        # playing with the old corpus and try again when the files are next changed
+        print("Couldn't reload quest text: {!r}".format(e))
+        loaded_mtimes = mtimes
+        return False
+    return True
+
+
+class CorpusWatcher(threading.Thread):
+
+    """Background thread that checks the corpus files for changes every interval seconds and swaps
+    in the new text, so descriptions can be edited without restarting the game"""
+
+    def __init__(self, interval=2.0):
+
+        super().__init__(name="corpus-watcher", daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+
+        while not self.stopped.wait(self.interval):
+            reload_if_changed()
+
+    def stop(self):
+
+        self.stopped.set()
+
+
 @antoand
 def do_sub_recursive(astr):
 
@@ -106,14 +198,14 @@ def do_sub(astr):
     from_big_list = list_finder.findall(astr)
     for r in from_big_list:
         source = r[1:-1]
-        astr = astr.replace(r, random.choice(quest_text[source]), 1)
+        astr = astr.replace(r, rng.current.choice(quest_text[source]), 1)
         # limited to one replacement otherwise one thing will be picked and subbed in to
         # all the places where the string picks from that list
 
     rand_strings = rand_finder.findall(astr)
     for prob, randstr in rand_strings:
         astr = astr.replace(prob, "")  # get rid of the probability whatever happens
-        if random.randint(0, 100) > int(prob):
+        if rng.current.randint(0, 100) > int(prob):
             astr = astr.replace(randstr, "")
         else:
             astr = astr.replace(randstr, randstr[1:-1])  # just trim off the % signs
@@ -151,7 +243,7 @@ def get_pronouns(gender):
 def chooser(astr):
     astr = astr[1:-1]
     opts = astr.split("|")
-    return random.choice(opts)
+    return rng.current.choice(opts)
 
 
 def generate_room_description():
@@ -172,11 +264,11 @@ def generate_description(source, pro=None, pos_pro=None):
     This optionally takes pronoun and posessive pronoun, for use when
     generating descriptions of creatures."""
 
-    num_strings = random.randint(1, 4)
-    picked = random.sample(quest_text[source]["COMMON"], num_strings)
-    if random.choice((0, 1)) == 1:
-        picked.append(random.choice(quest_text[source]["RARE"]))
-    random.shuffle(picked)
+    num_strings = rng.current.randint(1, 4)
+    picked = rng.current.sample(quest_text[source]["COMMON"], num_strings)
+    if rng.current.choice((0, 1)) == 1:
+        picked.append(rng.current.choice(quest_text[source]["RARE"]))
+    rng.current.shuffle(picked)
     caps = []
     for sentence in picked:
         out = sentence
@@ -193,7 +285,7 @@ def generate_doodad():
 
     """returns type, description string"""
 
-    typ = random.choice(quest_text["DOODADS"])
+    typ = rng.current.choice(quest_text["DOODADS"])
     if typ == "painting" or typ == "tapestry" or type == "drawing":
         # these doodads have special descriptions because they show a picture
         montyp, mondesc, _, _ = generate_monster()
@@ -214,11 +306,11 @@ def generate_container():
 
     """returns type and description string, for instantiation by the generator"""
 
-    if random.choice((0, 1)) == 1:
-        typ = random.choice(quest_text["CONTAINERS_FANCY"])
+    if rng.current.choice((0, 1)) == 1:
+        typ = rng.current.choice(quest_text["CONTAINERS_FANCY"])
         desc = generate_description("doodad_descriptions")  # a container is a kind of doodad
     else:
-        typ = random.choice(quest_text["CONTAINERS"])
+        typ = rng.current.choice(quest_text["CONTAINERS"])
         desc = typ
 
     return typ, desc
@@ -226,8 +318,10 @@ def generate_container():
 
 def generate_monster():
 
-    typ = random.choice(quest_text["all_monster_names"])
-    gender = quest_text["monster_genders"][typ]
+    corpus = quest_text  # the name and gender must come from the same version of the corpus, in case
+    # it is reloaded in the middle
+    typ = rng.current.choice(corpus["all_monster_names"])
+    gender = corpus["monster_genders"][typ]
     pro, pos_pro = get_pronouns(gender)
     if gender == "NEUTRAL":
         desc = generate_description("monster_descriptions", pro, pos_pro)
@@ -237,6 +331,7 @@ def generate_monster():
     return typ, desc, pro, pos_pro
 
 
+@textstore.interned  # there are only as many of these as monster types, keep one copy of each
 @antoand
 def get_corpse_string(typ):
 
@@ -245,7 +340,7 @@ def get_corpse_string(typ):
 
 def random_corpse_take_string():
 
-    return random.choice(quest_text["RANDOM_CORPSE_TAKE"])
+    return rng.current.choice(quest_text["RANDOM_CORPSE_TAKE"])
 
 
 def random_death_string(name):
@@ -0,0 +1,396 @@
+"""Pre-built dungeons: build a big world in advance, save it to a file, and load each room from the
+file the first time somebody walks into it.
+
+The world is split into square tiles on the grid and the tiles are built at the same time by a
+process pool, each tile by the ordinary room generator in a world bounded to the tile. Tiles next
+to each other are stitched together by a door through their shared edge. Where each door goes is
+decided up front, so every tile knows which of its edge rooms must lead out of it without having
+to wait for its neighbours, and each tile makes sure it can reach all of its doors.
+
+The file has a fixed size header, then one compressed record per room in the order they were
+built, then an index of (x, y, offset, length) entries sorted by coordinates. The game maps the
+file into memory and binary searches the index for a room when it's needed, so opening even a
+million room dungeon takes no time and only the rooms players have reached ever get loaded.
+
+    python dungeon.py event.dungeon --rooms 100000
+    python dungeon.py event.dungeon --rooms 1000000 --workers 8 --tile-rooms 20000"""
+
+import argparse
+import io
+import math
+import mmap
+import multiprocessing
+import os
+import pickle
+import shutil
+import struct
+import sys
+import time
+import zlib
+from collections import deque
+
+import headless  # imports the engine modules in the right order, they can't be imported on their own
+import rng
+
+with headless.quiet():
+    import generators
+    import things
+
+MAGIC = b"DUNGEON1"
+HEADER = struct.Struct("<8sQQii")  # magic, number of rooms, offset of the index, entrance x, y
+ENTRY = struct.Struct("<iiQI")  # x, y, offset of the room's record, its length
+
+engine = None  # built once in each worker process
+
+
+class RoomPickler(pickle.Pickler):
+
+    """Pickles what's in a room, writing any reference to a room (things in it know where they are)
+    as its coordinates, so that each record only holds one room"""
+
+    def __init__(self, file, offset):
+
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.offset = offset  # from the coordinates of the tile's world to the dungeon's
+
+    def persistent_id(self, obj):
+
+        if isinstance(obj, things.Room):
+            return shift(obj.coords, self.offset)
+        return None
+
+
+class RoomUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, room):
+
+        super().__init__(file)
+        self.room = room
+
+    def persistent_load(self, pid):
+
+        if tuple(pid) != self.room.coords:
+            raise pickle.UnpicklingError("room record refers to another room at {}".format(pid))
+        return self.room
+
+
+def shift(coords, offset):
+
+    return coords[0] + offset[0], coords[1] + offset[1]
+
+
+def step(coords, direction):
+
+    return shift(coords, things.World.offsets[direction])
+
+
+class Dungeon:
+
+    """A dungeon file opened for the game. Rooms are loaded into the world the first time
+    World.room_at asks for them."""
+
+    def __init__(self, path):
+
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.index, x, y = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError("{} isn't a dungeon file".format(path))
+        self.entrance_coords = (x, y)
+        self.world = None
+        self.loaded = 0
+
+    def __getstate__(self):
+
+        return {"path": self.path, "world": self.world, "loaded": self.loaded}  # the map can't be pickled
+
+    def __setstate__(self, state):
+
+        self.__init__(state["path"])
+        self.world = state["world"]
+        self.loaded = state["loaded"]
+
+    def entrance(self):
+
+        """The room everyone starts in"""
+
+        if self.world is None:
+            self.world = things.World()
+            self.world.store = self
+        return self.world.room_at(self.entrance_coords)
+
+    def find(self, coords):
+
+        """(offset, length) of the record for the room at coords, None if there isn't one"""
+
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            x, y, offset, length = ENTRY.unpack_from(self.map, self.index + mid * ENTRY.size)
+            if (x, y) == coords:
+                return offset, length
+            if (x, y) < coords:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def load(self, coords, world):
+
+        """Load the room at coords into world and link it to the rooms next to it that are already
+        loaded. Exits to rooms that aren't loaded yet are left as None, like unexplored ones."""
+
+        found = self.find(coords)
+        if found is None:
+            return None
+        offset, length = found
+        room = things.Room.__new__(things.Room)
+        room.coords = coords
+        neighbours, state = RoomUnpickler(io.BytesIO(zlib.decompress(self.map[offset:offset + length])), room).load()
+        room.__dict__.update(state)
+        room.world = world
+        room.occupants = {}
+        room.neighbours = {}
+        for direction, other_coords in neighbours.items():
+            other = world.rooms.get(tuple(other_coords))
+            room.neighbours[direction] = other
+            if other is not None:
+                other.neighbours[things.World.opposites[direction]] = room
+        world.add_room(room)
+        for direction, other in room.neighbours.items():
+            if other is not None:
+                world.opened(other, things.World.opposites[direction])
+        self.loaded += 1
+        return room
+
+    def close(self):
+
+        self.map.close()
+        self.file.close()
+
+
+def init_worker():
+
+    global engine
+    with headless.quiet():
+        engine = headless.new_engine()
+        headless.new_character(engine, 0, "builder", start=False)  # things are made for the current character
+
+
+def special_item(world):
+
+    """The next key waiting to go in a new room of world, the same queue the game uses when a player explores"""
+
+    try:
+        return world.item_queue.popleft()
+    except IndexError:
+        return None
+
+
+def connect(room, direction):
+
+    """Make sure room has an exit in direction that leads to a room, building it if it isn't there yet"""
+
+    other = room.world.room_at(room.coords, direction)
+    if other is None:
+        other = generators.random_room(room, direction, special_item=special_item(room.world))
+    if room.locked_door == direction:
+        room.locked_door = room.lock_colour = None  # the way between two doors can't be locked
+    room.neighbours[direction] = other
+    other.neighbours[things.World.opposites[direction]] = room
+    return other
+
+
+def carve(start, goal):
+
+    """Build or open up rooms in a line from start to the room at goal, across then down"""
+
+    room = start
+    while room.coords != goal:
+        dx, dy = goal[0] - room.coords[0], goal[1] - room.coords[1]
+        if dx:
+            direction = "east" if dx > 0 else "west"
+        else:
+            direction = "south" if dy > 0 else "north"
+        room = connect(room, direction)
+
+
+def build_tile(task):
+
+    """Build one tile and write its records to a part file. Returns the part file's path and the
+    index entries for its rooms, with offsets into the part file."""
+
+    number, origin, side, quota, seed, doors, part = task
+    # the tile's world starts at its first door (or the middle), and its coordinates are offset
+    # from the dungeon's by that much
+    local_doors = [(x - origin[0], y - origin[1], direction) for x, y, direction in doors]
+    first = local_doors[0][:2] if local_doors else (side // 2, side // 2)
+    offset = (origin[0] + first[0], origin[1] + first[1])
+
+    with headless.quiet(), rng.using(rng.new_stream(seed)):
+        start = generators.random_room(None, "north")
+        world = start.world
+        world.bounds = (-first[0], -first[1], side - 1 - first[0], side - 1 - first[1])
+
+        door_rooms = []
+        for x, y, direction in local_doors:
+            goal = (x - first[0], y - first[1])
+            carve(start, goal)
+            door_rooms.append((world.rooms[goal], direction))
+
+        # then carry on exploring breadth first, leaving what's behind locked doors until there's
+        # nothing else so that keys mostly turn up on the near side of their door
+        frontier = deque((room, d) for room in world.rooms.values() for d, n in room.neighbours.items() if n is None)
+        behind = deque()
+        built = list(world.rooms.values())
+        reopen = 0
+        while len(world.rooms) < quota:
+            if frontier:
+                room, direction = frontier.popleft()
+            elif behind:
+                room, direction = behind.popleft()
+            else:
+                # the tile closed itself off, knock through a wall of the oldest room that has one free
+                room, direction = built[reopen], None
+                for d in things.World.offsets:
+                    if d not in room.neighbours and room.can_open(d):
+                        direction = d
+                        break
+                if direction is None:
+                    reopen += 1
+                    continue
+                room.neighbours[direction] = None
+            if room.neighbours.get(direction, True) is not None or not room.can_open(direction):
+                continue  # already linked up, or it leads out of the tile
+            if room.locked_door == direction and frontier:
+                behind.append((room, direction))
+                continue
+            nu = generators.random_room(room, direction, special_item=special_item(world))
+            room.neighbours[direction] = nu
+            built.append(nu)
+            frontier.extend((nu, d) for d, n in nu.neighbours.items() if n is None)
+
+        # exits nobody will ever build anything behind are walled up
+        for room in built:
+            for d in [d for d, n in room.neighbours.items() if n is None]:
+                del room.neighbours[d]
+                if room.locked_door == d:
+                    room.locked_door = room.lock_colour = None
+        for item in world.item_queue:  # keys still waiting for a room
+            if item is not None:
+                start.add_item(item)
+
+        exits = {room: {} for room in built}
+        for room, direction in door_rooms:
+            exits[room][direction] = step(shift(room.coords, offset), direction)
+
+        entries = []
+        with open(part, "wb") as f:
+            for room in built:
+                neighbours = {d: shift(n.coords, offset) for d, n in room.neighbours.items()}
+                neighbours.update(exits[room])
+                state = {k: v for k, v in room.__dict__.items()
+                         if k not in ("world", "coords", "neighbours", "occupants")}
+                buffer = io.BytesIO()
+                RoomPickler(buffer, offset).dump((neighbours, state))
+                record = zlib.compress(buffer.getvalue())
+                x, y = shift(room.coords, offset)
+                entries.append((x, y, f.tell(), len(record)))
+                f.write(record)
+    return number, part, entries
+
+
+def plan(rooms, tile_rooms, seed):
+
+    """Split the dungeon into tiles and decide where the doors between them go. Returns a list of
+    (origin, side, quota, doors) per tile, where doors are (x, y, direction out of the tile)."""
+
+    tiles = max(1, math.ceil(rooms / tile_rooms))
+    columns = math.ceil(math.sqrt(tiles))
+    side = math.ceil(math.sqrt(2 * math.ceil(rooms / tiles)))  # room for twice as many rooms as it needs
+    origins = [((t % columns) * side, (t // columns) * side) for t in range(tiles)]
+    doors = [[] for t in range(tiles)]
+    where = {origin: t for t, origin in enumerate(origins)}
+
+    stream = rng.new_stream(seed)
+    for t, (x, y) in enumerate(origins):
+        east = where.get((x + side, y))
+        if east is not None:
+            row = y + stream.randrange(side)
+            doors[t].append((x + side - 1, row, "east"))
+            doors[east].append((x + side, row, "west"))
+        south = where.get((x, y + side))
+        if south is not None:
+            column = x + stream.randrange(side)
+            doors[t].append((column, y + side - 1, "south"))
+            doors[south].append((column, y + side, "north"))
+
+    return [(origins[t], side, rooms // tiles + (t < rooms % tiles), doors[t]) for t in range(tiles)]
+
+
+def build(path, rooms=10000, seed=0, workers=None, tile_rooms=5000):
+
+    """Build a dungeon of rooms rooms and save it to path. Returns the number of rooms written."""
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    tiles = plan(rooms, tile_rooms, seed)
+    # each tile's stream has its own seed, the same in every process, and not the plan's
+    tasks = [(t, origin, side, quota, seed * 100003 + t + 1, doors, "{}.part{}".format(path, t))
+             for t, (origin, side, quota, doors) in enumerate(tiles)]
+    origin, side, quota, doors = tiles[0]  # everyone starts at the first tile's first door
+    entrance = doors[0][:2] if doors else (origin[0] + side // 2, origin[1] + side // 2)
+
+    if workers == 1:
+        init_worker()
+        results = [build_tile(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(workers, init_worker) as pool:
+            results = list(pool.imap_unordered(build_tile, tasks))
+    results.sort()
+
+    index = []
+    with open(path, "wb") as f:
+        f.write(bytes(HEADER.size))
+        for number, part, entries in results:
+            base = f.tell()
+            with open(part, "rb") as p:
+                shutil.copyfileobj(p, f)
+            os.remove(part)
+            index.extend((x, y, base + offset, length) for x, y, offset, length in entries)
+        index.sort()
+        index_offset = f.tell()
+        for entry in index:
+            f.write(ENTRY.pack(*entry))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, len(index), index_offset, *entrance))
+    return len(index)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Build a dungeon in advance for the game to load as it's explored")
+    parser.add_argument("path")
+    parser.add_argument("--rooms", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="processes to use, defaults to one per core")
+    parser.add_argument("--tile-rooms", type=int, default=5000, help="rooms in each tile built by one worker")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    count = build(args.path, args.rooms, args.seed, args.workers, args.tile_rooms)
+    elapsed = time.perf_counter() - start
+    print("{:,} rooms in {:.2f}s ({:,.0f} rooms/s), {:,} bytes".format(
+        count, elapsed, count / elapsed if elapsed else 0, os.path.getsize(args.path)))
+
+    start = time.perf_counter()
+    dungeon = Dungeon(args.path)
+    dungeon.entrance()
+    print("opened and loaded the entrance in {:.2f} ms".format((time.perf_counter() - start) * 1000))
+    dungeon.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
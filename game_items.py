@@ -1,10 +1,13 @@
 from things import *
+import journal
+import stats
 
 
 class Spade(Item):
 
     """spade"""
     slot = "left hand"
+    weight = 3
 
     def on_look(self, *args):
 
@@ -24,6 +27,7 @@ class LightArmour(EquippableMixin, Item):
 
     """light armour"""
     slot = "body"
+    weight = 5
     stat_modifier = ("armour", 10)
 
     def on_look(self, *args):
@@ -46,6 +50,7 @@ class HeavyArmour(EquippableMixin, Item):
 
     freq = "rare"
     slot = "body"
+    weight = 10
     desc = "A sturdy suit of armour made from metal plates."
     stat_modifier = ("armour", 20)
 
@@ -72,12 +77,12 @@ class OrbOfInvulnerability(LimitedDurationMixin, SingleUseItem):
     def on_use_logic(self, *args):
 
         self.log("You feel invincible!")
-        self.pr.adjust_stat("armour", 50)
+        self.pr.add_modifier(stats.TIMED, self, "armour", 50)
 
     def on_countdown_finished(self, *args):
 
-        self.log("The invincibility wore off...")
-        self.pr.adjust_stat("armour", -50)
+        self.tell_user("The invincibility wore off...")
+        self.user.remove_modifiers(self)
 
 
 class Key(Item):
@@ -91,10 +96,21 @@ class Key(Item):
         self.colour = colour
         self.__doc__ = '''{} key'''.format(colour)
 
-    def on_take(self, *args):
-
-        super().on_take(*args)
-        self.pr.keys_in_play[self.colour] = self
+    def on_take(self, *args, announce=True):
+
+        if not super().on_take(*args, announce=announce):
+            return False
+        keys = self.pr.keys_in_play
+        previous = keys.get(self.colour)
+        keys[self.colour] = self
+
+        def undo():
+            if previous is None:
+                del keys[self.colour]
+            else:
+                keys[self.colour] = previous
+        journal.record("key", self.pr, self.colour, undo=undo)
+        return True
 
 
 class Sword(Weapon):
@@ -0,0 +1,337 @@
+"""Adapter between the engine and a Discord-style chat gateway, plus a local fake gateway to test it with.
+
+The adapter runs commands on a worker thread so the event loop never waits for the game, then
+queues the output per channel. Each channel has a sender task that coalesces everything waiting
+into as few messages as possible (split at line boundaries below the message size limit) and
+sends them no faster than the rate limit allows.
+
+FakeGateway stands in for Discord without any network access. It enforces the same kind of rate
+limits Discord does, rejecting messages that break them, and hands delivered messages to fake users.
+Running this module simulates a crowd of users (the loadgen bots) talking to the game through it:
+
+    python gateway.py --players 20 --commands 50
+    python gateway.py --channel-limit 5/5 --think 0.5     real Discord limits, slow
+    python gateway.py --spammers 2 --admission coalesce   users flooding the game, see admission.py"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import random
+import sys
+import time
+
+import admission
+import headless
+import loadgen
+import player
+
+PREFIX = "!"
+BUSY = "You're sending commands faster than the game can take them, that one was ignored: {}\n"
+
+
+class RateLimited(Exception):
+
+    """Raised by the gateway when a message breaks a rate limit, like Discord's HTTP 429"""
+
+    def __init__(self, retry_after):
+
+        super().__init__("rate limited, retry after {:.3f}s".format(retry_after))
+        self.retry_after = retry_after
+
+
+def parse_limit(text):
+
+    """Turns e.g. "5/5" (5 messages per 5 seconds) into (5, 5.0)"""
+
+    count, period = text.split("/")
+    return int(count), float(period)
+
+
+class FakeGateway:
+
+    """A local stand-in for Discord. Messages sent to a channel are checked against per-channel and
+    global rate limits, then delivered to whoever subscribed to the channel after latency seconds."""
+
+    def __init__(self, channel_limit=(5, 5.0), global_limit=(50, 1.0), latency=0.0):
+
+        self.channel_limit = channel_limit
+        self.channel_buckets = {}
+        self.global_bucket = admission.TokenBucket(*global_limit)
+        self.latency = latency
+        self.subscribers = {}
+        self.sent = 0
+        self.sent_chars = 0
+        self.rejected = 0
+
+    def subscribe(self, channel_id, callback):
+
+        self.subscribers[channel_id] = callback
+
+    async def send(self, channel_id, text):
+
+        if len(text) > player.MAX_MESSAGE_SIZE:
+            raise ValueError("Message too long: {} characters".format(len(text)))
+
+        bucket = self.channel_buckets.get(channel_id)
+        if bucket is None:
+            bucket = self.channel_buckets[channel_id] = admission.TokenBucket(*self.channel_limit)
+        for b in (bucket, self.global_bucket):
+            wait = b.wait_time()
+            if wait > 0:
+                self.rejected += 1
+                raise RateLimited(wait)
+        bucket.take()
+        self.global_bucket.take()
+
+        self.sent += 1
+        self.sent_chars += len(text)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        callback = self.subscribers.get(channel_id)
+        if callback is not None:
+            callback(text)
+
+
+class GameAdapter:
+
+    """Connects the engine to a gateway. Commands come in through on_message, output goes out through
+    the gateway in coalesced, rate-limited messages. Each player's channel id is their discord id.
+    Pass an admission.Admission as admission_control to limit how fast each player's commands go in."""
+
+    def __init__(self, engine, gateway, max_size=player.MAX_MESSAGE_SIZE, channel_limit=(5, 5.0),
+                 global_limit=(50, 1.0), admission_control=None):
+
+        self.engine = engine
+        self.gateway = gateway
+        self.max_size = max_size
+        self.channel_limit = channel_limit
+        self.global_bucket = admission.TokenBucket(*global_limit)  # keep under the gateway's limits ourselves
+        # rather than relying on being told off
+        self.loop = asyncio.get_running_loop()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)  # the engine runs one
+        # command at a time anyway, see Player.command_lock
+        self.outboxes = {}  # channel id: asyncio.Queue of (text, time the command was received)
+        self.senders = {}
+        self.admission_control = admission_control
+        self.latencies = []  # seconds from receiving a command to its output being delivered
+        self.commands = 0
+        self.outputs = 0
+        self.messages = 0
+        engine.notification_handler = self.notify
+
+    def notify(self, discord_id, message):
+
+        """Called by the engine, on its worker thread, with news of other players"""
+
+        self.loop.call_soon_threadsafe(self.enqueue, discord_id, message, None)
+
+    def enqueue(self, channel_id, text, received_at):
+
+        if not text:
+            return
+        outbox = self.outboxes.get(channel_id)
+        if outbox is None:
+            outbox = self.outboxes[channel_id] = asyncio.Queue()
+            self.senders[channel_id] = self.loop.create_task(self.sender(channel_id, outbox))
+        self.outputs += 1
+        outbox.put_nowait((text, received_at))
+
+    async def start_game(self, discord_id, name, join=None):
+
+        def start():
+            with headless.quiet():
+                _, out = headless.new_character(self.engine, discord_id, name, join=join)
+            return out
+
+        out = await self.loop.run_in_executor(self.executor, start)
+        self.enqueue(discord_id, out, None)
+
+    async def on_message(self, discord_id, text):
+
+        """A message typed by a player. Anything without the command prefix is just chat and ignored"""
+
+        if not text.startswith(PREFIX):
+            return
+        received_at = time.monotonic()
+        self.commands += 1
+        command = text[len(PREFIX):]
+
+        def run():
+            with headless.quiet():
+                return self.engine.process_command(command, discord_id)
+
+        if self.admission_control is None:
+            out = await self.loop.run_in_executor(self.executor, run)
+        else:
+            status, out = await self.admission_control.run(discord_id, command,
+                                                           lambda: self.loop.run_in_executor(self.executor, run))
+            if status == admission.COALESCED:
+                return  # the reply to the same command already waiting answers this one too
+            if status == admission.REJECTED:
+                out = BUSY.format(command)
+        self.enqueue(discord_id, out, received_at)
+
+    async def sender(self, channel_id, outbox):
+
+        """Sends everything queued for a channel, merging whatever piles up while waiting for the
+        rate limit into as few messages as possible"""
+
+        bucket = admission.TokenBucket(*self.channel_limit)
+        while True:
+            batch = [await outbox.get()]
+            await self.wait_for_token(bucket)  # anything that arrives meanwhile goes in the same message
+            while not outbox.empty():
+                batch.append(outbox.get_nowait())
+
+            text = "\n".join(x[0].rstrip("\n") for x in batch)
+            for i, chunk in enumerate(player.split_message(text, self.max_size)):
+                if i > 0:
+                    await self.wait_for_token(bucket)
+                await self.send(channel_id, chunk)
+
+            delivered = time.monotonic()
+            for _, received_at in batch:
+                if received_at is not None:
+                    self.latencies.append(delivered - received_at)
+
+    async def wait_for_token(self, bucket):
+
+        while not bucket.take():
+            await asyncio.sleep(bucket.wait_time())
+        while not self.global_bucket.take():
+            await asyncio.sleep(self.global_bucket.wait_time())
+
+    async def send(self, channel_id, text):
+
+        while True:
+            try:
+                await self.gateway.send(channel_id, text)
+                self.messages += 1
+                return
+            except RateLimited as e:  # e.g. the global limit, which the channel's bucket doesn't know about
+                await asyncio.sleep(e.retry_after)
+
+    async def close(self):
+
+        for task in self.senders.values():
+            task.cancel()
+        await asyncio.gather(*self.senders.values(), return_exceptions=True)
+        self.executor.shutdown()
+
+    def report(self):
+
+        latencies = sorted(self.latencies)
+        report = {"commands": self.commands,
+                  "outputs": self.outputs,
+                  "messages_sent": self.messages,
+                  "amplification": self.messages / self.commands if self.commands else 0.0,
+                  "rejected_by_gateway": self.gateway.rejected,
+                  "p50_ms": loadgen.percentile(latencies, 50) * 1000,
+                  "p95_ms": loadgen.percentile(latencies, 95) * 1000,
+                  "p99_ms": loadgen.percentile(latencies, 99) * 1000}
+        if self.admission_control is not None:
+            report.update(self.admission_control.counts)
+        return report
+
+
+async def start_user(adapter, gateway, bot, join):
+
+    replies = asyncio.Queue()
+    gateway.subscribe(bot.discord_id, replies.put_nowait)
+    await adapter.start_game(bot.discord_id, bot.name, join)
+    bot.observe(await replies.get())
+    return replies
+
+
+async def fake_user(adapter, bot, replies, commands, think):
+
+    """A user who waits to see the game's reply before typing the next command"""
+
+    for x in range(commands):
+        await adapter.on_message(bot.discord_id, PREFIX + bot.next_command())
+        reply = await replies.get()
+        while not replies.empty():
+            reply += replies.get_nowait()
+        bot.observe(reply)
+        if "You have died..." in reply:
+            break
+        if think:
+            await asyncio.sleep(bot.rng.uniform(0, 2 * think))
+
+
+async def spammer(adapter, bot, replies, commands):
+
+    """A user who types commands as fast as they can without waiting for the replies"""
+
+    sent = []
+    for x in range(commands):
+        sent.append(asyncio.ensure_future(adapter.on_message(bot.discord_id, PREFIX + bot.next_command())))
+        await asyncio.sleep(0)
+        while not replies.empty():
+            bot.observe(replies.get_nowait())
+    await asyncio.gather(*sent)
+
+
+async def simulate(players=10, commands=50, think=0.0, channel_limit=(5, 5.0), global_limit=(50, 1.0),
+                   latency=0.0, shared_world=False, seed=0, spammers=0, admission_policy=None, max_queued=5,
+                   max_concurrent=4):
+
+    """Run players fake users for commands commands each, and spammers users flooding the game with as
+    many, and return the adapter's report. Commands only go through admission control if an
+    admission_policy is given."""
+
+    gateway = FakeGateway(channel_limit, global_limit, latency)
+    engine = headless.new_engine()
+    control = None
+    if admission_policy is not None:
+        control = admission.Admission(engine.command_dict, max_queued=max_queued, policy=admission_policy,
+                                      max_concurrent=max_concurrent)
+    adapter = GameAdapter(engine, gateway, channel_limit=channel_limit, global_limit=global_limit,
+                          admission_control=control)
+    bots = [loadgen.Bot(x, dict(loadgen.DEFAULT_POLICY), random.Random(seed * 100003 + x))
+            for x in range(players + spammers)]
+
+    start = time.monotonic()
+    inboxes = []
+    for bot in bots:
+        join = 0 if shared_world and bot.discord_id != 0 else None  # everyone joins the first player
+        inboxes.append(await start_user(adapter, gateway, bot, join))
+    await asyncio.gather(*(fake_user(adapter, bot, replies, commands, think) if bot.discord_id < players
+                           else spammer(adapter, bot, replies, commands)
+                           for bot, replies in zip(bots, inboxes)))
+    wall = time.monotonic() - start
+    await adapter.close()
+
+    report = adapter.report()
+    report["wall_seconds"] = wall
+    return report
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Simulate users playing through the fake gateway")
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--commands", type=int, default=50, help="commands per player")
+    parser.add_argument("--think", type=float, default=0.0, help="average seconds between a reply and the next command")
+    parser.add_argument("--channel-limit", default="50/1", help="messages/seconds per channel, Discord's is 5/5")
+    parser.add_argument("--global-limit", default="500/1", help="messages/seconds overall, Discord's is 50/1")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the gateway takes to deliver a message")
+    parser.add_argument("--shared-world", action="store_true", help="everyone plays in the same world")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--spammers", type=int, default=0, help="extra users who don't wait for replies")
+    parser.add_argument("--admission", choices=admission.POLICIES, help="put admission control in front of the engine, "
+                                                                        "with this policy for full queues")
+    parser.add_argument("--max-queued", type=int, default=5, help="commands each user can have waiting")
+    parser.add_argument("--max-concurrent", type=int, default=4, help="commands handed to the engine at once")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(simulate(args.players, args.commands, args.think, parse_limit(args.channel_limit),
+                                  parse_limit(args.global_limit), args.latency, args.shared_world, args.seed,
+                                  args.spammers, args.admission, args.max_queued, args.max_concurrent))
+    for k, v in report.items():
+        print("{:<20}{}".format(k, round(v, 3) if isinstance(v, float) else v))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
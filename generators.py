@@ -3,6 +3,9 @@ for populating the game world."""
 
 
 from game_items import *
+import journal
+import rng
+import textstore
 from collections import namedtuple
 # the following are to do introspection to get the item classes from game_items.py
 import sys
@@ -15,10 +18,7 @@ chance = MyThing.chance  # convenient name to use the static class method for ra
 COMMON_ITEMS = []
 RARE_ITEMS = []
 UNIQUE_ITEMS = []
-# todo: temp variables to prevent closed world
-ROOMS = 0
-EXITS = 0
-GUARANTEE_EXIT = True  # the first time
+ROOMS = 0  # generated by this process, for introspect
 
 for name, obj in inspect.getmembers(sys.modules["game_items"]):
     if inspect.isclass(obj):
@@ -56,9 +56,9 @@ def random_item():
     whereas we want to return specific instances of those classes."""
 
     if chance(10):
-        return random.choice(RARE_ITEMS)()
+        return rng.current.choice(RARE_ITEMS)()
     else:
-        return random.choice(COMMON_ITEMS)()
+        return rng.current.choice(COMMON_ITEMS)()
 
 
 def random_doodad():
@@ -73,15 +73,13 @@ def random_room(came_from, direction, special_item=None):
     """update this later for special rooms etc"""
 
     global ROOMS
-    global EXITS
-    global GUARANTEE_EXIT
 
     if chance(10):
         ld = True
     else:
         ld = False
 
-    nu = Room(came_from, direction, locked_door=ld, guaranteed_exit=GUARANTEE_EXIT)
+    nu = Room(came_from, direction, locked_door=ld)
     if chance(99):
         for x in random_room_contents():
             nu.add_item(x)
@@ -94,13 +92,8 @@ def random_room(came_from, direction, special_item=None):
             nu.add_monster(random_monster(special_item))
 
     ROOMS += 1
-    EXITS += (len(nu.neighbours) - 1)
-    if ROOMS >= EXITS:
-        GUARANTEE_EXIT = True
-    else:
-        GUARANTEE_EXIT = False
-
-    print(ROOMS, EXITS)
+    print(ROOMS, nu.world.open_exits)
+    journal.record("new_room", nu)  # no undo, once a room has been explored it stays on the map
 
     return nu
 
@@ -110,7 +103,7 @@ def random_contents():
     """Random objects to put in containers and rooms"""
 
     out = []
-    for x in range(random.randint(0, 2)):
+    for x in range(rng.current.randint(0, 2)):
         out.append(random_item())
     return out
 
@@ -118,7 +111,7 @@ def random_contents():
 def random_doodads():
 
     to_return = []
-    for x in range(random.randint(0, 4)):
+    for x in range(rng.current.randint(0, 4)):
         to_return.append(random_doodad())
 
     return to_return
@@ -162,7 +155,7 @@ def random_room_contents():
 def get_corpse(typ):
 
     cor = Corpse()
-    cor.__doc__ = "{} corpse".format(typ)
+    cor.__doc__ = textstore.intern("{} corpse".format(typ))
     cor.desc = descriptive_strings.get_corpse_string(typ)
 
     return cor
@@ -170,9 +163,10 @@ def get_corpse(typ):
 
 def random_key_colour():
 
-    return random.choice(["red", "orange", "yellow", "green", "blue", "purple"])
+    return rng.current.choice(["red", "orange", "yellow", "green", "blue", "purple"])
 
 
+@textstore.interned  # only a few dozen different doors, one shared string for each
 def random_door_description():
 
     # TODO: maybe move whole thing into descriptive strings
@@ -180,6 +174,11 @@ def random_door_description():
     return descriptive_strings.do_sub_recursive(doorstr)
 
 
+Ability = namedtuple("Ability", ("name", "hit_chance", "stat", "power", "typ", "friendly_description"))
+# use named tuple for extensibility later. Defined once here rather than in random_ability so that
+# abilities can be pickled for journal snapshots
+
+
 def random_ability(typ="attack", weak=False):
 
     """weak abilities are for monsters"""
@@ -189,16 +188,13 @@ def random_ability(typ="attack", weak=False):
     else:
         power_numerator = 1000
 
-    abtup = namedtuple("ability", ("name", "hit_chance", "stat", "power", "typ", "friendly_description"))
-    # use named tuple for extensibility later
-
-    hit_chance = random.normalvariate(55, 22)  # not a completely uniform distribution
+    hit_chance = rng.current.normalvariate(55, 22)  # not a completely uniform distribution
     while not (20 < hit_chance < 95):
-        hit_chance = random.normalvariate(50, 25)
+        hit_chance = rng.current.normalvariate(50, 25)
 
-    stat = random.choice(["[MOXIE]", "[STRENGTH]", "[SPEED]"])
+    stat = rng.current.choice(["[MOXIE]", "[STRENGTH]", "[SPEED]"])
     power = power_numerator/hit_chance
-    mult = float(random.randint(80, 120))
+    mult = float(rng.current.randint(80, 120))
 
     hit_chance = int(hit_chance)  # maths is now done and can convert to int
 
@@ -226,7 +222,7 @@ def random_ability(typ="attack", weak=False):
     friendly_stat = stat[1:-1].lower()
     friendly_desc = make_attribute_description(true_name, hit_chance, friendly_stat, true_power, typ)
 
-    return abtup(true_name, hit_chance, friendly_stat, true_power, typ, friendly_desc)
+    return Ability(true_name, hit_chance, friendly_stat, true_power, typ, friendly_desc)
 
 
 def make_attribute_description(nam, hit_chance, stat, power, typ):
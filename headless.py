@@ -0,0 +1,54 @@
+"""Helpers to run the game without the command-line interface in game_runner.py, e.g. for benchmarks
+and other scripts that drive Player.process_command directly."""
+
+import contextlib
+import io
+
+import player
+import character
+import generators
+from things import MyThing
+
+
+def quiet():
+
+    """Context manager that swallows the debug prints scattered around the engine
+    (room counters, countdown ticks etc) so they don't drown out the actual output"""
+
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def new_engine():
+
+    """Make a fresh game engine and point all the engine references at it, the same as game_runner.py does"""
+
+    return adopt_engine(player.Player())
+
+
+def adopt_engine(engine):
+
+    """Point all the engine references at engine, e.g. one loaded from a journal snapshot"""
+
+    character.EngineReference.pr = engine
+    MyThing.er = engine
+    return engine
+
+
+def new_character(engine, discord_id, name=None, start=True, seed=None, join=None):
+
+    """Register a new character with the engine and optionally start their game. Pass a seed to
+    always generate the same game, and the discord id of another character as join to start in
+    their world. Returns the character and the first output of the game (or None if not started)"""
+
+    char = character.Character(seed)
+    char.discord_id = discord_id
+    char.name = name or "player{}".format(discord_id)
+    engine.current_character = char  # so the starting weapon knows who holds it
+    char.random_abilities()
+    engine.known_characters[discord_id] = char
+
+    first_output = None
+    if start:
+        first_output = engine.start_game(discord_id, join)
+
+    return char, first_output
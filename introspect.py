@@ -0,0 +1,154 @@
+"""What's in the game and how much memory it takes, for admins to look at on a live server.
+
+    report = introspect.report(engine)
+
+gives the whole process, and session(engine, character) one player's session: the world they're in
+and everyone sharing it. Both take the engine's command lock, so they never see a command half done,
+and the results are plain dicts that can be turned into JSON.
+
+Memory is estimated rather than measured: the first SAMPLE objects of each type that are counted
+have their size worked out (the object, its attribute dict, and the containers and strings in it),
+and every object of that type is assumed to take the average. Walking a world is the expensive
+part, so the counts for each world are kept until one of its players does something, which is the
+only time a world changes. Polling every few seconds only recounts the worlds that were played in."""
+
+import sys
+import time
+import tracemalloc
+import weakref
+
+import generators
+import things
+
+SAMPLE = 10  # objects of each type whose size is worked out
+_sizes = {}  # type: sizes of the objects sampled so far
+_counted = weakref.WeakKeyDictionary()  # world: (latest activity of its players when counted, counts by type)
+
+
+def size_of(obj):
+
+    """Bytes taken by obj, its attribute dict, and the containers and strings directly in it"""
+
+    size = sys.getsizeof(obj)
+    attrs = getattr(obj, "__dict__", None)
+    if attrs is not None:
+        size += sys.getsizeof(attrs)
+        for value in attrs.values():
+            if isinstance(value, (dict, list, set, tuple, str, bytes)):
+                size += sys.getsizeof(value)
+    return size
+
+
+def add(counts, obj):
+
+    typ = type(obj)
+    counts[typ] = counts.get(typ, 0) + 1
+    sizes = _sizes.setdefault(typ, [])
+    if len(sizes) < SAMPLE:
+        sizes.append(size_of(obj))
+
+
+def count_world(world, characters):
+
+    """{type: how many} of everything in world and carried by characters"""
+
+    counts = {}
+    for room in world.rooms.values():
+        add(counts, room)
+        inside = list(room.contents)
+        while inside:
+            thing = inside.pop()
+            add(counts, thing)
+            inside.extend(getattr(thing, "contents", ()))  # in a box, say
+        for monster in room.monsters:
+            add(counts, monster)
+            for item in (monster.weapon, monster.specific_loot):
+                if item is not None:
+                    add(counts, item)
+    for char in characters:
+        add(counts, char)
+        for item in char.inventory:
+            add(counts, item)
+    return counts
+
+
+def counts_for(world, characters, engine):
+
+    latest = max(engine.last_active.get(c.discord_id, 0) for c in characters)
+    cached = _counted.get(world)
+    if cached is None or cached[0] != latest:
+        cached = _counted[world] = (latest, count_world(world, characters))
+    return cached[1]
+
+
+def estimate(typ, count):
+
+    sizes = _sizes[typ]
+    return count * sum(sizes) // len(sizes)
+
+
+def summarise(world, characters, counts):
+
+    return {"players": [c.discord_id for c in characters],
+            "rooms": len(world.rooms),
+            "monsters": sum(n for typ, n in counts.items() if issubclass(typ, things.Monster)),
+            "items": sum(n for typ, n in counts.items() if issubclass(typ, things.Item)),
+            "bytes": sum(estimate(typ, n) for typ, n in counts.items()),
+            "dungeon": world.store is not None}
+
+
+def worlds(engine):
+
+    """{world: [its characters]} of the characters in memory who have started playing"""
+
+    out = {}
+    for char in engine.known_characters.values():
+        if char.location is not None:
+            out.setdefault(char.location.world, []).append(char)
+    return out
+
+
+def session(engine, character):
+
+    """The rooms, monsters and items in character's world and the memory they take"""
+
+    with engine.command_lock:
+        world = character.location.world
+        characters = worlds(engine).get(world, [character])
+        return summarise(world, characters, counts_for(world, characters, engine))
+
+
+def report(engine, top=5):
+
+    """Everything in the process: totals, memory by type, and the top largest sessions"""
+
+    start = time.perf_counter()
+    with engine.command_lock:
+        sessions = []
+        by_type = {}
+        queued = sum(1 for x in engine.item_queue if x is not None)
+        for world, characters in worlds(engine).items():
+            queued += sum(1 for x in world.item_queue if x is not None)
+            counts = counts_for(world, characters, engine)
+            sessions.append(summarise(world, characters, counts))
+            for typ, n in counts.items():
+                by_type[typ] = by_type.get(typ, 0) + n
+
+        memory = {typ.__name__: {"count": n, "bytes": estimate(typ, n)} for typ, n in by_type.items()}
+        out = {"characters": len(engine.known_characters),
+               "sessions": len(sessions),
+               "evicted_characters": 0 if engine.sessions is None else len(engine.sessions.evicted),
+               "rooms_generated": generators.ROOMS,
+               "rooms": sum(s["rooms"] for s in sessions),
+               "monsters": sum(s["monsters"] for s in sessions),
+               "items": sum(s["items"] for s in sessions),
+               "queued_items": queued,
+               "countdowns": len(engine.registered_countdowns),
+               "bytes": sum(s["bytes"] for s in sessions),
+               "memory": dict(sorted(memory.items(), key=lambda kv: -kv[1]["bytes"])),
+               "largest": sorted(sessions, key=lambda s: -s["bytes"])[:top]}
+
+    if tracemalloc.is_tracing():
+        out["traced_bytes"] = tracemalloc.get_traced_memory()[0]  # measured, if anyone's tracing
+    out["seconds"] = time.perf_counter() - start
+    return out
@@ -0,0 +1,151 @@
+"""Everything a character is carrying, in one place.
+
+Items are either held (carried in the bag) or equipped (worn or wielded, one per slot). Besides
+those two insertion-ordered sets (dicts with None values, like the rest of the engine) the
+inventory indexes the held items by display name and by item class, and the equipped ones by
+slot, all updated as items come and go. So checking whether something is carried or equipped,
+finding the bandages, and equipping and unequipping are all O(1) however much is being carried.
+
+An inventory can have a limit on the number of items, on their total weight (Item.weight), or
+both. add() and equip() don't check them, call room_for() first."""
+
+
+class Inventory:
+
+    def __init__(self, capacity=None, max_weight=None):
+
+        self.capacity = capacity  # the most items that can be carried, None for no limit
+        self.max_weight = max_weight
+        self.held = {}
+        self.equipped = {}
+        self.slots = {"head": None, "body": None, "right hand": None, "left hand": None}
+        self.weapon = None  # the equipped item used to hit things in combat
+        self.names = {}  # display name: held items, as an ordered set
+        self.types = {}  # item class: held items, as an ordered set
+        self.weight = 0
+
+    def __contains__(self, item):
+
+        return item in self.held or item in self.equipped
+
+    def __len__(self):
+
+        return len(self.held) + len(self.equipped)
+
+    def __iter__(self):
+
+        """The equipped items, then the held ones"""
+
+        yield from self.equipped
+        yield from self.held
+
+    def is_equipped(self, item):
+
+        return item in self.equipped
+
+    def room_for(self, item):
+
+        """None if item can be carried on top of everything else, otherwise why not"""
+
+        if item in self:
+            return None
+        if self.capacity is not None and len(self) >= self.capacity:
+            return "You can't carry any more things."
+        if self.max_weight is not None and self.weight + item.weight > self.max_weight:
+            return "The {} is too heavy, you're carrying too much already.".format(item.__doc__)
+        return None
+
+    def named(self, name):
+
+        """The held items called name (their __doc__), oldest first"""
+
+        return list(self.names.get(name, ()))
+
+    def matching_names(self, words):
+
+        """The names of the items words refers to: the name it is, otherwise any name it's part of,
+        or failing that the same for words without a plural s"""
+
+        for attempt in (words, words[:-1] if words.endswith("s") else None):
+            if not attempt:
+                continue
+            if attempt in self.names:
+                return [attempt]
+            partial = [name for name in self.names if attempt in name]
+            if partial:
+                return partial
+        return []
+
+    def of_type(self, cls):
+
+        """The items that are instances of cls, including its subclasses"""
+
+        return [item for item in self.equipped if isinstance(item, cls)] + \
+            [item for typ, items in self.types.items() if issubclass(typ, cls) for item in items]
+
+    def distinct_held(self):
+
+        """The first held item with each name. When thousands of bandages are being carried,
+        matching a command against their name only needs doing once."""
+
+        return [next(iter(group)) for group in self.names.values()]
+
+    def counts(self):
+
+        """{name: how many are held}, in the order they were picked up"""
+
+        return {name: len(group) for name, group in self.names.items()}
+
+    def hold(self, item):
+
+        self.held[item] = None
+        self.names.setdefault(item.__doc__, {})[item] = None
+        self.types.setdefault(type(item), {})[item] = None
+
+    def unhold(self, item):
+
+        del self.held[item]
+        for index, key in ((self.names, item.__doc__), (self.types, type(item))):
+            group = index[key]
+            del group[item]
+            if not group:
+                del index[key]
+
+    def add(self, item):
+
+        """Put item in the bag"""
+
+        self.hold(item)
+        self.weight += item.weight
+
+    def remove(self, item):
+
+        """Take item out, whether it's held or equipped. Returns whether it was equipped."""
+
+        equipped = item in self.equipped
+        if equipped:
+            self.unequip(item)
+        self.unhold(item)
+        self.weight -= item.weight
+        return equipped
+
+    def equip(self, item, slot):
+
+        """Equip item in slot, taking it out of the bag if it was in there"""
+
+        if item in self.held:
+            self.unhold(item)
+        else:
+            self.weight += item.weight
+        self.equipped[item] = None
+        self.slots[slot] = item
+
+    def unequip(self, item):
+
+        """Put an equipped item back in the bag"""
+
+        del self.equipped[item]
+        for slot, held in self.slots.items():
+            if held is item:
+                self.slots[slot] = None
+        self.hold(item)
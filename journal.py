@@ -0,0 +1,209 @@
+"""Journal of every change to the game state, with periodic snapshots, for crash recovery, undo and
+analytics.
+
+The game code reports each change as it makes it:
+
+    journal.record("add_item", self, item, undo=lambda: self.remove_item(item))
+
+Each event is written to the journal file as a short JSON list, [sequence number, kind, fields...],
+with the game objects in it described by name (rooms by their world's number and grid coordinates,
+characters by discord id), which is what the analytics need. Every command and character start is
+written too, as "command" and "start" events.
+
+The undo function is only kept in memory. The ones from the last command make up the undo
+command: running them newest first puts back everything the command changed.
+
+Every snapshot_every events, after a command finishes, the whole engine is pickled to the
+snapshot file. To recover after a crash, recover() loads the snapshot and re-runs the commands
+journalled after it. All the randomness comes from the random streams in the snapshot, so this
+rebuilds exactly the same state, in time proportional to the commands since the snapshot. The
+changes in between don't need to be applied one by one.
+
+Like metrics, this does nothing until a journal is started, see Player.start_journal."""
+
+import json
+import os
+import pickle
+
+import rng
+
+active = None  # the Journal being written to, None when journalling is off
+
+
+def record(kind, *fields, undo=None):
+
+    if active is not None:
+        active.record(kind, fields, undo)
+
+
+def changed(obj, attr, old):
+
+    """Record that obj.attr was just changed from old"""
+
+    if active is not None:
+        active.record("set", (obj, attr, getattr(obj, attr)), lambda: setattr(obj, attr, old))
+
+
+def describe(x):
+
+    """How a field of an event is written to the file"""
+
+    if x is None or isinstance(x, (str, int, float, bool)):
+        return x
+    if hasattr(x, "coords") and hasattr(x, "neighbours"):
+        return [x.world.number, *x.coords]  # a room
+    if hasattr(x, "discord_id"):
+        return x.discord_id  # a character
+    if isinstance(x, dict):
+        return {k: describe(v) for k, v in x.items()}
+    return getattr(x, "__doc__", None) or type(x).__name__
+
+
+class Journal:
+
+    def __init__(self, path, engine, snapshot_every=1000):
+
+        self.path = path
+        self.snapshot_path = path + ".snapshot"
+        self.engine = engine
+        self.snapshot_every = snapshot_every
+        self.file = open(path, "a", encoding="utf-8")
+        self.sequence = 0
+        self.since_snapshot = 0
+        self.undoing = False
+        self.replaying = False  # recovering, the events are already in the file
+        self.character = None  # whose command is running
+        self.undos = []  # the undo functions of the running command
+        self.last = (None, [])  # the character and undo functions of the last command to finish
+
+    def record(self, kind, fields, undo):
+
+        if self.undoing:
+            return  # putting things back, that's not a change of its own
+        self.sequence += 1
+        self.since_snapshot += 1
+        self.write([self.sequence, kind] + [describe(x) for x in fields])
+        if undo is not None:
+            self.undos.append(undo)
+
+    def write(self, event):
+
+        if self.replaying:
+            return
+        self.file.write(json.dumps(event, separators=(",", ":")))
+        self.file.write("\n")
+
+    def begin(self, character):
+
+        self.character = character
+        self.undos = []
+
+    def started(self, discord_id, name, seed, join):
+
+        self.record("start", (discord_id, name, seed, join), None)
+        self.finish()
+
+    def command(self, discord_id, command):
+
+        self.record("command", (discord_id, command), None)
+        self.finish()
+
+    def finish(self):
+
+        """The end of a command, written only once the command has finished so that recovery
+        never re-runs half a command"""
+
+        self.last = (self.character, self.undos)
+        self.character = None
+        self.undos = []
+        self.file.flush()
+        if self.since_snapshot >= self.snapshot_every and not self.replaying:
+            self.snapshot()
+
+    def undo(self, character):
+
+        """Puts back everything character's last command changed, if nobody has done anything since.
+        Returns whether there was anything to undo."""
+
+        who, undos = self.last
+        if who is not character or not undos:
+            return False
+        self.undoing = True
+        try:
+            for func in reversed(undos):
+                func()
+        finally:
+            self.undoing = False
+        self.last = (None, [])
+        return True
+
+    def snapshot(self):
+
+        """Save the whole game. The undo functions can't be saved, so it isn't possible to undo the
+        command before a snapshot, after recovering or otherwise."""
+
+        state = {"sequence": self.sequence,
+                 "engine": self.engine,
+                 "rng": rng.current}
+        temp = self.snapshot_path + ".tmp"
+        with open(temp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, self.snapshot_path)  # a crash while saving leaves the last snapshot intact
+        self.write([self.sequence, "snapshot"])
+        self.file.flush()
+        self.since_snapshot = 0
+        self.last = (None, [])
+
+    def close(self):
+
+        self.file.close()
+
+
+def recover(path, snapshot_every=1000):
+
+    """Rebuild the engine from a journal's last snapshot and the commands after it, and carry on
+    journalling to the same file. Returns the engine."""
+
+    import headless  # not at the top, headless imports player, which imports this module
+
+    sequence = 0
+    if os.path.exists(path + ".snapshot"):
+        with open(path + ".snapshot", "rb") as f:
+            state = pickle.load(f)
+        sequence = state["sequence"]
+        engine = state["engine"]
+        headless.adopt_engine(engine)
+        rng.current = state["rng"]
+    else:
+        engine = headless.new_engine()
+
+    redo = []
+    read = 0
+    good = 0  # length of the file up to the end of the last command to finish
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                break  # the last line was cut off by the crash
+            read += len(line)
+            if event[1] in ("start", "command", "snapshot"):
+                good = read
+                if event[0] > sequence and event[1] != "snapshot":
+                    redo.append(event)
+    with open(path, "r+b") as f:
+        f.truncate(good)  # the changes made by a command that never finished will be numbered again
+
+    log = engine.start_journal(path, snapshot_every)
+    log.sequence = sequence
+    log.replaying = True
+    with headless.quiet():
+        for event in redo:
+            if event[1] == "start":
+                _, _, discord_id, name, seed, join = event
+                headless.new_character(engine, discord_id, name, seed=seed, join=join)
+            else:
+                _, _, discord_id, command = event
+                engine.process_command(command, discord_id)
+    log.replaying = False
+    return engine
@@ -0,0 +1,297 @@
+"""Load generator that drives lots of synthetic players at once, to find out how many concurrent
+players one worker can sustain.
+
+Each bot only looks at the text the game sends back, the same as a real player would, so the
+same bots can be pointed at the in-process engine or at a local front-end over HTTP.
+
+Usage:
+    python loadgen.py --players 50 --commands 20000
+    python loadgen.py --policy explore=1,fight=3,loot=1,use=1,mistype=0.2
+    python loadgen.py --url http://localhost:8080 --players 20"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+
+import headless
+import player
+
+DIRECTIONS = ["north", "south", "east", "west"]
+DEFAULT_POLICY = {"explore": 3, "fight": 2, "loot": 3, "use": 1, "mistype": 0.3}
+
+exits_finder = re.compile(r"exits? to the ([a-z, ]+?)(?:\.|$| The exit)", re.MULTILINE)
+contents_finder = re.compile(r"^The room contains: (.*)$", re.MULTILINE)
+inside_finder = re.compile(r"^Inside the .* there is: (.*)$", re.MULTILINE)
+pickup_finder = re.compile(r"^You picked up an? (.*)$", re.MULTILINE)
+encounter_finder = re.compile(r"^You have encountered an? ", re.MULTILINE)
+
+
+class InProcessTarget:
+
+    """Sends commands straight to a Player object in this process"""
+
+    def __init__(self, seed=None):
+
+        self.engine = headless.new_engine()
+        self.seeds = random.Random(seed)  # every character gets its own seed, but the run is reproducible
+
+    def start(self, discord_id, name):
+
+        _, first_output = headless.new_character(self.engine, discord_id, name, seed=self.seeds.getrandbits(64))
+        return first_output
+
+    def send(self, discord_id, command):
+
+        return self.engine.process_command(command, discord_id)
+
+
+class HTTPTarget:
+
+    """Sends commands to a front-end running locally. The front-end is expected to accept a POST of
+    {"discord_id": ..., "command": ...} to /command and {"discord_id": ..., "name": ...} to /start,
+    replying with the game's output as plain text."""
+
+    def __init__(self, url):
+
+        self.url = url.rstrip("/")
+
+    def post(self, path, payload):
+
+        request = urllib.request.Request(self.url + path, data=json.dumps(payload).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            return response.read().decode("utf-8")
+
+    def start(self, discord_id, name):
+
+        return self.post("/start", {"discord_id": discord_id, "name": name})
+
+    def send(self, discord_id, command):
+
+        return self.post("/command", {"discord_id": discord_id, "command": command})
+
+
+class Bot:
+
+    """A synthetic player. Picks what to do next using the policy weights and whatever it has
+    learned from the game's output so far."""
+
+    def __init__(self, discord_id, policy, rng):
+
+        self.discord_id = discord_id
+        self.name = "bot{}".format(discord_id)
+        self.policy = policy
+        self.rng = rng
+        self.exits = []
+        self.room_things = []
+        self.inventory = []
+        self.monster_here = False
+
+    def observe(self, output):
+
+        """Update what the bot knows about its surroundings from the text of the last command"""
+
+        if output is None:
+            return
+        found = exits_finder.findall(output)
+        if found:
+            self.exits = [x for x in DIRECTIONS if x in found[-1]]
+        found = contents_finder.findall(output)
+        if found:
+            self.room_things = [x for x in found[-1].split(", ") if x != "Nothing of interest"]
+            self.monster_here = False  # a new room description, find out again below
+        for found in inside_finder.findall(output):
+            self.room_things.extend(found.split(", "))
+        for thing in pickup_finder.findall(output):
+            self.inventory.append(thing)
+            if thing in self.room_things:
+                self.room_things.remove(thing)
+        if encounter_finder.search(output) or "attacks you!" in output or "chases you!" in output:
+            self.monster_here = True
+        if " died!" in output:
+            self.monster_here = False
+
+    def next_command(self):
+
+        actions = list(self.policy.keys())
+        action = self.rng.choices(actions, weights=[self.policy[x] for x in actions])[0]
+
+        if action == "explore":
+            return "go {}".format(self.rng.choice(self.exits or DIRECTIONS))
+        elif action == "fight":
+            if self.monster_here:
+                return "attack"
+            return "look"
+        elif action == "loot":
+            if self.room_things:
+                thing = self.rng.choice(self.room_things)
+                return "{} {}".format(self.rng.choice(("take", "open")), thing)
+            return "look"
+        elif action == "use":
+            if self.inventory:
+                item = self.inventory.pop(self.rng.randrange(len(self.inventory)))
+                return "{} {}".format(self.rng.choice(("use", "equip")), item)
+            return "status"
+        else:
+            return self.mistype(self.rng.choice(["look", "go north", "take bandages", "attack"]))
+
+    def mistype(self, command):
+
+        """Swap two neighbouring letters, like a player typing too fast"""
+
+        i = self.rng.randrange(len(command) - 1)
+        return command[:i] + command[i + 1] + command[i] + command[i + 2:]
+
+
+class Stats:
+
+    """Latency samples per verb, safe to add to from several threads"""
+
+    def __init__(self):
+
+        self.verbs = {alias for aliases in player.Player.command_aliases.values() for alias in aliases}
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def add(self, command, seconds):
+
+        verb = command.split(" ", maxsplit=1)[0]
+        if verb not in self.verbs:
+            verb = "<unrecognised>"
+        with self.lock:
+            self.samples[verb].append(seconds)
+
+    def total(self):
+
+        return sum(len(x) for x in self.samples.values())
+
+    def report(self, wall_time):
+
+        out = {"commands": self.total(),
+               "wall_seconds": wall_time,
+               "commands_per_second": self.total() / wall_time if wall_time else 0.0,
+               "verbs": {}}
+        for verb, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            out["verbs"][verb] = {"count": len(samples),
+                                  "p50_ms": percentile(samples, 50) * 1000,
+                                  "p95_ms": percentile(samples, 95) * 1000,
+                                  "p99_ms": percentile(samples, 99) * 1000}
+        return out
+
+
+def percentile(sorted_samples, pct):
+
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(pct / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def parse_policy(text):
+
+    """Turns e.g. "explore=3,fight=1" into a policy dict, unspecified actions keep their defaults"""
+
+    policy = dict(DEFAULT_POLICY)
+    if text:
+        for part in text.split(","):
+            key, value = part.split("=")
+            if key not in DEFAULT_POLICY:
+                raise ValueError("Unknown bot action: {}".format(key))
+            policy[key] = float(value)
+    return policy
+
+
+def step(target, bot, stats):
+
+    """Send the bot's next command and time it, restarting the bot if it died"""
+
+    command = bot.next_command()
+    start = time.perf_counter()
+    output = target.send(bot.discord_id, command)
+    stats.add(command, time.perf_counter() - start)
+    bot.observe(output)
+    if output and "You have died..." in output:
+        bot.__init__(bot.discord_id, bot.policy, bot.rng)  # forget everything, it's a new character
+        bot.observe(target.start(bot.discord_id, bot.name))
+
+
+def play(target, bot, stats, commands):
+
+    bot.observe(target.start(bot.discord_id, bot.name))
+    for x in range(commands):
+        step(target, bot, stats)
+
+
+def run(players=10, commands=1000, policy=None, seed=0, url=None):
+
+    """Drive players bots for commands commands in total and return the report dict.
+
+    In-process, the engine is single threaded like a real worker, so the bots take turns one command
+    at a time. Against a front-end every bot gets its own thread so requests really are concurrent."""
+
+    policy = policy or dict(DEFAULT_POLICY)
+    per_bot = max(1, commands // players)
+    bots = [Bot(x, policy, random.Random(seed * 100003 + x)) for x in range(players)]
+
+    stats = Stats()
+    if url:
+        target = HTTPTarget(url)
+        threads = [threading.Thread(target=play, args=(target, bot, stats, per_bot)) for bot in bots]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return stats.report(time.perf_counter() - start)
+
+    with headless.quiet():
+        target = InProcessTarget(seed)
+        start = time.perf_counter()
+        for bot in bots:
+            bot.observe(target.start(bot.discord_id, bot.name))
+        for x in range(per_bot):
+            for bot in bots:
+                step(target, bot, stats)
+        wall_time = time.perf_counter() - start
+
+    return stats.report(wall_time)
+
+
+def print_report(report):
+
+    print("{} commands in {:.2f}s: {:.0f} commands/s".format(
+        report["commands"], report["wall_seconds"], report["commands_per_second"]))
+    print("{:<16}{:>8}{:>10}{:>10}{:>10}".format("verb", "count", "p50 ms", "p95 ms", "p99 ms"))
+    for verb, row in report["verbs"].items():
+        print("{:<16}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}".format(
+            verb, row["count"], row["p50_ms"], row["p95_ms"], row["p99_ms"]))
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Drive synthetic players against the game")
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--commands", type=int, default=1000, help="total commands across all players")
+    parser.add_argument("--policy", help="bot action weights, e.g. explore=3,fight=2,loot=3,use=1,mistype=0.3")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="base url of a local front-end, otherwise runs in-process")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run(args.players, args.commands, parse_policy(args.policy), args.seed, args.url)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Low-overhead timing instrumentation for the engine.
+
+Code marks out the phases of a command with nested spans:
+
+    with metrics.span("execute"):
+        ...
+
+and the engine wraps each whole command in metrics.command(), labelling it with the verb once it
+has been parsed. Timings are aggregated in process into per-verb counters and histograms, and
+per-phase histograms keyed by the path of nested span names e.g. "execute/generate_room".
+Call snapshot() or prometheus_text() to export them.
+
+Everything is off until enable() is called. While disabled, span() and command() hand back a
+shared do-nothing object, so the instrumentation can be left in production code."""
+
+import bisect
+import time
+
+# histogram bucket upper bounds in seconds, the last bucket catches everything else
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+enabled = False
+_stack = []  # names of the spans currently open, innermost last
+_current_command = None
+
+
+class Histogram:
+
+    """Cumulative-style latency histogram with fixed buckets"""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def cumulative(self):
+
+        """(upper bound, count of observations <= bound) pairs, as Prometheus expects"""
+
+        out = []
+        running = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            running += count
+            out.append((bound, running))
+        return out
+
+    def as_dict(self):
+
+        return {"count": self.count,
+                "sum": self.total,
+                "buckets": [["+Inf" if bound == float("inf") else bound, count]
+                            for bound, count in self.cumulative()]}
+
+
+command_histograms = {}  # verb: Histogram
+phase_histograms = {}  # span path: Histogram
+
+
+def _observe(table, key, seconds):
+
+    try:
+        hist = table[key]
+    except KeyError:
+        hist = table[key] = Histogram()
+    hist.observe(seconds)
+
+
+class Span:
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+
+        self.name = name
+
+    def __enter__(self):
+
+        _stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+
+        elapsed = time.perf_counter() - self.start
+        _observe(phase_histograms, "/".join(_stack), elapsed)
+        _stack.pop()
+
+
+class CommandSpan:
+
+    """Times a whole command. The verb isn't known until the command has been parsed, so it
+    starts off unrecognised and is filled in by label()"""
+
+    __slots__ = ("verb", "start", "outer")
+
+    def __enter__(self):
+
+        global _current_command
+        self.verb = "unrecognised"
+        self.outer = _current_command
+        _current_command = self
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+
+        global _current_command
+        elapsed = time.perf_counter() - self.start
+        _observe(command_histograms, self.verb, elapsed)
+        _current_command = self.outer
+
+
+class NullSpan:
+
+    """Stands in for both kinds of span while metrics are disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc):
+
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name):
+
+    if enabled:
+        return Span(name)
+    return NULL_SPAN
+
+
+def command():
+
+    if enabled:
+        return CommandSpan()
+    return NULL_SPAN
+
+
+def label(verb):
+
+    """Set the verb of the command currently being timed"""
+
+    if _current_command is not None:
+        _current_command.verb = verb
+
+
+def enable():
+
+    global enabled
+    enabled = True
+
+
+def disable():
+
+    global enabled
+    enabled = False
+
+
+def reset():
+
+    command_histograms.clear()
+    phase_histograms.clear()
+
+
+def snapshot():
+
+    """All the metrics collected so far as a JSON-serialisable dict"""
+
+    return {"commands": {verb: hist.as_dict() for verb, hist in command_histograms.items()},
+            "phases": {path: hist.as_dict() for path, hist in phase_histograms.items()}}
+
+
+def prometheus_text():
+
+    """All the metrics collected so far in the Prometheus text exposition format"""
+
+    lines = ["# HELP snekquest_commands_total Commands processed, by verb.",
+             "# TYPE snekquest_commands_total counter"]
+    for verb, hist in command_histograms.items():
+        lines.append('snekquest_commands_total{{verb="{}"}} {}'.format(verb, hist.count))
+
+    for metric, label_name, table, help_text in (
+            ("snekquest_command_seconds", "verb", command_histograms, "Time to process a whole command."),
+            ("snekquest_phase_seconds", "phase", phase_histograms, "Time spent in each phase of a command.")):
+        lines.append("# HELP {} {}".format(metric, help_text))
+        lines.append("# TYPE {} histogram".format(metric))
+        for key, hist in table.items():
+            for bound, count in hist.cumulative():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(metric, label_name, key, le, count))
+            lines.append('{}_sum{{{}="{}"}} {}'.format(metric, label_name, key, hist.total))
+            lines.append('{}_count{{{}="{}"}} {}'.format(metric, label_name, key, hist.count))
+
+    return "\n".join(lines) + "\n"
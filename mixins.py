@@ -1,15 +1,51 @@
+import journal
+import stats
+
+
 class ContainerMixin:
 
-    """Objects that can contain other items"""
+    """Objects that can contain other items. Contents are held in a dict used as an
+    insertion-ordered set (values are always None) so that removal is O(1) even when
+    a room fills up with thousands of corpses and loot drops."""
 
     def add_item(self, item):
 
-        self.contents.append(item)
+        previous = getattr(item, "location", None)
+        self.contents[item] = None
         item.location = self  # so the item knows where it is
 
+        def undo():
+            self.remove_item(item)
+            item.location = previous
+        journal.record("add_item", self, item, undo=undo)
+
     def remove_item(self, item):
 
-        self.contents.remove(item)
+        del self.contents[item]
+        journal.record("remove_item", self, item, undo=lambda: self.add_item(item))
+
+
+class StatsMixin:
+
+    """Characters and monsters, which have stats. The values are kept in a stats.StatBlock in
+    self.stats, these attributes read and set them by name."""
+
+    strength = stats.Stat(stats.STRENGTH)
+    armour = stats.Stat(stats.ARMOUR)
+    speed = stats.Stat(stats.SPEED)
+    health = stats.Stat(stats.HEALTH)
+    moxie = stats.Stat(stats.MOXIE)
+
+    def unbuff(self):
+
+        """Remove the buffs from the abilities used in a combat, the combat engine does this at the end"""
+
+        removed = self.stats.remove_all(stats.BUFF)
+        if removed:
+            def undo():
+                for modifier in removed:
+                    self.stats.add(*modifier)
+            journal.record("unbuff", self, undo=undo)
 
 
 class EquippableMixin:
@@ -21,6 +57,10 @@ class EquippableMixin:
         if not self.held_by_player():
             # in case player sees something in a room and immediately equips it
             # without picking it up first
+            reason = self.pr.inventory.room_for(self)
+            if reason is not None:
+                self.log(reason)
+                return
             self.location.remove_item(self)
             self.location = "PLAYER"
         self.pr.equip(self)
@@ -42,20 +82,14 @@ class EquippableMixin:
         """Default method assumes the item just modifies some stat"""
         try:
             stat, modifier = self.__getattribute__("stat_modifier")
-            self.pr.adjust_stat(stat, modifier)
-
         except AttributeError:
-            pass
+            return
+        self.pr.add_modifier(stats.EQUIPMENT, self, stat, modifier)
 
     def on_deequip_logic(self):
 
         """Default method assumes the item just modifies some stat"""
-        try:
-            stat, modifier = self.__getattribute__("stat_modifier")
-            self.pr.adjust_stat(stat, -modifier)  # minus modifier to revert the change
-
-        except AttributeError:
-            pass
+        self.pr.remove_modifiers(self)  # takes off exactly what was put on, whatever's changed since
 
 
 class StackableMixin:
@@ -77,23 +111,44 @@ class StackableMixin:
 class LimitedDurationMixin:
 
     duration = 0  # define this in the specific item class
+    user = None  # the character who used it, the countdown can finish during anyone's turn
 
     def on_use(self, *args):
 
         """like using a normal item (or single use item) but also registers the
         countdown to begin"""
 
+        self.user = self.pr
         super().on_use(*args)
-        self.pr.registered_countdowns.append(self)
+        self.start_countdown()
+
+    def start_countdown(self):
+
+        countdowns = self.er.registered_countdowns
+        countdowns.append(self)
+        journal.record("start_timer", self, self.duration, undo=lambda: countdowns.remove(self))
+
+    def tell_user(self, message):
+
+        """Log message for the user if it's their turn, otherwise send it to them"""
+
+        if self.user is self.pr:
+            self.log(message)
+        else:
+            self.user.notify(message)
 
     def heartbeat(self):
 
         print("tick")
         print(self.duration)
         self.duration -= 1
+        journal.changed(self, "duration", self.duration + 1)
         if self.duration < 0:
             self.on_countdown_finished()
-            self.pr.registered_countdowns.remove(self)
+            countdowns = self.er.registered_countdowns
+            index = countdowns.index(self)
+            del countdowns[index]
+            journal.record("end_timer", self, undo=lambda: countdowns.insert(index, self))
             # if single use item,
             # now the item will be garbage collected as nothing else holds a reference to it
             # otherwise it persists
@@ -1,11 +1,43 @@
 import generators
-import random
+import rng
 import re
+import queue
+import threading
+import time
 
 from collections import deque
 
-import game_items
 import combat_engine
+import journal
+import metrics
+import replay
+import roaming
+import sessions
+
+MAX_MESSAGE_SIZE = 2000  # discord's limit on the length of a message
+STREAM_BACKLOG = 64  # streamed commands that can wait for the worker before stream_command blocks
+STREAM_DONE = object()  # marks the end of a streamed command's output
+
+
+def split_message(text, max_size=MAX_MESSAGE_SIZE):
+
+    """Split text into chunks of at most max_size characters, breaking at line boundaries where
+    possible. Joining the chunks back together gives the original text."""
+
+    chunks = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        if len(current) + len(line) > max_size and current:
+            chunks.append(current)
+            current = ""
+        while len(line) > max_size:
+            # a single line that can't fit in one message, no choice but to break it up
+            chunks.append(line[:max_size])
+            line = line[max_size:]
+        current += line
+    if current:
+        chunks.append(current)
+    return chunks
 
 
 class Player:
@@ -14,29 +46,80 @@ class Player:
         "on_look": ["look", "examine", "check", "investigate", "view", "see"],
         "on_use": ["use"],
         "on_take": ["take", "grab", "get", "pick"],
-        "on_go": ["go", "travel", "venture", "walk"],
+        "on_go": ["go", "venture", "walk"],
+        "on_travel": ["travel"],
         "on_quit": ["quit"],
         "on_status": ["inventory", "status", "stats", "level", "character sheet"],
         "on_drop": ["drop", "discard", "leave"],
         "on_open": ["open"],
         "on_attack": ["attack", "fight", "hit", "stab", "battle"],
+        "on_consider": ["consider", "odds"],
         "on_exits": ["exits"],
+        "on_map": ["map"],
         "on_equip": ["equip"],
         "on_deequip": ["deequip", "de-equip", "remove", "unequip"],
         "on_loot": ["loot"],
         "on_debug": ["debug"],
         "on_suicide": ["suicide"],
+        "on_help": ["help", "actions", "what"],
+        "on_undo": ["undo"],
     }
 
+    # commands that every MyThing understands, the help command doesn't bother listing them per object
+    generic_commands = ["on_look", "on_go", "on_travel", "on_exits", "on_map", "on_quit", "on_suicide", "on_debug"]
+    bulk_commands = {"on_drop": "drop_all", "on_take": "take_all"}  # the Character methods for e.g. "drop all x"
+
     def __init__(self):
 
         self.item_queue = deque()  # queued-up special items to be injected into the game at various times
         self.registered_countdowns = []  # objects to send a "tick" signal every time a command is processed
         # used for items with limited duration. Each item keeps track of its own countdown.
         self.known_characters = {}
+        self.last_active = {}  # discord_id: time of their last command, least recently active first
+        self.sessions = None  # a sessions.Sessions when idle sessions are moved out of memory, see limit_sessions
         self.command_dict = self.setup_command_dict()
         self.current_character = None  # the character currently invoking commands. This is used to pass a reference
         # to that character to any new entities that are created and need to know about the player
+        self.recorder = None  # a replay.Recorder when the session is being recorded
+        self.command_lock = threading.RLock()  # only one command runs at a time, see stream_command
+        # this also puts the commands of players sharing a world in a single order, so they always
+        # see each other's changes to a room consistently
+        self.notification_handler = None  # optionally, a function(discord_id, message) that sends news
+        # of other players straight to a player. Otherwise it waits until the player's next command
+        self.journal = None  # a journal.Journal when changes are being journalled
+        self.dungeon = None  # a pre-built dungeon.Dungeon that new characters start in, see open_dungeon
+        self.worlds_made = 0  # see number_world
+        self.stream_jobs = queue.Queue(STREAM_BACKLOG)  # commands for the worker thread, see stream_command
+        self.stream_worker = None  # started by the first streamed command
+        self.stream_lock = threading.Lock()
+
+    def __getstate__(self):
+
+        """For journal snapshots, leave out the things that belong to this process rather than the game"""
+
+        state = self.__dict__.copy()
+        for k in ("recorder", "command_lock", "notification_handler", "journal", "stream_jobs", "stream_worker",
+                  "stream_lock"):
+            del state[k]
+        return state
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+        self.recorder = None
+        self.command_lock = threading.RLock()
+        self.notification_handler = None
+        self.journal = None
+        self.stream_jobs = queue.Queue(STREAM_BACKLOG)
+        self.stream_worker = None
+        self.stream_lock = threading.Lock()
+
+    def number_world(self):
+
+        """A number for a new world, so rooms in different worlds can be told apart in the journal"""
+
+        self.worlds_made += 1
+        return self.worlds_made
 
     def get_character_reference(self):
 
@@ -56,15 +139,10 @@ class Player:
                 out[i] = k  # string typed by player:function of MyThing
         return out
 
-    def request_key(self, colour):
-
-        # TODO: there is no guarantee the same colour key won't turn up twice
-        self.enqueue_unique_item(game_items.Key(colour), delay=1)
-
     def enqueue_unique_item(self, item, delay=None):
 
         if not delay:
-            delay = random.randint(1, 20)
+            delay = rng.current.randint(1, 20)
 
         for x in range(delay):
             self.item_queue.append(None)
@@ -73,16 +151,113 @@ class Player:
             # note USE POPLEFT so it's a queue and not a stack
         self.item_queue.append(item)
 
-    def start_game(self, discord_id):
+    def start_game(self, discord_id, join=None):
 
         """Registers the character in the list of characters in play. The character
         is identified by their numeric discord id for the purposes of routing
-        commands, etc"""  # TODO replace with actual interface
+        commands, etc. Pass the discord id of a character already playing as join
+        to start in the same room as them, sharing their world."""  # TODO replace with actual interface
 
         character = self.known_characters[discord_id]
-        self.current_character = character
-        character.start_game()
-        return character.first_output()
+        room = None
+        if join is not None:
+            room = self.find_character(join).location
+        elif self.dungeon is not None:
+            room = self.dungeon.entrance()
+        with self.command_lock, rng.using(character.rng):
+            self.current_character = character
+            if self.journal is not None:
+                self.journal.begin(character)
+            character.start_game(room)
+            if self.journal is not None:
+                self.journal.started(discord_id, character.name, character.rng.initial_seed, join)
+            self.active(character)
+        out = character.first_output()
+        if self.recorder is not None:
+            self.recorder.started(discord_id, character.name, character.rng.initial_seed, join, out)
+        return out
+
+    def start_recording(self, path, seed=None):
+
+        """Record everything that happens from now on to a log that replay.py can re-run. Call it on a
+        fresh engine before any characters have started."""
+
+        self.recorder = replay.Recorder(path, seed)
+        return self.recorder.seed
+
+    def stop_recording(self):
+
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def open_dungeon(self, path):
+
+        """Start everyone who doesn't join someone else in the dungeon built by dungeon.py at path,
+        rather than in a new world of their own. They all share it."""
+
+        import dungeon  # not at the top, dungeon imports headless, which imports this module
+
+        self.dungeon = dungeon.Dungeon(path)
+        return self.dungeon
+
+    def start_journal(self, path, snapshot_every=1000):
+
+        """Journal every change to the game from now on, see journal.py. To carry on after a crash,
+        use journal.recover(path) instead."""
+
+        self.journal = journal.Journal(path, self, snapshot_every)
+        journal.active = self.journal
+        return self.journal
+
+    def stop_journal(self):
+
+        if self.journal is not None:
+            self.journal.close()
+            if journal.active is self.journal:
+                journal.active = None
+            self.journal = None
+
+    def limit_sessions(self, directory, max_sessions=None, max_rooms=None):
+
+        """Move the least recently active players out of memory, into files in directory, whenever
+        more than max_sessions characters or max_rooms rooms are in memory. See sessions.py."""
+
+        self.sessions = sessions.Sessions(directory, max_sessions, max_rooms)
+        for character in self.known_characters.values():
+            self.sessions.note(character)
+        return self.sessions
+
+    def find_character(self, discord_id):
+
+        """The character of discord_id, loaded back into memory if their session was moved out.
+        Raises KeyError for someone who isn't playing."""
+
+        try:
+            return self.known_characters[discord_id]
+        except KeyError:
+            if self.sessions is None or not self.sessions.restore(self, discord_id):
+                raise
+        return self.known_characters[discord_id]
+
+    def active(self, character):
+
+        """After character has done something: they're now the most recently active, and the least
+        recently active may have to make room for them"""
+
+        self.last_active.pop(character.discord_id, None)
+        self.last_active[character.discord_id] = time.time()
+        if self.sessions is not None:
+            self.sessions.enforce(self, character)
+
+    def deliver(self, character, message):
+
+        """Route a message about something another player did to character"""
+
+        if self.notification_handler is not None:
+            self.notification_handler(character.discord_id, message)
+        else:
+            character.pending_messages.append(message)
 
     def run_combat(self, monster1, monster2):
 
@@ -98,41 +273,214 @@ class Player:
 
         self.current_character.log(message, *args, newline=newline)
 
-    def process_command(self, command, discord_id):
+    def process_command(self, command, discord_id, listener=None):
 
         """Takes in a command string typed by the player and attempts to interpret it. Interpretation
         causes all the game logic to run and the logs to be updated. At the end of the function,
-        the updated log is returned to be printed by whatever called it e.g. a discord bot or other interface"""
+        the updated log is returned to be printed by whatever called it e.g. a discord bot or other interface
+
+        If listener is given, it is also called with each piece of text as it is added to the log."""
+
+        with self.command_lock:
+            try:
+                character = self.find_character(discord_id)
+            except KeyError:
+                print("Process_command got message from unregistered player, this should not happen")
+                return
+            with metrics.command(), rng.using(character.rng):
+                character.clear_log()
+                self.current_character = character  # this is for directing log messages to the appropriate log
+                # it is reset at the start of every turn obviously
+                character.log_pending_messages()  # anything other players did since the last command
+
+                character.listener = listener
+                if self.journal is not None:
+                    self.journal.begin(character)
+                try:
+                    self.run_command(command, character)
+                finally:
+                    character.listener = None
+                if self.journal is not None:
+                    self.journal.command(discord_id, command)
+
+                with metrics.span("render_log"):
+                    out = character.print_log()
+                self.active(character)
+
+        if self.recorder is not None:
+            self.recorder.command(discord_id, command, out)
+        return out
 
-        try:
-            character = self.known_characters[discord_id]
-        except KeyError:
-            print("Process_command got message from unregistered player, this should not happen")
-            return
+    def stream_command(self, command, discord_id, max_size=MAX_MESSAGE_SIZE):
+
+        """Generator version of process_command that yields the output in chunks of at most max_size
+        characters, broken at line boundaries, as soon as the lines are written. So "You travel to the
+        north." can be sent while the next room is still being generated. Joining the chunks gives
+        the same text that process_command would have returned.
+
+        The command runs on the engine's worker thread, which feeds the log text back through a
+        queue. Commands only run one at a time anyway, so one thread is all it takes however many
+        are streamed. When STREAM_BACKLOG of them are already waiting for it, this waits too."""
+
+        with self.stream_lock:
+            if self.stream_worker is None:
+                self.stream_worker = threading.Thread(target=self.stream_work, name="stream-commands", daemon=True)
+                self.stream_worker.start()
+        pieces = queue.SimpleQueue()
+        failure = []
+        self.stream_jobs.put((command, discord_id, pieces, failure))
+
+        buffer = ""
+        finished = False
+        while not finished:
+            piece = pieces.get()  # wait for at least something to happen, then take whatever else is ready
+            while True:
+                if piece is STREAM_DONE:
+                    finished = True
+                    break
+                buffer += piece
+                try:
+                    piece = pieces.get_nowait()
+                except queue.Empty:
+                    break
+
+            if finished:
+                ready, buffer = buffer, ""
+            else:
+                cut = buffer.rfind("\n") + 1  # only send complete lines, a message might be half built
+                ready, buffer = buffer[:cut], buffer[cut:]
 
-        character.clear_log()
-        self.current_character = character  # this is for directing log messages to the appropriate log
-        # it is reset at the start of every turn obviously
+            for chunk in split_message(ready, max_size):
+                yield chunk
 
-        splitted = command.split(" ", maxsplit=1)  # just take off the first verb for use as command
-        if len(splitted) == 1:
-            cmd = splitted[0]
-            words = ""
-        else:
-            cmd, words = splitted
-        if cmd not in self.command_dict.keys():
-            character.log("Unrecognised command: {}", cmd)
-            return character.print_log()  # return early because couldn't do anything
-        else:
-            executable_command = self.command_dict[cmd]
-            # the name of the command as it appears in the object's __dict__
+        if failure:
+            raise failure[0]
+
+    def stream_work(self):
+
+        """The worker thread's loop, running streamed commands in the order they came"""
+
+        while True:
+            command, discord_id, pieces, failure = self.stream_jobs.get()
+            try:
+                self.process_command(command, discord_id, listener=pieces.put)
+            except BaseException as e:
+                failure.append(e)  # raised to whoever's reading the output instead
+            finally:
+                pieces.put(STREAM_DONE)
+
+    def run_command(self, command, character):
+
+        """Does the actual work of process_command, all output goes to the character's log"""
+
+        with metrics.span("parse"):
+            splitted = command.split(" ", maxsplit=1)  # just take off the first verb for use as command
+            if len(splitted) == 1:
+                cmd = splitted[0]
+                words = ""
+            else:
+                cmd, words = splitted
+            if cmd not in self.command_dict.keys():
+                character.log("Unrecognised command: {}", cmd)
+                return  # return early because couldn't do anything
+            else:
+                executable_command = self.command_dict[cmd]
+                # the name of the command as it appears in the object's __dict__
+            metrics.label(executable_command[3:])  # on_look -> look
 
         if executable_command == "on_status":
             # special command with no target object, just prints player stats and return early
             character.report_status()
-            return character.print_log()
+            return
 
-        resolution_order = [character.equipped, character.items, character.visible_things]  # reset everytim
+        if executable_command == "on_help":
+            self.describe_actions(character)
+            return
+
+        if executable_command == "on_undo":
+            self.undo(character)
+            return
+
+        with metrics.span("resolve"):
+            if executable_command in self.bulk_commands and words.startswith("all "):
+                # e.g. drop all bandages, the character deals with every item at once
+                to_run = getattr(character, self.bulk_commands[executable_command])
+                args = [words[len("all "):]]
+            else:
+                target, args = self.resolve_target(executable_command, words, character)
+
+                if target is None and len(words) > 0:
+                    character.log("Unrecognised target: {}.", words)
+                    return
+
+                if target is None or not target.can(executable_command):
+                    # looked up in the table of verbs the target's class supports
+                    character.log("Can't {} this.", cmd)
+                    return
+                to_run = getattr(target, executable_command)
+
+        # THE IMPORTANT PART #
+        with metrics.span("execute"):
+            to_run(*args)  # evaluate the command we looked up, passing the arguments the player typed
+
+        if not (executable_command in ["on_go", "on_travel", "on_look", "on_attack"]):
+            # monsters only attack if the player is still, otherwise they'd attack every time the
+            # player ran and running would be pointless
+            # not really fair to have the look command trigger attacks either, but anything else
+            # is fair game e.g. interacting with objects
+            with metrics.span("monster_attacks"):
+                for mon in list(character.monsters_in_play):  # copy, a monster can die mid-loop
+                    mon.attack_player()
+
+        if not executable_command == "on_look":
+            # only process heartbeats if the player command actually did something
+            with metrics.span("heartbeats"):
+                for item in list(self.registered_countdowns):  # copy, finished countdowns remove themselves
+                    item.heartbeat()
+            if roaming.enabled and not character.dead:
+                with metrics.span("roaming"):
+                    roaming.tick(character.location.world, character)
+
+    def undo(self, character):
+
+        """The undo command: put back everything the character's last command changed"""
+
+        if self.journal is None:
+            character.log("You can't undo anything in this game.")
+        elif self.journal.undo(character):
+            character.update_visible_things()
+            character.update_monsters_in_play(character.location.monsters)
+            character.log("You undid your last action.")
+        else:
+            character.log("There's nothing to undo, or someone else has done something since.")
+
+    def describe_actions(self, character):
+
+        """The help command: list what the player can do to each of the things around them"""
+
+        held = character.inventory
+        things = list(held.equipped) + held.distinct_held() + list(character.visible_things)
+        character.log("Here you can:")
+        for executable_command, aliases in self.command_aliases.items():
+            if executable_command in self.generic_commands:
+                continue
+            names = [k.__doc__ for k in things if k.can(executable_command)]
+            if names:
+                character.log("{} {}", aliases[0], ", ".join(dict.fromkeys(names)))  # without duplicates
+        exits = list(character.location.neighbours.keys())
+        character.log("go {}", ", ".join(exits))
+        character.log("You can also look, check your exits, see the map, travel to somewhere you've been, "
+                      "take or drop all of something, or see your status.")
+
+    def resolve_target(self, executable_command, words, character):
+
+        """Works out which object the player's command is aimed at and which other objects or
+        directions are arguments to it. Returns target, args, target is None if nothing suitable
+        was found."""
+
+        held = character.inventory
+        resolution_order = [held.equipped, held.distinct_held(), character.visible_things]
+        # one of each kind of item carried, the rest would only match the same words again
         if executable_command == "on_take":
             resolution_order.reverse()  # player wants to take visible things, not equipped things.
 
@@ -162,6 +510,16 @@ class Player:
                         else:
                             args.append(k)
 
+        if target is not None and not target.can(executable_command):
+            # several things matched the words, prefer one that actually understands the command
+            for i, k in enumerate(args):
+                if k.can(executable_command):
+                    target, args[i] = k, target
+                    break
+
+        if executable_command == "on_travel":
+            return character.location, [words]  # the room works out where the player means
+
         if executable_command == "on_go":
             for direction in ["north", "south", "east", "west"]:
                 # all directions are permitted because if it's not valid it will be caught by
@@ -173,15 +531,14 @@ class Player:
         if target is None:
 
             if len(words) > 0:
-                character.log("Unrecognised target: {}.", words)
-                return character.print_log()
+                return None, args  # the player typed something that doesn't exist
 
             if executable_command == "on_attack":
                 # player might have mistyped a name or just attack with no monster, consistently pick the
                 # first monster for them to attack, if present. If not, pass it on to self.location
                 # which will of course fail
                 if character.check_if_monsters():
-                    target = character.monsters_in_play[0]
+                    target = next(iter(character.monsters_in_play))
 
             else:
                 # either the player typed ("look"), which is just to look at the room,
@@ -189,28 +546,4 @@ class Player:
                 # the MyItem class e.g. status, quit
                 target = character.location
 
-        try:
-            to_run = target.__getattribute__(executable_command)
-            # look up the command in target's dictionary
-
-        except AttributeError:
-            character.log("Can't {} this.", cmd)
-            return character.print_log()
-
-        # THE IMPORTANT PART #
-        to_run(*args)  # evaluate the command we looked up, passing the arguments the player typed
-
-        if not (executable_command in ["on_go", "on_look", "on_attack"]):
-            # monsters only attack if the player is still, otherwise they'd attack every time the
-            # player ran and running would be pointless
-            # not really fair to have the look command trigger attacks either, but anything else
-            # is fair game e.g. interacting with objects
-            for mon in character.monsters_in_play:
-                mon.attack_player()
-
-        if not executable_command == "on_look":
-            # only process heartbeats if the player command actually did something
-            for item in self.registered_countdowns:
-                item.heartbeat()
-
-        return character.print_log()
+        return target, args
@@ -0,0 +1,160 @@
+"""Record a game's RNG seeds and command stream to a compact log, and replay it headlessly.
+
+All the generation in the game comes from the random streams in rng.py, so recording the seed of
+every character's stream, and every character start and command in order, is enough to reproduce
+a session exactly.
+Each event also stores a checksum of the output it produced, so the replay can check that it
+really did reproduce the same game byte for byte.
+
+To record, call Player.start_recording(path) on a fresh engine before any character starts.
+To replay:
+    python replay.py session.log               summary and the slowest commands
+    python replay.py session.log --verbose     every command with its timing
+
+The log is JSON lines, gzipped if the path ends in .gz. The first line is a header with the random
+backend and the seed of the stream used outside sessions, then one short list per event:
+    ["s", discord_id, name, seed, join, crc]      character started, join is who they joined or null
+    ["c", discord_id, command, crc]   command processed"""
+
+import argparse
+import gzip
+import json
+import sys
+import time
+import zlib
+
+import rng
+
+VERSION = 4
+
+
+def open_log(path, mode):
+
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def checksum(output):
+
+    return zlib.crc32((output or "").encode("utf-8"))
+
+
+class Recorder:
+
+    """Appends events to the log as they happen. The file is flushed after every event so that
+    a crashing worker still leaves a usable log behind."""
+
+    def __init__(self, path, seed=None):
+
+        if seed is None:
+            seed = rng.new_seed()
+        self.seed = seed
+        rng.current.seed(seed)
+
+        self.file = open_log(path, "w")
+        header = {"version": VERSION,
+                  "backend": rng.backend,
+                  "seed": seed}
+        self.write(header)
+
+    def write(self, event):
+
+        self.file.write(json.dumps(event, separators=(",", ":")))
+        self.file.write("\n")
+        self.file.flush()
+
+    def started(self, discord_id, name, seed, join, output):
+
+        self.write(["s", discord_id, name, seed, join, checksum(output)])
+
+    def command(self, discord_id, command, output):
+
+        self.write(["c", discord_id, command, checksum(output)])
+
+    def close(self):
+
+        self.file.close()
+
+
+def read_log(path):
+
+    """Returns the header dict and a list of events"""
+
+    with open_log(path, "r") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != VERSION:
+            raise ValueError("Unsupported replay log version: {}".format(header.get("version")))
+        events = [json.loads(line) for line in f if line.strip()]
+    return header, events
+
+
+def replay(path, on_event=None):
+
+    """Re-run a recorded log against a fresh engine. Returns a list of
+    (kind, discord_id, command, seconds, output, matched) tuples, one per event. on_event is called
+    with each tuple as soon as it's available, so a crash partway through still shows progress."""
+
+    import headless  # imported here because headless imports player, which imports this module
+
+    header, events = read_log(path)
+
+    results = []
+    rng.set_backend(header["backend"])
+    rng.current.seed(header["seed"])
+    engine = headless.new_engine()
+
+    for event in events:
+        kind, discord_id, text, crc = event[0], event[1], event[2], event[-1]
+        with headless.quiet():
+            start = time.perf_counter()
+            if kind == "s":
+                _, output = headless.new_character(engine, discord_id, text, seed=event[3], join=event[4])
+            else:
+                output = engine.process_command(text, discord_id)
+            elapsed = time.perf_counter() - start
+        result = (kind, discord_id, text, elapsed, output, checksum(output) == crc)
+        results.append(result)
+        if on_event:
+            on_event(result)
+
+    return results
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Replay a recorded game session")
+    parser.add_argument("log")
+    parser.add_argument("--verbose", action="store_true", help="print every command with its timing")
+    parser.add_argument("--show-output", action="store_true", help="print the game output of every command")
+    parser.add_argument("--slowest", type=int, default=10, help="how many of the slowest commands to list")
+    args = parser.parse_args(argv)
+
+    def on_event(result):
+        kind, discord_id, text, seconds, output, matched = result
+        if args.verbose:
+            print("{:>10.3f} ms  {:<10} {}{}".format(seconds * 1000, discord_id,
+                                                    text if kind == "c" else "<start {}>".format(text),
+                                                    "" if matched else "  OUTPUT DIFFERS"))
+        if args.show_output:
+            print(output)
+
+    results = replay(args.log, on_event)
+    mismatches = [x for x in results if not x[5]]
+    total = sum(x[3] for x in results)
+
+    print("{} events replayed in {:.3f}s, {} with different output".format(len(results), total, len(mismatches)))
+    print("Slowest commands:")
+    for kind, discord_id, text, seconds, output, matched in sorted(results, key=lambda x: -x[3])[:args.slowest]:
+        print("{:>10.3f} ms  {:<10} {}".format(seconds * 1000, discord_id,
+                                               text if kind == "c" else "<start {}>".format(text)))
+
+    if mismatches:
+        kind, discord_id, text, _, _, _ = mismatches[0]
+        print("First difference at: {} {}".format(discord_id, text))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""Random number streams. Each session (character) gets its own stream so that sessions don't share
+state, and a seeded session always generates the same world no matter what players in other worlds
+do. Everything else generation depends on is kept per world too, like the keys waiting to turn up
+(World.item_queue). The exception is a unique item queued up with Player.enqueue_unique_item, which
+turns up in whichever world somebody moves in next.
+
+Game code draws from rng.current, which the engine points at the stream of whichever character
+is running a command, in the same way as Player.current_character:
+
+    rng.current.randint(1, 4)
+    rng.current.chance(40)
+
+Two kinds of stream are available, picked with set_backend():
+
+    "mersenne"  a plain random.Random
+    "batched"   pre-draws blocks of uniforms and normals (with NumPy if it's installed) and hands
+                them out one at a time, which is a lot cheaper than random.Random's randint/choice"""
+
+import math
+import os
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # the batched backend falls back to filling its blocks from random.Random
+
+BLOCK = 4096  # how many numbers the batched stream draws at once
+
+
+class Stream(random.Random):
+
+    """A random.Random with the game's percentage roll added"""
+
+    def chance(self, prob):
+
+        """True with a probability of prob percent"""
+
+        return self.randint(0, 100) < prob
+
+
+class BatchedStream(Stream):
+
+    """Hands out numbers from pre-drawn blocks. The integer methods are reimplemented in terms of
+    the uniforms so that each one costs a list pop and a multiply instead of several Python calls."""
+
+    def __init__(self, seed=None, block=BLOCK):
+
+        self.block = block
+        super().__init__(seed)  # calls seed()
+
+    def seed(self, a=None, version=2):
+
+        super().seed(a, version)
+        if numpy is not None:
+            self.generator = numpy.random.Generator(numpy.random.PCG64(super().getrandbits(64)))
+        self.uniforms = []
+        self.normals = []
+
+    def refill_uniforms(self):
+
+        if numpy is not None:
+            self.uniforms = self.generator.random(self.block).tolist()
+        else:
+            draw = super().random
+            self.uniforms = [draw() for x in range(self.block)]
+
+    def refill_normals(self):
+
+        if numpy is not None:
+            self.normals = self.generator.standard_normal(self.block).tolist()
+        else:
+            # Box-Muller, two normals from each pair of uniforms
+            draw = super().random
+            out = []
+            for x in range(self.block // 2):
+                radius = math.sqrt(-2.0 * math.log(1.0 - draw()))
+                theta = 2.0 * math.pi * draw()
+                out.append(radius * math.cos(theta))
+                out.append(radius * math.sin(theta))
+            self.normals = out
+
+    def random(self):
+
+        if not self.uniforms:
+            self.refill_uniforms()
+        return self.uniforms.pop()
+
+    # the methods below pop from the block themselves rather than calling random(), the saved
+    # Python call is most of the cost of a draw
+
+    def randint(self, a, b):
+
+        if not self.uniforms:
+            self.refill_uniforms()
+        return a + int(self.uniforms.pop() * (b - a + 1))
+
+    def randrange(self, start, stop=None):
+
+        if stop is None:
+            start, stop = 0, start
+        if not self.uniforms:
+            self.refill_uniforms()
+        return start + int(self.uniforms.pop() * (stop - start))
+
+    def choice(self, seq):
+
+        if not self.uniforms:
+            self.refill_uniforms()
+        return seq[int(self.uniforms.pop() * len(seq))]
+
+    def chance(self, prob):
+
+        if not self.uniforms:
+            self.refill_uniforms()
+        return int(self.uniforms.pop() * 101) < prob
+
+    def shuffle(self, x):
+
+        for i in range(len(x) - 1, 0, -1):
+            j = int(self.random() * (i + 1))
+            x[i], x[j] = x[j], x[i]
+
+    def normalvariate(self, mu=0.0, sigma=1.0):
+
+        if not self.normals:
+            self.refill_normals()
+        return mu + sigma * self.normals.pop()
+
+    gauss = normalvariate
+
+
+BACKENDS = {"mersenne": Stream, "batched": BatchedStream}
+backend = "batched" if numpy is not None else "mersenne"  # without NumPy the blocks are filled one number
+# at a time from random.Random, which loses most of the benefit
+
+
+def set_backend(name):
+
+    global backend
+    if name not in BACKENDS:
+        raise ValueError("Unknown random backend: {}".format(name))
+    backend = name
+
+
+def new_seed():
+
+    return int.from_bytes(os.urandom(8), "big")
+
+
+def new_stream(seed=None):
+
+    """A stream using the current backend. Pass a seed to make it reproducible, the stream
+    remembers it as stream.initial_seed so it can be recorded."""
+
+    if seed is None:
+        seed = new_seed()
+    stream = BACKENDS[backend](seed)
+    stream.initial_seed = seed
+    return stream
+
+
+current = new_stream()  # the stream game code draws from, swapped by the engine for each session
+
+
+class using:
+
+    """Context manager that makes stream the current one, then puts the old one back"""
+
+    def __init__(self, stream):
+
+        self.stream = stream
+
+    def __enter__(self):
+
+        global current
+        self.previous = current
+        current = self.stream
+        return self.stream
+
+    def __exit__(self, *exc):
+
+        global current
+        current = self.previous
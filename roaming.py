@@ -0,0 +1,100 @@
+"""Monsters that roam the world and hunt players down, without simulating the whole world.
+
+Only the monsters near players move. Every turn (every command that does something, like the
+countdown heartbeats) the active region is found: the rooms within RADIUS steps of any player in
+the world. It's found by a breadth-first search outwards from the rooms the players are in, which
+also gives each room the way to the nearest player, so hunting needs no search of its own. The work
+each turn depends on the number of players and RADIUS, however big the world gets.
+
+A monster outside the region isn't touched at all, it just remembers the world turn it last moved
+on (Monster.turn). When the region reaches it again it catches up on the turns it missed by
+wandering first, but only up to CATCH_UP steps: after that many random steps, where it ends up is
+about as random as it's going to get, and it can't wander far from where it was anyway."""
+
+import rng
+
+RADIUS = 3  # how many steps from a player monsters are simulated
+CATCH_UP = 6  # the most missed turns a monster makes up for when the region reaches it
+enabled = True
+
+
+def region(players):
+
+    """{room: direction towards the nearest player} for every room within RADIUS steps of a player,
+    the direction is None for the players' own rooms"""
+
+    toward = {}
+    frontier = []
+    for char in players:
+        if char.location not in toward:
+            toward[char.location] = None
+            frontier.append(char.location)
+
+    for distance in range(RADIUS):
+        later = []
+        for room in frontier:
+            for direction, nxt in room.neighbours.items():
+                if nxt is None or nxt in toward:
+                    continue
+                back = room.flip_direction(direction)
+                if nxt.neighbours.get(back) is not room or nxt.locked_door == back:
+                    continue  # a monster there can't come this way
+                toward[nxt] = back
+                later.append(nxt)
+        frontier = later
+    return toward
+
+
+def tell(room, actor, message, *args):
+
+    """Let everyone in room know, actor straight away in the log of the command they're running"""
+
+    room.broadcast(message, *args, exclude=actor)
+    if actor in room.occupants:
+        actor.log(message, *args)
+
+
+def move(monster, direction, actor):
+
+    old = monster.location
+    new = old.neighbours[direction]
+    tell(old, actor, "The {} leaves to the {}.", monster.__doc__, direction)
+    monster.relocate(new)
+    tell(new, actor, "The {} {}.", monster.__doc__, "stalks in" if monster.hunting else "wanders in")
+
+
+def wander(monster, actor):
+
+    room = monster.location
+    exits = [d for d, nxt in room.neighbours.items() if nxt is not None and d != room.locked_door]
+    if exits:
+        move(monster, rng.current.choice(exits), actor)
+
+
+def tick(world, actor):
+
+    """Advance the monsters in the active region of world by one turn. actor is the character whose
+    command is running."""
+
+    world.turn += 1
+    toward = region(world.players)
+    for room, way in list(toward.items()):
+        for monster in list(room.monsters):  # copy, monsters leave the room
+            if monster.turn is not None and monster.turn >= world.turn:
+                continue  # arrived from another room this turn
+            missed = 0 if monster.turn is None else world.turn - 1 - monster.turn
+            monster.turn = world.turn
+            if way is None:
+                continue  # it's found a player, and attacks them rather than moving
+
+            monster.hunting = False
+            for x in range(min(missed, CATCH_UP)):
+                wander(monster, actor)
+            if monster.location is not room:
+                continue  # wherever it is now, that's this turn's move made
+
+            if monster.chance(monster.hunt_chance):
+                monster.hunting = True
+                move(monster, way, actor)
+            elif monster.chance(monster.wander_chance):
+                wander(monster, actor)
@@ -0,0 +1,193 @@
+"""Moving idle sessions out of memory, and back when they're next needed.
+
+known_characters only ever grows, and every character keeps the whole world they've explored in
+memory. With session limits set (see Player.limit_sessions) the least recently active sessions are
+saved to files in a directory and dropped from memory whenever there are more than max_sessions
+characters in memory, or more than max_rooms rooms in their worlds. The next command from one of
+them loads it back before it runs, so the player never notices.
+
+The unit that is moved out is a world and everyone in it, since characters who joined each other
+share their rooms. A world goes when the most recently active of its characters is the least
+recently active left. The countdowns of items they've used go with them, and are paused until
+they're back. The shared world of a pre-built dungeon is never moved out, its rooms are already
+only loaded from the dungeon file as they're reached.
+
+Rooms rather than bytes are what's limited: CPython rarely hands freed memory back to the system,
+so the size of the process wouldn't go down as sessions are moved out. Every room holds much the
+same, so the number of rooms is a good measure of the memory the sessions take.
+
+Counts and the time taken are kept in evictions, restores and seconds, and with metrics enabled
+each eviction and restore is also timed as the evict_session and restore_session phases."""
+
+import io
+import os
+import pickle
+import time
+import zlib
+
+import metrics
+
+
+class SessionPickler(pickle.Pickler):
+
+    """Pickles a session, writing the engine (which things know through their engine references)
+    as a name rather than the whole engine"""
+
+    def __init__(self, file, engine):
+
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.engine = engine
+
+    def persistent_id(self, obj):
+
+        if obj is self.engine:
+            return "engine"
+        return None
+
+
+class SessionUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, engine):
+
+        super().__init__(file)
+        self.engine = engine
+
+    def persistent_load(self, pid):
+
+        if pid != "engine":
+            raise pickle.UnpicklingError("unknown reference in session: {}".format(pid))
+        return self.engine
+
+
+class Sessions:
+
+    def __init__(self, directory, max_sessions=None, max_rooms=None):
+
+        self.directory = directory
+        self.max_sessions = max_sessions  # None for no limit
+        self.max_rooms = max_rooms
+        self.evicted = {}  # discord_id: file their session is saved in
+        self.worlds = {}  # world: {discord_id: None} of the characters in memory in it
+        self.rooms = {}  # world: how many rooms it had when last counted
+        self.total_rooms = 0
+        self.next_file = 0
+        self.evictions = 0
+        self.restores = 0
+        self.seconds = {"evict": 0.0, "restore": 0.0}
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+
+        """For journal snapshots, which have to be complete without the session files"""
+
+        state = self.__dict__.copy()
+        saved = {}
+        for name in set(self.evicted.values()):
+            with open(os.path.join(self.directory, name), "rb") as f:
+                saved[name] = f.read()
+        state["saved"] = saved
+        return state
+
+    def __setstate__(self, state):
+
+        saved = state.pop("saved")
+        self.__dict__.update(state)
+        os.makedirs(self.directory, exist_ok=True)
+        for name, data in saved.items():
+            with open(os.path.join(self.directory, name), "wb") as f:
+                f.write(data)
+
+    def note(self, character):
+
+        """Keep count of the world character is in, after they've done something"""
+
+        world = None if character.location is None else character.location.world
+        if world is None or world.store is not None:
+            return
+        self.worlds.setdefault(world, {})[character.discord_id] = None
+        size = len(world.rooms)
+        self.total_rooms += size - self.rooms.get(world, 0)
+        self.rooms[world] = size
+
+    def over(self, engine):
+
+        return (self.max_sessions is not None and len(engine.known_characters) > self.max_sessions) or \
+               (self.max_rooms is not None and self.total_rooms > self.max_rooms)
+
+    def enforce(self, engine, character):
+
+        """Move out the least recently used sessions, except character's, until within the limits"""
+
+        self.note(character)
+        while self.over(engine):
+            world = self.least_recent(engine, character)
+            if world is None:
+                return  # everyone left is in character's world or the dungeon
+            self.evict(engine, world)
+
+    def least_recent(self, engine, keep):
+
+        """The world whose most recently active character was active longest ago, None if there are
+        only keep's and the dungeon's"""
+
+        seen = {}
+        for discord_id in engine.last_active:
+            char = engine.known_characters.get(discord_id)
+            if char is None or char.location is None:
+                continue  # hasn't started yet
+            world = char.location.world
+            if world not in self.worlds or world is keep.location.world:
+                continue
+            seen[world] = seen.get(world, 0) + 1
+            if seen[world] == len(self.worlds[world]):
+                return world
+        return None
+
+    def evict(self, engine, world):
+
+        start = time.perf_counter()
+        with metrics.span("evict_session"):
+            members = list(self.worlds.pop(world))
+            session = [(discord_id, engine.known_characters[discord_id], engine.last_active[discord_id])
+                       for discord_id in members]
+            characters = {char for _, char, _ in session}
+            countdowns = [x for x in engine.registered_countdowns if getattr(x, "user", None) in characters]
+            # they'd keep the world in memory, and finish on characters that aren't in the game any more
+            name = "{}.session".format(self.next_file)
+            self.next_file += 1
+            buffer = io.BytesIO()
+            SessionPickler(buffer, engine).dump((session, countdowns))
+            with open(os.path.join(self.directory, name), "wb") as f:
+                f.write(zlib.compress(buffer.getvalue()))
+            for discord_id in members:
+                del engine.known_characters[discord_id]
+                del engine.last_active[discord_id]
+                self.evicted[discord_id] = name
+            engine.registered_countdowns[:] = [x for x in engine.registered_countdowns if x not in countdowns]
+            self.total_rooms -= self.rooms.pop(world)
+        self.evictions += 1
+        self.seconds["evict"] += time.perf_counter() - start
+
+    def restore(self, engine, discord_id):
+
+        """Bring the session of discord_id back into memory, returns False if it was never moved out"""
+
+        name = self.evicted.get(discord_id)
+        if name is None:
+            return False
+        start = time.perf_counter()
+        with metrics.span("restore_session"):
+            path = os.path.join(self.directory, name)
+            with open(path, "rb") as f:
+                data = zlib.decompress(f.read())
+            session, countdowns = SessionUnpickler(io.BytesIO(data), engine).load()
+            for member, char, last_active in session:
+                engine.known_characters[member] = char
+                engine.last_active[member] = last_active
+                del self.evicted[member]
+                self.note(char)
+            engine.registered_countdowns.extend(countdowns)  # they carry on where they left off
+            os.remove(path)
+        self.restores += 1
+        self.seconds["restore"] += time.perf_counter() - start
+        return True
@@ -0,0 +1,260 @@
+"""Soak test: drive a seeded crowd of bots through Player.process_command for a long time and look for
+leaks and crashes.
+
+The bots are the loadgen ones. Some start in somebody else's world, some give up and kill
+themselves now and then, and everyone who dies starts again as a new character, so worlds are
+made and thrown away all the time. Every special_every commands one of the unique items, which
+the game never generates by itself, is queued up to appear, so that their countdowns get used. Every sample_every commands the harness records:
+
+    the size of the process (resident set, on Linux)
+    the garbage collector's counts and how many collections each generation has had
+    how much cyclic garbage a full collection finds, e.g. rooms and their neighbours
+    the number of live objects of each type
+    orphans: rooms, monsters, items and characters alive but no longer in anybody's game
+
+The first sample after warmup is the baseline. The run fails if the process grows by more than
+max_rss_growth MB after it, if a type of object has grown by more than max_growth times (among
+those with at least min_count objects), if there are more orphans of a type than there were, or if
+any command raised an exception. Exceptions don't stop the run: each one is reported once, with
+how often it happened and its traceback, and the bot starts over as a new character.
+
+    python soak.py --commands 1000000 --players 50
+    python soak.py --commands 200000 --json > soak.json"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import traceback
+
+import headless  # imports the engine modules in the right order, they can't be imported on their own
+import loadgen
+
+with headless.quiet():
+    import generators
+    import introspect
+    import things
+
+GAME_TYPES = (things.Room, things.Monster, things.Item)  # and characters, which aren't MyThings
+
+
+def rss_bytes():
+
+    """The resident set size of this process, None where it can't be found out cheaply"""
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def game_type(obj):
+
+    return isinstance(obj, GAME_TYPES) or type(obj).__name__ == "Character"
+
+
+class Soak:
+
+    def __init__(self, players=50, seed=0, join_chance=0.2, quit_chance=0.0005, special_every=1000, policy=None):
+
+        self.seeds = random.Random(seed)
+        self.join_chance = join_chance
+        self.quit_chance = quit_chance
+        self.special_every = special_every
+        self.policy = policy or dict(loadgen.DEFAULT_POLICY)
+        with headless.quiet():
+            self.engine = headless.new_engine()
+        self.bots = [loadgen.Bot(x, self.policy, random.Random(seed * 100003 + x)) for x in range(players)]
+        self.commands = 0
+        self.restarts = 0
+        self.errors = {}  # (exception type, where it was raised): [count, first traceback, first command]
+        self.samples = []
+
+    def start(self, bot):
+
+        """Start bot as a new character, in another bot's world sometimes"""
+
+        bot.__init__(bot.discord_id, bot.policy, bot.rng)  # forget everything, it's a new character
+        others = [d for d, c in self.engine.known_characters.items() if d != bot.discord_id and not c.dead]
+        join = None
+        if others and self.seeds.random() < self.join_chance:
+            join = self.seeds.choice(others)
+        try:
+            _, out = headless.new_character(self.engine, bot.discord_id, bot.name,
+                                            seed=self.seeds.getrandbits(64), join=join)
+        except Exception as e:
+            self.error(e, "<start>")
+            return
+        bot.observe(out)
+
+    def step(self, bot):
+
+        command = "suicide" if self.seeds.random() < self.quit_chance else bot.next_command()
+        self.commands += 1
+        if self.commands % self.special_every == 0:
+            self.engine.enqueue_unique_item(self.seeds.choice(generators.UNIQUE_ITEMS)())
+        try:
+            out = self.engine.process_command(command, bot.discord_id)
+        except Exception as e:
+            self.error(e, command)
+            self.restart(bot)  # whatever state it was left in, carry on with a clean one
+            return
+        bot.observe(out)
+        if out and "You have died..." in out:
+            self.restart(bot)
+
+    def restart(self, bot):
+
+        self.restarts += 1
+        self.start(bot)
+
+    def error(self, e, command):
+
+        frame = traceback.extract_tb(e.__traceback__)[-1]
+        key = (type(e).__name__, "{}:{}".format(os.path.basename(frame.filename), frame.lineno))
+        if key in self.errors:
+            self.errors[key][0] += 1
+        else:
+            self.errors[key] = [1, traceback.format_exc(), command]
+
+    def sample(self):
+
+        """Record the state of the process, after a full collection"""
+
+        start = time.perf_counter()
+        collections = [s["collections"] for s in gc.get_stats()]
+        counts = gc.get_count()
+        garbage = gc.collect()
+
+        by_type = {}
+        for obj in gc.get_objects():
+            name = type(obj).__name__
+            by_type[name] = by_type.get(name, 0) + 1
+
+        live = introspect.report(self.engine, top=0)["memory"]
+        orphans = {}
+        for obj in gc.get_objects():
+            if game_type(obj):
+                name = type(obj).__name__
+                orphans[name] = orphans.get(name, 0) + 1
+        for name, row in live.items():
+            if name in orphans:
+                orphans[name] -= row["count"]
+        queued = [x for x in self.engine.item_queue if x is not None] + list(self.engine.registered_countdowns)
+        for world in introspect.worlds(self.engine):
+            queued.extend(x for x in world.item_queue if x is not None)
+        for x in queued:  # waiting to come into the game, not orphans
+            if type(x).__name__ in orphans:
+                orphans[type(x).__name__] -= 1
+
+        self.samples.append({"commands": self.commands,
+                             "rss_bytes": rss_bytes(),
+                             "gc_counts": list(counts),
+                             "gc_collections": collections,
+                             "cyclic_garbage": garbage,
+                             "objects": by_type,
+                             "orphans": {k: v for k, v in orphans.items() if v > 0},
+                             "seconds": time.perf_counter() - start})
+
+    def run(self, commands, sample_every=10000):
+
+        with headless.quiet():
+            for bot in self.bots:
+                self.start(bot)
+        self.sample()
+        start = time.perf_counter()
+        while self.commands < commands:
+            with headless.quiet():
+                for x in range(sample_every // len(self.bots) or 1):
+                    for bot in self.bots:
+                        self.step(bot)
+            self.sample()
+        return time.perf_counter() - start
+
+    def check(self, warmup=0.1, max_rss_growth=100, max_growth=3.0, min_count=5000):
+
+        """The reasons the run failed, an empty list if it passed"""
+
+        failures = []
+        baseline = next((s for s in self.samples if s["commands"] >= warmup * self.commands), self.samples[0])
+        last = self.samples[-1]
+
+        if baseline["rss_bytes"] is not None and last["rss_bytes"] is not None:
+            growth = (last["rss_bytes"] - baseline["rss_bytes"]) / 2 ** 20
+            if growth > max_rss_growth:
+                failures.append("the process grew by {:.1f} MB after warming up".format(growth))
+
+        for name, count in last["objects"].items():
+            before = baseline["objects"].get(name, 0)
+            if count >= min_count and count > max_growth * max(before, 1):
+                failures.append("{} objects grew from {} to {}".format(name, before, count))
+
+        for name, count in last["orphans"].items():
+            if count > baseline["orphans"].get(name, 0):  # a few, like the monster templates, always are
+                failures.append("{} {} objects are alive but not in any game".format(count, name))
+
+        for (kind, where), (count, tb, command) in self.errors.items():
+            failures.append("{} at {} raised {} times, first by {!r}".format(kind, where, count, command))
+        return failures
+
+    def report(self, wall_seconds, failures):
+
+        first, last = self.samples[0], self.samples[-1]
+        return {"commands": self.commands,
+                "restarts": self.restarts,
+                "wall_seconds": wall_seconds,
+                "commands_per_second": self.commands / wall_seconds if wall_seconds else 0.0,
+                "rss_mb": [None if s["rss_bytes"] is None else round(s["rss_bytes"] / 2 ** 20, 1)
+                           for s in self.samples],
+                "cyclic_garbage": [s["cyclic_garbage"] for s in self.samples],
+                "gc_collections": last["gc_collections"],
+                "largest_growth": sorted(((name, first["objects"].get(name, 0), count)
+                                          for name, count in last["objects"].items()),
+                                         key=lambda x: x[1] - x[2])[:10],
+                "errors": [{"exception": kind, "where": where, "count": count, "first_command": command,
+                            "traceback": tb}
+                           for (kind, where), (count, tb, command) in self.errors.items()],
+                "failures": failures,
+                "passed": not failures}
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Run the game for a long time looking for leaks and crashes")
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--commands", type=int, default=1000000, help="total commands across all players")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--policy", help="bot action weights, as for loadgen.py")
+    parser.add_argument("--sample-every", type=int, default=10000, help="commands between samples")
+    parser.add_argument("--warmup", type=float, default=0.1, help="fraction of the run before the baseline sample")
+    parser.add_argument("--max-rss-growth", type=float, default=100, help="MB the process may grow after warmup")
+    parser.add_argument("--max-growth", type=float, default=3.0, help="times any type of object may grow")
+    parser.add_argument("--min-count", type=int, default=5000, help="only check types with at least this many objects")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    soak = Soak(args.players, args.seed, policy=loadgen.parse_policy(args.policy))
+    wall = soak.run(args.commands, args.sample_every)
+    failures = soak.check(args.warmup, args.max_rss_growth, args.max_growth, args.min_count)
+    report = soak.report(wall, failures)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print("{} commands in {:.1f}s ({:.0f}/s), {} restarts".format(
+            report["commands"], wall, report["commands_per_second"], report["restarts"]))
+        print("RSS MB:         {}".format(" ".join(str(x) for x in report["rss_mb"])))
+        print("cyclic garbage: {}".format(" ".join(str(x) for x in report["cyclic_garbage"])))
+        print("most grown:     {}".format(", ".join("{} {}->{}".format(*x) for x in report["largest_growth"])))
+        for error in report["errors"]:
+            print("\n{exception} at {where}, {count} times, first by {first_command!r}:\n{traceback}".format(**error))
+        print("PASSED" if report["passed"] else "FAILED:\n  " + "\n  ".join(failures))
+    return 0 if report["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Stats of characters and monsters.
+
+Each stat has an integer id, and a StatBlock holds the base values in a compact array. Everything
+that changes a stat for a while is a modifier on top of the base, in an explicit stack:
+
+    EQUIPMENT   from equipped items, removed when they're taken off
+    BUFF        from defensive abilities, removed at the end of the combat
+    TIMED       from items with a limited duration, removed when they run out
+
+Taking a modifier off always gives back exactly what was there before, so stats can't drift
+the way they could when every change was made to the stat itself. The effective values (base plus
+modifiers, within the stat's limits) are cached and only worked out again after something has
+changed, so reading a stat in combat is an array lookup.
+
+Characters and monsters read and set their stats by name as before (character.strength) through
+the Stat attributes of StatsMixin. Setting a stat sets its base value."""
+
+import array
+
+STRENGTH, ARMOUR, SPEED, HEALTH, MOXIE = range(5)
+NAMES = ("strength", "armour", "speed", "health", "moxie")
+ID = {name: i for i, name in enumerate(NAMES)}  # e.g. to look up the stat an ability uses
+LIMITS = ((0, 99), (0, 99), (0, 99), (None, None), (0, 99))  # health goes below 0 when you die
+
+EQUIPMENT, BUFF, TIMED = "equipment", "buff", "timed"  # kinds of modifier
+
+
+class StatBlock:
+
+    __slots__ = ("base", "modifiers", "effective", "dirty")
+
+    def __init__(self, strength=0, armour=0, speed=0, health=0, moxie=0):
+
+        self.base = array.array("i", (strength, armour, speed, health, moxie))
+        self.modifiers = []  # (kind, source, stat, amount), in the order they were added
+        self.effective = array.array("i", self.base)
+        self.dirty = False
+
+    def __getstate__(self):
+
+        return self.base, self.modifiers
+
+    def __setstate__(self, state):
+
+        self.base, self.modifiers = state
+        self.effective = array.array("i", self.base)
+        self.dirty = True
+
+    def __getitem__(self, stat):
+
+        """The effective value of the stat with id stat"""
+
+        if self.dirty:
+            self.recompute()
+        return self.effective[stat]
+
+    def recompute(self):
+
+        effective = array.array("i", self.base)
+        for kind, source, stat, amount in self.modifiers:
+            effective[stat] += amount
+        for stat, (low, high) in enumerate(LIMITS):
+            if low is not None and effective[stat] < low:
+                effective[stat] = low
+            elif high is not None and effective[stat] > high:
+                effective[stat] = high
+        self.effective = effective
+        self.dirty = False
+
+    def set(self, stat, value):
+
+        """Change the base value so that, with the modifiers, the stat is value"""
+
+        self.base[stat] = value - sum(m[3] for m in self.modifiers if m[2] == stat)
+        self.dirty = True
+
+    def add(self, kind, source, stat, amount):
+
+        """Put a modifier on the stack, returns it so that it can be taken off again with remove()"""
+
+        modifier = (kind, source, stat, amount)
+        self.modifiers.append(modifier)
+        self.dirty = True
+        return modifier
+
+    def remove(self, modifier):
+
+        self.modifiers.remove(modifier)
+        self.dirty = True
+
+    def remove_all(self, kind=None, source=None):
+
+        """Take off every modifier of kind, or from source, and return them"""
+
+        removed = [m for m in self.modifiers if (kind is None or m[0] == kind) and (source is None or m[1] is source)]
+        if removed:
+            self.modifiers = [m for m in self.modifiers if m not in removed]
+            self.dirty = True
+        return removed
+
+    def total(self, stat):
+
+        """How much the modifiers add to the stat"""
+
+        return sum(m[3] for m in self.modifiers if m[2] == stat)
+
+
+class Stat:
+
+    """Attribute that reads the effective value of a stat from the object's stat block, and sets
+    its base value"""
+
+    def __init__(self, stat):
+
+        self.stat = stat
+
+    def __get__(self, obj, owner=None):
+
+        if obj is None:
+            return self
+        return obj.stats[self.stat]
+
+    def __set__(self, obj, value):
+
+        obj.stats.set(self.stat, value)
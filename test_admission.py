@@ -0,0 +1,54 @@
+"""Tests for admission.py, run with python -m pytest or python -m unittest"""
+
+import asyncio
+import unittest
+
+import admission
+
+COMMANDS = {"go": "on_go", "look": "on_look"}
+
+
+class CoalesceTest(unittest.TestCase):
+
+    def run_all(self, adm, commands):
+
+        ran = []
+
+        async def send(command):
+            async def func():
+                await asyncio.sleep(0.01)
+                ran.append(command)
+                return command
+            return await adm.run(1, command, func)
+
+        async def main():
+            return await asyncio.gather(*[send(c) for c in commands])
+
+        return asyncio.run(main()), ran
+
+    def test_moves_run_when_the_queue_has_room(self):
+
+        adm = admission.Admission(COMMANDS, policy="coalesce")
+        results, ran = self.run_all(adm, ["go north", "go north", "go north"])  # the last two both wait
+        self.assertEqual(ran, ["go north", "go north", "go north"])
+        self.assertEqual([status for status, _ in results], [admission.ADMITTED, admission.QUEUED, admission.QUEUED])
+
+    def test_repeats_are_merged_only_when_the_queue_is_full(self):
+
+        adm = admission.Admission(COMMANDS, max_queued=1, policy="coalesce")
+        results, ran = self.run_all(adm, ["look", "look", "look"])
+        self.assertEqual([status for status, _ in results],
+                         [admission.ADMITTED, admission.QUEUED, admission.COALESCED])
+        self.assertEqual(ran, ["look", "look"])
+
+    def test_moves_are_never_merged(self):
+
+        adm = admission.Admission(COMMANDS, max_queued=1, policy="coalesce")
+        results, ran = self.run_all(adm, ["go north", "go north", "go north"])
+        self.assertEqual([status for status, _ in results],
+                         [admission.ADMITTED, admission.QUEUED, admission.REJECTED])
+        self.assertEqual(ran, ["go north", "go north"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""Deduplicated storage for generated text.
+
+Some of the text the generators produce comes from a tiny space of possibilities: there are only
+a few dozen door descriptions, and one corpse name and description per monster type. Passing
+that text through intern() means every copy of the same text is one shared string, and the
+duplicates are freed straight away. Interned strings are still freed once nothing uses them, so
+the store doesn't grow forever.
+
+Room, monster and item descriptions are nearly all unique, so they aren't interned: the entries
+in the intern table would cost more than the few duplicates save.
+
+Running this module explores a large world with and without interning and reports the difference:
+
+    python textstore.py --rooms 5000"""
+
+import argparse
+import sys
+
+enabled = True
+calls = 0
+duplicates = 0  # calls that found the text was already stored
+saved_bytes = 0  # size of the duplicate strings that were thrown away
+
+
+def intern(text):
+
+    global calls, duplicates, saved_bytes
+
+    if not enabled:
+        return text
+    shared = sys.intern(text)
+    calls += 1
+    if shared is not text:
+        duplicates += 1
+        saved_bytes += sys.getsizeof(text)
+    return shared
+
+
+def interned(func):
+
+    """Decorator that interns the string a function returns"""
+
+    def wrapper(*args):
+        return intern(func(*args))
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def reset_stats():
+
+    global calls, duplicates, saved_bytes
+
+    calls = duplicates = saved_bytes = 0
+
+
+def report():
+
+    return {"interned": calls,
+            "duplicates": duplicates,
+            "duplicate_ratio": duplicates / calls if calls else 0.0,
+            "saved_bytes": saved_bytes}
+
+
+def explore(rooms, seed):
+
+    """Build a world of rooms rooms, each leading on from the last, and return the bytes allocated"""
+
+    import gc
+    import tracemalloc
+    import headless  # not at the top, the engine imports this module
+    import rng
+
+    with headless.quiet():
+        import generators
+
+        rng.current = rng.new_stream(seed)
+        engine = headless.new_engine()
+        char, _ = headless.new_character(engine, 1, seed=seed)
+        world = [char.location]
+
+        gc.collect()  # so garbage from earlier doesn't get freed part way through and skew the numbers
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        for x in range(rooms):
+            room = generators.random_room(world[-1], "north")
+            world.append(room)
+            for monster in list(room.monsters):  # every monster dies leaving a corpse, like a well explored world
+                monster.die()
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - start
+        tracemalloc.stop()
+
+    return used
+
+
+def main(argv=None):
+
+    import textstore  # when run as a script this module is __main__, the engine uses the imported one
+
+    parser = argparse.ArgumentParser(description="Report the memory saved by interning generated text")
+    parser.add_argument("--rooms", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    textstore.enabled = False
+    plain = explore(args.rooms, args.seed)
+    textstore.enabled = True
+    textstore.reset_stats()
+    shared = explore(args.rooms, args.seed)
+
+    print("World of {} rooms".format(args.rooms))
+    print("without interning: {:>12,} bytes".format(plain))
+    print("with interning:    {:>12,} bytes ({:.1%} less)".format(shared, 1 - shared / plain if plain else 0))
+    for k, v in textstore.report().items():
+        print("{:<19}{}".format(k + ":", round(v, 3) if isinstance(v, float) else v))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,16 @@
-import random
+import itertools
+from collections import deque
+import journal
+import rng
+import stats
+import combat_odds
 import descriptive_strings
 from sys import exit
 import generators
 from mixins import *  # classes that add extra behaviours
-import pdb
+
+ROUTE_NODES = 20000  # rooms in all the route trees a world keeps, see World.route_tree
+
 
 class MyThing:
 
@@ -19,9 +26,55 @@ class MyThing:
     # the engine provides a reference to the character, the init method retrieves a ref
     # to the character who is interacting with the MyThing
 
+    verbs = frozenset()  # names of the on_x methods the class supports
+    class_attributes = frozenset()  # every attribute name defined on the class or its bases
+    # both are filled in by build_capabilities when the class is defined, so the command dispatcher
+    # can look them up instead of reflecting on every object
+
+    def __init_subclass__(cls, **kwargs):
+
+        super().__init_subclass__(**kwargs)
+        cls.build_capabilities()
+
+    @classmethod
+    def build_capabilities(cls):
+
+        """(Re)build the capability tables of this class and its subclasses. This runs automatically
+        when a class is defined, call it again if methods are added to a class afterwards."""
+
+        names = set()
+        for klass in cls.__mro__:
+            names.update(klass.__dict__)
+        cls.class_attributes = frozenset(names)
+        cls.verbs = frozenset(x for x in names if x.startswith("on_") and callable(getattr(cls, x)))
+
+        for sub in cls.__subclasses__():
+            sub.build_capabilities()
+
+    def can(self, verb):
+
+        """True if this object supports the command e.g. can("on_take")"""
+
+        return verb in self.verbs
+
+    def has_desc(self):
+
+        """desc can be set on the class or on the instance by the generators"""
+
+        return "desc" in self.__dict__ or "desc" in self.class_attributes
+
     def __init__(self):
 
-        self.pr = self.er.get_character_reference()
+        pass
+
+    @property
+    def pr(self):
+
+        """The character currently interacting with the MyThing. This is looked up from the engine
+        every time rather than stored, because in a shared world whoever created an object isn't
+        necessarily the one picking it up or fighting it."""
+
+        return self.er.get_character_reference()
 
     def log(self, astring, *args):
 
@@ -38,7 +91,7 @@ class MyThing:
         """If a descriptive docstring has been added, print that.
         If not, just use the name of the object's class"""
 
-        if "desc" in dir(self):
+        if self.has_desc():
             self.log(self.desc)
         else:
             self.log("You see a {}.", self.__doc__)
@@ -62,13 +115,21 @@ class MyThing:
         """All MyTthings have a simple method to get a true/false value based on
         a percentage probability"""
 
-        if random.randint(0, 100) < prob:
-            return True
-        else:
-            return False
+        return rng.current.chance(prob)
 
     def on_debug(self, *args):
-        pdb.set_trace()
+
+        """How big the player's game is, see introspect.py. This used to stop in the debugger, which
+        hung the whole server."""
+
+        import introspect  # not at the top, introspect imports this module
+
+        s = introspect.session(self.er, self.pr)
+        self.log("This game has {} rooms, {} monsters and {} items, taking about {} KB. {} playing.",
+                 s["rooms"], s["monsters"], s["items"], s["bytes"] // 1024, len(s["players"]))
+
+
+MyThing.build_capabilities()  # __init_subclass__ only runs for subclasses
 
 
 class Doodad(MyThing):
@@ -95,7 +156,7 @@ class Doodad(MyThing):
                     ("You raise your weapon above your head, but then come to your senses and stop.",),
                     ]
 
-        self.log(*random.choice(outcomes))
+        self.log(*rng.current.choice(outcomes))
 
 
 class Corpse(Doodad):
@@ -109,54 +170,310 @@ class Corpse(Doodad):
         self.log("You don't need to loot corpses, the items are dropped on the floor.")
 
 
+class World:
+
+    """All the rooms generated from one starting room, indexed by their grid coordinates. Each room
+    is one step from its neighbours, so a room can find whatever is next to it with one lookup
+    instead of the map only being known through the neighbours of each room."""
+
+    offsets = {"north": (0, -1), "south": (0, 1), "east": (1, 0), "west": (-1, 0)}
+    opposites = {"north": "south", "south": "north", "east": "west", "west": "east"}
+
+    def __init__(self, number=0):
+
+        self.number = number  # tells the rooms of different worlds apart in the journal, 0 for the dungeon
+        self.rooms = {}  # (x, y): Room
+        self.routes = {}  # (room, colours of keys held): routes from that room, see route_tree
+        self.route_nodes = 0  # rooms in all the trees in routes
+        self.bounds = None  # (min x, min y, max x, max y) that rooms can be built in, None for no limit
+        self.store = None  # a dungeon.Dungeon that rooms are loaded from when they're reached, see dungeon.py
+        self.turn = 0  # how many turns the monsters in this world have had, see roaming.py
+        self.players = {}  # Character: None, the living characters in this world, see roaming.py
+        self.open_exits = 0  # exits into unexplored space that aren't locked, see force_exit
+        self.item_queue = deque()  # the keys for this world's doors, see request_key
+
+    def add_room(self, room):
+
+        self.rooms[room.coords] = room
+
+    def request_key(self, colour):
+
+        """Have the key to a door turn up soon, in this world rather than whichever world someone
+        happens to explore next. One thing comes off the queue every move, see Character.relocate."""
+
+        # TODO: there is no guarantee the same colour key won't turn up twice
+        self.item_queue.append(None)  # the move after next
+        self.item_queue.append(generators.Key(colour))
+
+    def inside(self, coords):
+
+        if self.bounds is None:
+            return True
+        x0, y0, x1, y1 = self.bounds
+        return x0 <= coords[0] <= x1 and y0 <= coords[1] <= y1
+
+    def route_tree(self, start, keys):
+
+        """How to get to every room that can be reached from start with the keys held, as a dict of
+        room: (previous room on the way, direction from it, distance from start), found by
+        breadth-first search so that every route is a shortest one. The trees used most recently
+        are kept, up to ROUTE_NODES rooms in all, and kept up to date as the map changes."""
+
+        key = start, keys
+        tree = self.routes.pop(key, None)
+        if tree is not None:
+            self.routes[key] = tree  # the most recently used go last
+            return tree
+
+        tree = self.search(start, keys)
+        self.routes[key] = tree
+        self.route_nodes += len(tree)
+        while self.route_nodes > ROUTE_NODES and len(self.routes) > 1:
+            self.forget_routes(next(iter(self.routes)))  # the least recently used
+        return tree
+
+    def search(self, start, keys):
+
+        """The tree route_tree returns, worked out from scratch and not kept"""
+
+        tree = {start: (None, None, 0)}
+        frontier = [start]
+        distance = 0
+        while frontier:
+            distance += 1
+            later = []
+            for room in frontier:
+                for direction, nxt in room.neighbours.items():
+                    if nxt is None or nxt in tree or not self.passable(room, direction, keys):
+                        continue
+                    tree[nxt] = (room, direction, distance)
+                    later.append(nxt)
+            frontier = later
+        return tree
+
+    def forget_routes(self, key):
+
+        self.route_nodes -= len(self.routes.pop(key))
+
+    @staticmethod
+    def passable(room, direction, keys):
+
+        return direction != room.locked_door or room.lock_colour in keys
+
+    def path(self, start, goal, keys):
+
+        """The directions to take from start to reach goal, None if it can't be reached"""
+
+        tree = self.route_tree(start, keys)
+        if goal not in tree:
+            return None
+        directions = []
+        while goal is not start:
+            goal, direction, _ = tree[goal]
+            directions.append(direction)
+        directions.reverse()
+        return directions
+
+    def opened(self, room, direction):
+
+        """Bring the routes up to date after room's exit in direction has started leading to a room,
+        or been unlocked. Most of the time the room it leads to is new and goes on the end of the
+        trees that reach room. A tree where it's a short cut, or leads on to rooms the tree doesn't
+        have, is forgotten instead, and worked out again when it's next needed."""
+
+        nxt = room.neighbours.get(direction)
+        if nxt is None:
+            return
+        for key, tree in list(self.routes.items()):
+            here = tree.get(room)
+            if here is None or not self.passable(room, direction, key[1]):
+                continue
+            distance = here[2] + 1
+            there = tree.get(nxt)
+            if there is not None:
+                if there[2] > distance:
+                    self.forget_routes(key)  # a short cut
+                continue
+            for d, beyond in nxt.neighbours.items():
+                if beyond is None or beyond is room or not self.passable(nxt, d, key[1]):
+                    continue
+                if beyond not in tree or tree[beyond][2] > distance + 1:
+                    self.forget_routes(key)
+                    break
+            else:
+                tree[nxt] = (room, direction, distance)
+                self.route_nodes += 1
+
+    def closed(self, room, direction):
+
+        """Forget the routes that went through room's exit in direction, which has been locked again"""
+
+        nxt = room.neighbours.get(direction)
+        for key in [k for k, tree in self.routes.items() if (tree.get(nxt) or ())[:2] == (room, direction)]:
+            self.forget_routes(key)
+
+    def unexplored(self, room):
+
+        """How many of room's exits lead somewhere nobody has been yet, not counting a locked door"""
+
+        return sum(1 for direction, nxt in room.neighbours.items() if nxt is None and direction != room.locked_door)
+
+    def link(self, room, direction, other):
+
+        """Make room's exit in direction and other's exit back lead to each other"""
+
+        before = self.unexplored(room) + self.unexplored(other)
+        room.neighbours[direction] = other
+        other.neighbours[self.opposites[direction]] = room
+        self.open_exits += self.unexplored(room) + self.unexplored(other) - before
+        self.opened(room, direction)
+        self.opened(other, self.opposites[direction])
+
+    def force_exit(self, start):
+
+        """Open an exit into unexplored space from the nearest room to start that can have one, when
+        every other way on is locked or walled in. Returns whether there was room for one."""
+
+        for room in self.search(start, frozenset()):  # nearest first
+            for direction in self.offsets:
+                if direction not in room.neighbours and room.can_open(direction):
+                    room.neighbours[direction] = None
+                    self.open_exits += 1
+                    return True
+        return False
+
+    def room_at(self, coords, direction=None):
+
+        """The room at coords, or the room one step from there in direction, None if there isn't one"""
+
+        if direction is not None:
+            dx, dy = self.offsets[direction]
+            coords = (coords[0] + dx, coords[1] + dy)
+        room = self.rooms.get(coords)
+        if room is None and self.store is not None:
+            room = self.store.load(coords, self)  # built in advance but nobody's been there yet
+        return room
+
+    def connector(self, first, second, direction, symbol):
+
+        """How to draw the gap between two cells next to each other on the map, second is in
+        direction from first and either can be None for a cell without a room"""
+
+        if first is not None and second is not None and first.neighbours.get(direction) is second:
+            return symbol
+        if (first is not None and direction in first.neighbours) or \
+                (second is not None and self.opposites[direction] in second.neighbours):
+            return "."  # an exit nobody has been through yet
+        return " "
+
+    def minimap(self, centre, radius=3):
+
+        """A little map of the rooms within radius steps of centre, which is marked @"""
+
+        cx, cy = centre.coords
+        lines = []
+        for y in range(cy - radius, cy + radius + 1):
+            row = []
+            below = []
+            for x in range(cx - radius, cx + radius + 1):
+                room = self.rooms.get((x, y))
+                if room is None:
+                    row.append(" ")
+                else:
+                    row.append("@" if room is centre else "#")
+                row.append(self.connector(room, self.rooms.get((x + 1, y)), "east", "-"))
+                below.append(self.connector(room, self.rooms.get((x, y + 1)), "south", "|"))
+                below.append(" ")
+            lines.append("".join(row).rstrip())
+            lines.append("".join(below).rstrip())
+        return "\n".join(lines).strip("\n")
+
+
 class Room(MyThing, ContainerMixin):
 
-    def __init__(self, came_from, direction, locked_door=False, guaranteed_exit=False):
+    def __init__(self, came_from, direction, locked_door=False):
 
         super().__init__()
-        self.neighbours = {self.flip_direction(direction): came_from}
+        back = self.flip_direction(direction)
+        self.neighbours = {back: came_from}
         # hold a reference to the prev room, note that the direction is flipped so that if
         # we used the EAST exit of the previous room, that previous room is the
         # current room's WESTERN exit.
-        self.contents = []
-        self.monsters = []
+        if came_from is None:
+            self.world = World(self.er.number_world())  # the first room of a new world
+            self.coords = (0, 0)
+        else:
+            self.world = came_from.world
+            dx, dy = World.offsets[direction]
+            self.coords = (came_from.coords[0] + dx, came_from.coords[1] + dy)
+        self.world.add_room(self)
+        self.contents = {}  # ordered sets, see ContainerMixin
+        self.monsters = {}
+        self.occupants = {}  # characters currently in the room, notified when the contents change
         self.desc = descriptive_strings.generate_room_description()
         self.locked_door = None  # by default, a direction str e.g. "north" if it has one
         self.lock_colour = None
         self.locked_description = generators.random_door_description()
 
         for direct in ["north", "south", "east", "west"]:
-            if not direct == self.flip_direction(direction): #TODO aaaa
+            if not direct == back:
                 # don't re-generate a room whence we came, and keep the locked door for
                 # special generation after
-                if random.randint(0, 100) > 80:
+                if rng.current.randint(0, 100) > 80 and self.can_open(direct):
                     self.neighbours[direct] = None  # only generate when moved to
 
-        if guaranteed_exit:  # todo: better way of avoiding closed world
-            # force an exit at the first available direction, to prevent a closed world
-            for direct in ["north", "south", "east", "west"]:
-                if not direct == self.flip_direction(direction):
-                    self.neighbours[direct] = None
-                    break
-
-        if locked_door:
+        if locked_door and self.can_open(direction):
+            # only lock a door into unexplored space, there's no way to lock a door from the
+            # other side that someone might already have walked through
             locked = direction
             # the locked door is always opposite where the player came in. Makes the
             # generation logic a lot simpler, lol
             self.neighbours[locked] = None  # might have been generated anyway but no harm
             self.locked_door = locked
             colour = generators.random_key_colour()
-            self.pr.request_key(colour)
+            self.world.request_key(colour)
             self.lock_colour = colour
 
             if len(self.neighbours) < 3:
                 # always make sure a room with a locked door has at least one other exit
                 # to avoid a dead-end scenario
                 for direct in ["north", "south", "east", "west"]:
-                    if direct not in self.neighbours.keys():
+                    if direct not in self.neighbours.keys() and self.can_open(direct):
                         self.neighbours[direct] = None
                         break
 
+        self.world.open_exits += self.world.unexplored(self)
+        for direct in ["north", "south", "east", "west"]:
+            # a room that's already next door with an exit this way has to lead here, otherwise
+            # going through it would build a second room in the same place
+            other = self.world.room_at(self.coords, direct)
+            if other is None or self.flip_direction(direct) not in other.neighbours:
+                continue
+            if other is not came_from and other.locked_door == self.flip_direction(direct):
+                # the door is locked from the other side, so it has to be from this side too
+                if self.locked_door is not None:
+                    # a room only has one locked door, wall it up rather than leave it leading nowhere
+                    del other.neighbours[other.locked_door]
+                    other.locked_door = other.lock_colour = None
+                    continue
+                self.locked_door = direct
+                self.lock_colour = other.lock_colour
+                self.locked_description = other.locked_description
+            self.world.link(self, direct, other)
+
+        if self.world.open_exits == 0:
+            # every other way on is locked or walled in, and the keys might be behind them
+            self.world.force_exit(self)
+
+    def can_open(self, direction):
+
+        """Whether there can be a new exit in direction, it's only possible if it leads somewhere
+        that hasn't been built yet, inside the world's bounds"""
+
+        dx, dy = World.offsets[direction]
+        return self.world.inside((self.coords[0] + dx, self.coords[1] + dy)) and \
+            self.world.room_at(self.coords, direction) is None
+
     def get_printable_contents_list(self):
 
         if len(self.contents) > 0:
@@ -202,6 +519,10 @@ class Room(MyThing, ContainerMixin):
         """player might type 'exits' to see where he can go"""
         self.log(self.get_printable_exit_list())
 
+    def on_map(self, *args):
+
+        self.log(self.world.minimap(self))
+
     def on_go(self, *args):
 
         if args == ():
@@ -215,21 +536,105 @@ class Room(MyThing, ContainerMixin):
         try:
             dest = self.neighbours[direction]
 
-            if direction == self.locked_door:
-                if self.pr.has_key(self.lock_colour):
-                    self.log("You used a key to unlock the {} door!", self.lock_colour)
-                    self.pr.destroy_key(self.lock_colour)
-                    self.locked_door = None
-                    self.lock_colour = None
-                else:
-                    self.log("This door is locked, and needs a {} key.", self.lock_colour)
-                    return
+            if not self.unlock(direction):
+                return
 
             self.log("You travel to the {}.", direction)
             self.pr.relocate(self, dest, direction)
         except KeyError:
             self.log("There is no exit to the {}. {}", direction, self.get_printable_exit_list())
 
+    def unlock(self, direction):
+
+        """Use a key on the door in direction if it's locked, returns whether the way is open"""
+
+        if direction == self.locked_door:
+            if self.pr.has_key(self.lock_colour):
+                self.log("You used a key to unlock the {} door!", self.lock_colour)
+                self.pr.destroy_key(self.lock_colour)
+                colour = self.lock_colour
+                back = self.flip_direction(direction)
+                other = self.neighbours[direction]
+                sides = [(self, direction)]
+                if other is not None and other.locked_door == back:
+                    sides.append((other, back))  # the same door, seen from the room next door
+                for room, side in sides:
+                    room.locked_door = None
+                    room.lock_colour = None
+                    self.world.opened(room, side)
+                opened = 1 if other is None else 0  # a way into unexplored space
+                self.world.open_exits += opened
+
+                def undo():
+                    for room, side in sides:
+                        self.world.closed(room, side)
+                        room.locked_door = side
+                        room.lock_colour = colour
+                    self.world.open_exits -= opened
+                journal.record("unlock", self, direction, colour, undo=undo)
+            else:
+                self.log("This door is locked, and needs a {} key.", self.lock_colour)
+                return False
+        return True
+
+    def on_travel(self, *args):
+
+        """Walk all the way to a room that's already been explored, e.g. "travel to statue" goes to
+        the nearest room with a statue in it and "travel to start" to the first room of the world"""
+
+        where = args[0] if args else ""
+        if where.startswith("to "):
+            where = where[3:]
+        if where in World.offsets:
+            self.on_go(where)  # plain "travel north", the same as go
+            return
+        if not where:
+            self.log("Where do you want to travel to?")
+            return
+
+        keys = frozenset(self.pr.keys_in_play)
+        tree = self.world.route_tree(self, keys)
+        if where == "start":
+            goal = self.world.room_at((0, 0))
+        else:
+            goal = self.find_landmark(where, tree)
+        if goal is None or goal not in tree:
+            self.log("You don't know the way to {}.", where)
+            return
+        if goal is self:
+            self.log("You're already there.")
+            return
+
+        directions = self.world.path(self, goal, keys)
+        self.log("You travel {}.", ", ".join(directions))
+        for i, direction in enumerate(directions):
+            room = self.pr.location
+            if not room.unlock(direction):
+                break
+            last = i == len(directions) - 1
+            self.pr.relocate(room, room.neighbours[direction], direction, look=last)
+            if not last and self.pr.monsters_in_play:
+                self.log("You can't go any further with the {} here!", next(iter(self.pr.monsters_in_play)).__doc__)
+                self.pr.location.on_look()
+                break
+
+    def find_landmark(self, name, tree):
+
+        """The nearest room in tree with something called name in it"""
+
+        for exact in (True, False):
+            nearest = None
+            for room, (_, _, distance) in tree.items():
+                if nearest is not None and distance >= tree[nearest][2]:
+                    continue
+                for thing in itertools.chain(room.contents, room.monsters):
+                    if (thing.__doc__ == name) if exact else (name in thing.__doc__):
+                        nearest = room
+                        break
+            if nearest is not None:
+                return nearest
+        return None
+
     def flip_direction(self, direction):
 
         """north -> south, etc"""
@@ -243,20 +648,62 @@ class Room(MyThing, ContainerMixin):
         elif direction == "west":
             return "east"
 
+    def add_item(self, item):
+
+        super().add_item(item)
+        for char in self.occupants:
+            char.room_item_added(item)
+
+    def remove_item(self, item):
+
+        super().remove_item(item)
+        for char in self.occupants:
+            char.room_item_removed(item)
+
     def add_monster(self, monster):
 
-        self.monsters.append(monster)
+        self.monsters[monster] = None
         monster.location = self
+        for char in self.occupants:
+            char.room_monster_added(monster)
+        journal.record("add_monster", self, monster, undo=lambda: self.remove_monster(monster))
 
     def remove_monster(self, monster):
 
-        self.monsters.remove(monster)
+        del self.monsters[monster]
+        for char in self.occupants:
+            char.room_monster_removed(monster)
+        journal.record("remove_monster", self, monster, undo=lambda: self.add_monster(monster))
+
+    def broadcast(self, message, *args, exclude=None):
+
+        """Tell everyone in the room (apart from exclude, usually whoever caused it) that something
+        happened. Only the room's own occupants are visited, not every session in the game."""
+
+        if not self.occupants:
+            return
+        message = message.format(*args)
+        for char in self.occupants:
+            if char is not exclude:
+                char.notify(message)
+
+    def add_occupant(self, char):
+
+        """Subscribe a character to changes in this room's contents and monsters"""
+
+        self.occupants[char] = None
+
+    def remove_occupant(self, char):
+
+        self.occupants.pop(char, None)
 
 
 class Item(MyThing):
 
     """An item that can be added to inventory, dropped, etc, like a key, weapon or macguffin"""
 
+    weight = 1  # characters can only carry so much, see Character.carry_weight
+
     def __init__(self):
 
         super().__init__()
@@ -264,15 +711,18 @@ class Item(MyThing):
         # a reference to where the item is, so it can delete itself from a room's contents
         # this isn't defined in the init method but is set when a room runs the add_item command
 
-    def on_take(self, *args):
+    def on_take(self, *args, announce=True):
+
+        """Returns whether it was picked up"""
 
         if self.held_by_player():
             self.log("You already have this.")
-            return
-        else:
-            self.pr.add_to_inventory(self)
-            self.location.remove_item(self)
-            self.location = "PLAYER"
+            return False
+        if not self.pr.add_to_inventory(self, announce):
+            return False  # not enough room
+        self.location.remove_item(self)
+        self.location = "PLAYER"
+        return True
 
     def held_by_player(self):
 
@@ -319,7 +769,7 @@ class Container(MyThing, ContainerMixin):
     def __init__(self):
 
         super().__init__()
-        self.contents = []
+        self.contents = {}
         self.opened = False
         self.locked = False
         self.location = None
@@ -347,10 +797,15 @@ class Container(MyThing, ContainerMixin):
             self.add_item(x)
 
 
-class Monster(MyThing):
+class Monster(StatsMixin, MyThing):
 
     """Generic monster"""
 
+    hunt_chance = 30  # chance each turn of heading for a player nearby, see roaming.py
+    wander_chance = 10  # or otherwise of wandering off somewhere
+    hunting = False
+    turn = None  # the world turn it last moved on, None if it never has
+
     def __init__(self, name=None, desc=None, pronoun="it", pos_pronoun="its"):
 
         """All these values are set post-instantiation by the monster generator"""
@@ -369,12 +824,11 @@ class Monster(MyThing):
         # stats are overwritten by specific monsters inheriting this template but these
         # are some default values
         self.weapon = Claws()
-        self.strength = random.randint(4, 12)  # some generic weak stats
-        self.armour = 0
-        self.speed = random.randint(4, 12)
-        self.health = random.randint(20, 50)
-        self.moxie = random.randint(4, 12)
-        self.buffs = {x: 0 for x in ("strength", "armour", "speed", "health", "moxie")}
+        strength = rng.current.randint(4, 12)  # some generic weak stats
+        speed = rng.current.randint(4, 12)
+        health = rng.current.randint(20, 50)
+        moxie = rng.current.randint(4, 12)
+        self.stats = stats.StatBlock(strength=strength, armour=0, speed=speed, health=health, moxie=moxie)
         self.abilities = [generators.random_ability("attack", weak=True) for x in range(5)]
         # just some random attack
         # monster-specific stuff starts here
@@ -389,8 +843,16 @@ class Monster(MyThing):
 
     def on_attack(self, *args):
 
+        self.location.broadcast("{} attacks the {}!", self.pr.name, self.__doc__, exclude=self.pr)
         self.er.run_combat(self.pr, self)  # get the engine to start a combat between player and self
 
+    def on_consider(self, *args):
+
+        odds = combat_odds.predict(self.pr, self)
+        self.log("You size up the {}. In a fight you'd have a {:.0%} chance of winning and a {:.0%} "
+                 "chance of dying, and {:.0%} of the time you'd both still be standing at the end.",
+                 self.__doc__, odds.win, odds.lose, odds.timeout)
+
     def attack_player(self):
 
         self.log("\nThe {} attacks you!\n", self.__doc__)  # extra newlines to make the message stand out
@@ -408,16 +870,16 @@ class Monster(MyThing):
 
     def die(self):
 
-        self.log(descriptive_strings.random_death_string(self.__doc__))
-        self.location.remove_monster(self)
-        self.pr.monsters_in_play.remove(self)
-        self.pr.make_item_invisible(self)
+        journal.record("monster_death", self, self.location)
+        death_string = descriptive_strings.random_death_string(self.__doc__)
+        self.log(death_string)
+        self.location.broadcast(death_string, exclude=self.pr)
+        self.location.remove_monster(self)  # the room tells the characters in it to forget the monster
 
         corpse = generators.get_corpse(self.__doc__)
-        self.location.add_item(corpse)
-        self.pr.make_item_visible(corpse)
+        self.location.add_item(corpse)  # and to see the corpse
 
-        if random.choice((0, 1)) == 1:
+        if rng.current.choice((0, 1)) == 1:
             loot = generators.random_item()
             self.drop_loot(loot)
 
@@ -427,8 +889,8 @@ class Monster(MyThing):
     def drop_loot(self, loot):
 
         self.location.add_item(loot)
-        self.pr.make_item_visible(loot)
         self.log("The {} has dropped some loot: {}!", self.__doc__, loot.__doc__)
+        self.location.broadcast("The {} has dropped some loot: {}!", self.__doc__, loot.__doc__, exclude=self.pr)
 
     def decrement_health(self):
 
@@ -450,14 +912,6 @@ class Monster(MyThing):
             self.log("The {} chases you!", self.__doc__)
             self.relocate(new_location)
 
-    def unbuff(self):
-
-        """combat engine expects combatants to have this method, although really it's only
-        useful to remove temp stat buffs from players, it's invoked regardless though."""
-
-        pass
-
-
 class DelayedFunction(LimitedDurationMixin, MyThing):
 
     duration = 2  # by default, it happens next turn
@@ -470,7 +924,7 @@ class DelayedFunction(LimitedDurationMixin, MyThing):
         super().__init__()
         self.func = func
         self.fnargs = args
-        self.pr.registered_countdowns.append(self)
+        self.start_countdown()
 
     def on_countdown_finished(self, *args):
 
@@ -480,6 +934,7 @@ class DelayedFunction(LimitedDurationMixin, MyThing):
 class Weapon(EquippableMixin, Item):
 
     damage = 10
+    weight = 3
     slot = "right hand"
     """generic weapon"""
 
@@ -487,12 +942,15 @@ class Weapon(EquippableMixin, Item):
 
         if self.pr.weapon is None:
             self.pr.weapon = self
+            journal.changed(self.pr, "weapon", None)
         else:
             self.log("You are already holding {}", self.pr.weapon.__doc__)
 
     def on_deequip_logic(self):
 
+        previous = self.pr.weapon
         self.pr.weapon = None
+        journal.changed(self.pr, "weapon", previous)
 
     def on_look(self, *args):
 
@@ -500,7 +958,7 @@ class Weapon(EquippableMixin, Item):
         in the description that mentions the weapon's damage"""
 
         out = ""
-        if "desc" in dir(self):
+        if self.has_desc():
             out += self.desc
         else:
             out += self.__doc__